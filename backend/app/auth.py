@@ -1,28 +1,61 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import jwt, JWTError
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import Any, Dict, Optional
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+from . import config
+
+@lru_cache(maxsize=None)
+def pwd_context():
+    # 按需导入：passlib 导入约 20ms，启动时用不到；就绪后的 warmup 会提前调一次
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
+# 密码哈希很吃 CPU：放到专用的小线程池里跑，一波登录请求只会在这里排队，
+# 不会占满 Starlette 的默认线程池、拖慢其他接口
+_hash_pool = ThreadPoolExecutor(max_workers=max(1, config.AUTH_HASH_WORKERS), thread_name_prefix="pwhash")
 
 SECRET_KEY = "CHANGE_ME"  # 后面用 .env 覆盖
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 def verify_password(password: str, password_hash: str) -> bool:
-    return pwd_context.verify(password, password_hash)
+    return pwd_context().verify(password, password_hash)
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, hash_password, password)
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, verify_password, password, password_hash)
 
-def create_access_token(subject: str, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES):
+def create_access_token(
+    subject: str,
+    expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES,
+    user_id: Optional[int] = None,
+    token_version: int = 0,
+):
     expire = datetime.utcnow() + timedelta(minutes=expires_minutes)
     payload = {"sub": subject, "exp": expire}
+    if user_id is not None:
+        # 带上 uid 和版本号，鉴权时可以不查库
+        payload.update({"uid": user_id, "ver": token_version})
+    from jose import jwt  # 按需导入：jose 连带 cryptography，启动时不需要
+
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
-def decode_token(token: str) -> Optional[str]:
+def decode_payload(token: str) -> Optional[Dict[str, Any]]:
+    from jose import JWTError, jwt
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
-        return None
\ No newline at end of file
+        return None
+
+def decode_token(token: str) -> Optional[str]:
+    payload = decode_payload(token)
+    return payload.get("sub") if payload else None
\ No newline at end of file
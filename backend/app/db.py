@@ -1,11 +1,145 @@
+import hashlib
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from .services import metrics
+
+DATABASE_URL = config.DATABASE_URL
+
+def _is_sqlite(url) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def _is_memory_sqlite(url) -> bool:
+    # sqlite://、sqlite:///:memory:、file:...?mode=memory：SQLAlchemy 用 SingletonThreadPool/StaticPool，不是 QueuePool
+    u = make_url(url)
+    db = u.database or ""
+    return _is_sqlite(u) and (db in ("", ":memory:") or "mode=memory" in db or u.query.get("mode") == "memory")
+
+def _async_url(url: str):
+    # 同步 URL 换成对应的异步驱动：sqlite → aiosqlite，postgresql → asyncpg
+    if config.ASYNC_DATABASE_URL:
+        return make_url(config.ASYNC_DATABASE_URL)
+    u = make_url(url)
+    backend = u.get_backend_name()
+    if backend == "sqlite":
+        return u.set(drivername="sqlite+aiosqlite")
+    if backend == "postgresql":
+        return u.set(drivername="postgresql+asyncpg")
+    return u
+
+def _engine_kwargs(url) -> dict:
+    kwargs = dict(echo=config.DB_ECHO)
+    if not _is_memory_sqlite(url):
+        # 连接池参数只有 QueuePool 认，内存库的池收到 max_overflow/pool_timeout 会直接 TypeError
+        kwargs.update(pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW, pool_timeout=config.DB_POOL_TIMEOUT)
+    if _is_sqlite(url):
+        # sqlite3 的 timeout 单位是秒
+        kwargs["connect_args"] = {"check_same_thread": False, "timeout": config.SQLITE_BUSY_TIMEOUT / 1000}
+    else:
+        kwargs["pool_pre_ping"] = True
+    return kwargs
+
+def _sqlite_pragmas(dbapi_conn, connection_record):
+    # WAL：读写互不阻塞；synchronous=NORMAL 在 WAL 下足够安全且少很多 fsync
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT)}")
+    cur.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.close()
+
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL))
+ASYNC_URL = _async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_URL, **_engine_kwargs(ASYNC_URL))
 
-DATABASE_URL = "sqlite:///./citecheck.db"
-engine = create_engine(DATABASE_URL, echo=False, connect_args={"check_same_thread": False})
+if _is_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
 
-def init_db():
+# SQL 次数/耗时计入当前请求（见 services/metrics.py）
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+
+def _add_missing_columns():
+    # 轻量迁移：老库缺的列用 ALTER TABLE 补上（新增的列都应是可空的）
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in existing:
+                    col_type = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {col_type}'))
+
+def _rebuild_changed_primary_keys():
+    # 主键变了的表（比如 referencetombstone 从 ref_id 改成 (user_id, ref_id)）ALTER TABLE 改不了：
+    # 旧表改名、按新定义建表、整表拷过去、删掉旧表。旧表的索引先删，索引名在库里是全局的
+    insp = inspect(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        old_pk = insp.get_pk_constraint(table.name).get("constrained_columns") or []
+        if sorted(old_pk) == sorted(c.name for c in table.primary_key.columns):
+            continue
+        old_name = f"{table.name}__old"
+        cols = ", ".join(f'"{c.name}"' for c in table.columns)
+        with engine.begin() as conn:
+            for index in insp.get_indexes(table.name):
+                conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+            conn.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"'))
+            table.create(conn)
+            conn.execute(text(f'INSERT INTO "{table.name}" ({cols}) SELECT {cols} FROM "{old_name}"'))
+            conn.execute(text(f'DROP TABLE "{old_name}"'))
+
+def schema_fingerprint() -> str:
+    # 表、列（类型/可空/主键）、索引都算进去：模型一改指纹就变，下次启动会重新走建表和迁移
+    parts = []
+    for table in SQLModel.metadata.sorted_tables:
+        cols = ",".join(f"{c.name}:{c.type}:{c.nullable}:{c.primary_key}" for c in table.columns)
+        idx = ",".join(sorted(i.name for i in table.indexes))
+        parts.append(f"{table.name}({cols})[{idx}]")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+def _stored_fingerprint():
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT value FROM appmeta WHERE key = 'schema'")).scalar()
+    except Exception:
+        # 新库或老库还没有 appmeta 表
+        return None
+
+def init_db() -> bool:
+    # 返回是否真的执行了 DDL；schema 已是最新时只查一次 appmeta
+    from .models import AppMeta
+
+    fingerprint = schema_fingerprint()
+    if _stored_fingerprint() == fingerprint:
+        return False
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    _rebuild_changed_primary_keys()
+    # create_all 不会给已存在的表补索引，老库在这里补上
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with Session(engine) as session:
+        session.merge(AppMeta(key="schema", value=fingerprint))
+        session.commit()
+    return True
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def get_async_session():
+    # expire_on_commit=False：commit 后还能直接读对象属性，不会触发异步上下文外的懒加载
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
@@ -1,22 +1,73 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlmodel import Session, select
-from .db import get_session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .db import get_async_session
 from .models import User
-from .auth import decode_token
+from .auth import decode_payload
+from . import config
 
 security = HTTPBearer()
 
-def get_current_user(
+# 已验证用户的短 TTL 缓存：uid -> (过期时间, User)，命中时鉴权不查库。
+# 改密码会调用 invalidate_principal()；多进程部署时其他进程最多晚 AUTH_CACHE_TTL 秒感知。
+_principals: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+
+def _cached_principal(uid: int) -> Optional[User]:
+    item = _principals.get(uid)
+    if item is None:
+        return None
+    expires, user = item
+    if expires <= time.monotonic():
+        _principals.pop(uid, None)
+        return None
+    _principals.move_to_end(uid)
+    return user
+
+def _remember_principal(user: User) -> None:
+    _principals[user.id] = (time.monotonic() + config.AUTH_CACHE_TTL, user)
+    _principals.move_to_end(user.id)
+    while len(_principals) > config.AUTH_CACHE_SIZE:
+        _principals.popitem(last=False)
+
+def invalidate_principal(uid: int) -> None:
+    _principals.pop(uid, None)
+
+async def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(security),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ) -> User:
     token = creds.credentials
-    sub = decode_token(token)
-    if not sub:
+    payload = decode_payload(token)
+    if not payload or not payload.get("sub"):
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = session.exec(select(User).where(User.email == sub)).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    return user
\ No newline at end of file
+    uid = payload.get("uid")
+    if uid is None:
+        # 旧 token 只有 email：按 email 查库
+        user = (await session.exec(select(User).where(User.email == payload["sub"]))).first()
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        # 改过密码后，旧格式的 token 也一并作废
+        if user.token_version:
+            raise HTTPException(status_code=401, detail="Token revoked")
+        return user
+
+    user = _cached_principal(uid)
+    if user is None:
+        user = await session.get(User, uid)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        _remember_principal(user)
+    if (user.token_version or 0) != payload.get("ver", 0):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return user
+
+def get_admin_user(user: User = Depends(get_current_user)) -> User:
+    if user.email not in config.ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin only")
+    return user
@@ -1,20 +1,76 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .db import init_db
 from .routers.auth_routes import router as auth_router
 from .routers.reference_routes import router as ref_router
 from .routers.metadata_routes import router as meta_router
-from sqlmodel import SQLModel
 from .db import engine
 from .routers.doi_routes import router as doi_router
+from .routers.enrich_routes import router as enrich_router
+from .routers.check_routes import router as check_router
+from .services import doi_resolver, http_client, metrics, startup, upstream
+from .services.responses import CompressionMiddleware, JSONBody
+from .services.doi_cache import doi_cache
+from .services.source_stats import source_stats
+from .services.formatter import rerender_stale
 
 
+def _import_heavy():
+    # 重依赖在后台线程里预先导入，第一个 DOI/登录请求不用再等
+    import httpx  # noqa: F401
+    from jose import jwt  # noqa: F401
+    from . import auth
 
+    auth.pwd_context()
 
-app = FastAPI(title="CiteCheck API")
+async def _warmup():
+    with startup.phase("warmup"):
+        # 后台补全的协程池：处理写入时排队的 "有 DOI 缺字段" 任务；放到就绪之后，排着的任务在表里不会丢
+        from .services.enrichment import worker as enrich_worker
+
+        enrich_worker.start()
+        await asyncio.to_thread(_import_heavy)
+        http_client.get_client()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # schema 指纹没变时 init_db 只查一次 appmeta，不执行 DDL
+    with startup.phase("init_db"):
+        init_db()
+    # SQLite 下建 FTS5 全文索引（不支持时检索退回 LIKE）
+    with startup.phase("fts"):
+        from .services.search import ensure_fts
+
+        ensure_fts(engine)
+    # 前端产物清单：扫描一次 dist，之后静态请求不再查文件系统
+    with startup.phase("static"):
+        static.load()
+    # 上游 HTTP 客户端和格式化重渲染都在就绪之后后台进行，不阻塞启动
+    warmup = asyncio.create_task(_warmup())
+    # 重渲染在线程里跑，task.cancel() 停不了线程，退出时靠 rerender_stop 让它在当前批次后返回
+    rerender_stop = threading.Event()
+    rerender = asyncio.create_task(asyncio.to_thread(rerender_stale, stop=rerender_stop))
+    yield
+    warmup.cancel()
+    rerender_stop.set()
+    rerender.cancel()
+    from .services.enrichment import worker as enrich_worker  # 没启动过时 stop() 什么也不做
+
+    await enrich_worker.stop()
+    await http_client.close()
+    # 来源路由统计落盘
+    await asyncio.to_thread(source_stats.flush)
+
+
+# 默认响应类：orjson 序列化（没装退回标准库 json）
+app = FastAPI(title="CiteCheck API", lifespan=lifespan, default_response_class=JSONBody)
 app.include_router(doi_router)
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import traceback
 
 
@@ -38,23 +94,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Library-Rev", "ETag"],
 )
 
-@app.on_event("startup")
-def on_startup():
-    init_db()
-    SQLModel.metadata.create_all(engine)
+# 压缩在 CORS 外面；最后加的中间件在最外层：计时覆盖压缩、CORS 和路由
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(auth_router)
 app.include_router(ref_router)
 app.include_router(meta_router)
+app.include_router(enrich_router)
+app.include_router(check_router)
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    # sources：各上游来源的熔断器状态（closed / open / half_open）
+    return {"ok": True, "sources": {name: b["state"] for name, b in upstream.breaker_states().items()}}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    stats = doi_cache.stats()
+    counters = {f"citecheck_doi_cache_{k}_total": v for k, v in stats.items() if k not in ("memory_size", "hit_rate")}
+    counters.update({f"citecheck_resolver_{k}_total": v for k, v in doi_resolver.counters.items()})
+    from .services.enrichment import worker as enrich_worker
+
+    counters.update({f"citecheck_enrich_{k}_total": v for k, v in enrich_worker.counters.items()})
+    gauges = {"citecheck_doi_cache_memory_entries": stats["memory_size"], "citecheck_doi_cache_hit_ratio": stats["hit_rate"]}
+    gauges.update({f"citecheck_startup_{k}_seconds": v for k, v in startup.timings.items()})
+    return PlainTextResponse(metrics.render(counters, gauges, upstream.metrics_lines()), media_type="text/plain; version=0.0.4")
 from pathlib import Path
-from fastapi.responses import FileResponse
 from fastapi import HTTPException
+from .services.static_files import StaticManifest
 import sys
 
 def _base_dir() -> Path:
@@ -66,20 +137,26 @@ def _base_dir() -> Path:
 
 DIST_DIR = _base_dir() / "frontend" / "dist"
 
-@app.get("/")
-def spa_root():
-    index = DIST_DIR / "index.html"
-    if index.exists():
-        return FileResponse(index)
+static = StaticManifest(DIST_DIR)
+
+def _frontend_missing():
     raise HTTPException(status_code=404, detail="Frontend not built. Run `npm run build` in frontend.")
 
+@app.get("/")
+async def spa_root(request: Request):
+    if static.index is None:
+        _frontend_missing()
+    return static.response(request, static.index)
+
 @app.get("/{full_path:path}")
-def spa_fallback(full_path: str):
-    # 让 /login /register /assets/... 都能正确返回
-    target = DIST_DIR / full_path
-    if target.exists() and target.is_file():
-        return FileResponse(target)
-    index = DIST_DIR / "index.html"
-    if index.exists():
-        return FileResponse(index)
-    raise HTTPException(status_code=404, detail="Frontend not built. Run `npm run build` in frontend.")
\ No newline at end of file
+async def spa_fallback(full_path: str, request: Request):
+    # 让 /login /register /assets/... 都能正确返回；只查启动时建好的清单
+    entry = static.lookup(full_path)
+    if entry is not None:
+        return static.response(request, entry)
+    # 缺失的静态资源直接 404，别把 index.html 当 JS 发回去
+    if full_path.startswith("assets/"):
+        raise HTTPException(status_code=404, detail="Not found")
+    if static.index is None:
+        _frontend_missing()
+    return static.response(request, static.index)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from typing import Optional, List
 from datetime import datetime
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 from pydantic import BaseModel
 
@@ -8,8 +9,18 @@ class User(SQLModel, table=True):
     email: str = Field(index=True, unique=True)
     password_hash: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # 改密码时加一，旧 token 里的版本号对不上就失效（None 视为 0）
+    token_version: Optional[int] = None
+    # 文献库版本号：该用户的文献每写入一次加一（None 视为 0），见 services/changes.py
+    library_rev: Optional[int] = None
 
 class Reference(SQLModel, table=True):
+    # 列表按 (user_id, id) 做 keyset 分页；增量同步按 (user_id, rev) 取变更
+    __table_args__ = (
+        Index("ix_reference_user_id_id", "user_id", "id"),
+        Index("ix_reference_user_id_rev", "user_id", "rev"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(index=True)
 
@@ -35,6 +46,64 @@ class Reference(SQLModel, table=True):
     accessed_at: Optional[str] = None  # "2026-01-29"
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # 最后一次写入时的文献库版本号和时间（老数据为 None）
+    rev: Optional[int] = None
+    updated_at: Optional[datetime] = None
+
+    # 写入时算好的 GB/T 7714 串和缺失字段（逗号分隔），见 services/formatter.py
+    gbt7714_cache: Optional[str] = None
+    missing_cache: Optional[str] = None
+    format_version: Optional[int] = None
+
+class ReferenceTombstone(SQLModel, table=True):
+    # 删除记录：增量同步时告诉客户端哪些条目已经没了。
+    # 主键带上 user_id：SQLite 的 id 会复用（删掉最大的 id 后新行又拿到它），别的用户删同一个 id 不能覆盖这里的记录
+    __table_args__ = (Index("ix_referencetombstone_user_id_rev", "user_id", "rev"),)
+
+    user_id: int = Field(primary_key=True)
+    ref_id: int = Field(primary_key=True)
+    rev: int
+    deleted_at: datetime = Field(default_factory=datetime.utcnow)
+
+class DoiCache(SQLModel, table=True):
+    # DOI 元数据缓存：kind 区分不同接口的结果（resolve = 多来源解析，crossref = Crossref 完整字段）
+    doi: str = Field(primary_key=True)
+    kind: str = Field(primary_key=True)
+    ok: bool = True  # False 表示负缓存（各来源都查不到）
+    payload: str  # JSON
+    expires_at: datetime = Field(index=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SourceStat(SQLModel, table=True):
+    # DOI 前缀 × 来源的滚动统计，见 services/source_stats.py
+    prefix: str = Field(primary_key=True)
+    source: str = Field(primary_key=True)
+    attempts: float = 0.0  # 指数衰减后的有效样本数（只算明确答复的）
+    hits: float = 0.0
+    errors: int = 0
+    latencies: str = "[]"  # 最近若干次的耗时（秒），JSON
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class EnrichJob(SQLModel, table=True):
+    # 后台补全任务：有 DOI 但缺字段的文献，按 DOI 查元数据补上空着的列，见 services/enrichment.py
+    __table_args__ = (Index("ix_enrichjob_status_run_after", "status", "run_after"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(index=True)
+    ref_id: int = Field(index=True)
+    doi: str
+    status: str = "queued"  # queued / running / done / failed / skipped
+    attempts: int = 0
+    filled: Optional[str] = None  # 补上的字段，逗号分隔
+    error: Optional[str] = None
+    run_after: datetime = Field(default_factory=datetime.utcnow)  # 重试退避：到这个时间之后才会被取走
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+class AppMeta(SQLModel, table=True):
+    # 键值表：目前只存 schema 指纹，启动时指纹一致就跳过建表/迁移
+    key: str = Field(primary_key=True)
+    value: str
 
 class ReferenceCreate(BaseModel):
     ref_type: str = "journal"
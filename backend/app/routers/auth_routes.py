@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import IntegrityError, OperationalError
-import traceback
 
-from ..db import get_session
+from ..db import get_async_session
+from ..deps import get_current_user, invalidate_principal
 from ..models import User
-from ..auth import hash_password, verify_password, create_access_token
+from ..auth import hash_password_async, verify_password_async, create_access_token
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -18,30 +19,53 @@ class LoginIn(BaseModel):
     email: str
     password: str
 
+class ChangePasswordIn(BaseModel):
+    old_password: str
+    new_password: str
+
+def _token_for(user: User) -> dict:
+    token = create_access_token(subject=user.email, user_id=user.id, token_version=user.token_version or 0)
+    return {"access_token": token, "token_type": "bearer"}
+
 @router.post("/register")
-def register(data: RegisterIn, session: Session = Depends(get_session)):
-    existing = session.exec(select(User).where(User.email == data.email)).first()
+async def register(data: RegisterIn, session: AsyncSession = Depends(get_async_session)):
+    existing = (await session.exec(select(User).where(User.email == data.email))).first()
     if existing:
         raise HTTPException(status_code=409, detail="Email already registered")
 
-    user = User(email=data.email, password_hash=hash_password(data.password))
+    user = User(email=data.email, password_hash=await hash_password_async(data.password), token_version=0)
     session.add(user)
 
     try:
-        session.commit()
-        session.refresh(user)
+        await session.commit()
         return {"ok": True}
     except IntegrityError:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=409, detail="Email already registered")
     except OperationalError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
 
 @router.post("/login")
-def login(data: LoginIn, session: Session = Depends(get_session)):
-    user = session.exec(select(User).where(User.email == data.email)).first()
-    if not user or not verify_password(data.password, user.password_hash):
+async def login(data: LoginIn, session: AsyncSession = Depends(get_async_session)):
+    user = (await session.exec(select(User).where(User.email == data.email))).first()
+    if not user or not await verify_password_async(data.password, user.password_hash):
         raise HTTPException(status_code=400, detail="Invalid credentials")
-    token = create_access_token(subject=user.email)
-    return {"access_token": token, "token_type": "bearer"}
+    return _token_for(user)
+
+@router.post("/password")
+async def change_password(
+    data: ChangePasswordIn,
+    session: AsyncSession = Depends(get_async_session),
+    current: User = Depends(get_current_user),
+):
+    user = await session.get(User, current.id)
+    if not user or not await verify_password_async(data.old_password, user.password_hash):
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    user.password_hash = await hash_password_async(data.new_password)
+    # 版本号加一：之前签发的 token 全部失效
+    user.token_version = (user.token_version or 0) + 1
+    session.add(user)
+    await session.commit()
+    invalidate_principal(user.id)
+    return _token_for(user)
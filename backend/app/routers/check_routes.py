@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .. import config
+from ..db import get_async_session
+from ..deps import get_current_user
+from ..models import Reference, User
+
+router = APIRouter(prefix="/check", tags=["check"])
+
+@router.post("")
+async def check_manuscript(
+    file: Optional[UploadFile] = File(None, description=".docx 或纯文本的参考文献表"),
+    text: Optional[str] = Form(None, description="直接粘贴的参考文献表"),
+    resolve: bool = Query(True, description="库里没有的条目是否按 DOI 查上游"),
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    # 按需导入：核查不是常用功能，不拖慢冷启动
+    from ..services.manuscript import LibraryIndex, check_entries, docx_paragraphs, split_entries
+
+    if file is not None:
+        data = await file.read(config.CHECK_MAX_BYTES + 1)
+        if len(data) > config.CHECK_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"File too large (max {config.CHECK_MAX_BYTES} bytes)")
+        if (file.filename or "").lower().endswith(".docx") or data[:2] == b"PK":
+            try:
+                lines = docx_paragraphs(data)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Unreadable .docx file")
+        else:
+            lines = data.decode("utf-8-sig", errors="replace").splitlines()
+    elif text:
+        lines = text.splitlines()
+    else:
+        raise HTTPException(status_code=400, detail="Provide a file or text")
+
+    entries = split_entries(lines)
+    if not entries:
+        raise HTTPException(status_code=400, detail="No reference entries found")
+    if len(entries) > config.CHECK_MAX_ENTRIES:
+        raise HTTPException(status_code=413, detail=f"Too many entries (max {config.CHECK_MAX_ENTRIES})")
+
+    # 文献库在返回 StreamingResponse 之前读完：开始流式输出时依赖注入的 session 可能已经关闭
+    refs = (await session.exec(select(Reference).where(Reference.user_id == user.id))).all()
+    library = await asyncio.to_thread(LibraryIndex, refs)
+
+    # NDJSON：每核查完一条就推送一行（库内匹配的立即出，查上游的谁先完成谁先出），最后一行是汇总
+    async def stream():
+        t0 = time.perf_counter()
+        counts: Counter = Counter()
+        async for verdict in check_entries(entries, library, config.BATCH_CONCURRENCY, resolve=resolve):
+            counts[verdict["status"]] += 1
+            yield json.dumps(verdict, ensure_ascii=False) + "\n"
+        summary = {"done": True, "entries": len(entries), **counts, "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)}
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,81 +1,74 @@
-from fastapi import APIRouter, HTTPException
-import httpx
+import json
+from typing import List, Optional
 
-router = APIRouter(prefix="/doi", tags=["doi"])
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from .. import config
+from ..deps import get_admin_user, get_current_user
+from ..models import User
+from ..services.doi_cache import doi_cache
+from ..services import doi_resolver, upstream
+from ..services.doi_resolver import normalize_doi, resolve_doi_batch, resolve_doi_multi
+from ..services.source_stats import source_stats
 
-def normalize(doi: str) -> str:
-    doi = doi.strip()
-    doi = doi.replace("https://doi.org/", "").replace("http://doi.org/", "")
-    doi = doi.replace("doi:", "").strip()
-    return doi
+router = APIRouter(prefix="/doi", tags=["doi"])
 
-async def fetch_json(url: str, headers=None):
-    async with httpx.AsyncClient(timeout=10, headers={"User-Agent":"CiteCheck/1.0"}) as client:
-        r = await client.get(url, headers=headers)
-        if r.status_code != 200:
-            return None
-        return r.json()
+class BatchResolveIn(BaseModel):
+    dois: List[str]
+    concurrency: Optional[int] = None
 
 @router.get("/resolve")
 async def resolve(doi: str):
-    d = normalize(doi)
+    d = normalize_doi(doi)
     if not d.startswith("10."):
         raise HTTPException(400, "Invalid DOI")
 
-    # 1) Crossref
-    data = await fetch_json(f"https://api.crossref.org/works/{d}")
-    if data:
-        msg = data.get("message", {})
-        title = (msg.get("title") or [""])[0]
-        authors = ";".join([
-            " ".join([a.get("family",""), a.get("given","")]).strip()
-            for a in (msg.get("author") or [])
-        ]).strip(";")
-        year = None
-        for k in ["published-print","published-online","created","issued"]:
-            parts = (msg.get(k) or {}).get("date-parts") or []
-            if parts and parts[0]:
-                year = parts[0][0]; break
-        return {"ok": True, "source":"crossref", "doi": d, "title": title, "authors": authors, "year": year}
-
-    # 2) OpenAlex
-    data = await fetch_json(f"https://api.openalex.org/works/https://doi.org/{d}")
-    if data:
-        title = (data.get("title") or "").strip()
-        year = data.get("publication_year")
-        authors = ";".join([
-            (a.get("author") or {}).get("display_name","")
-            for a in (data.get("authorships") or [])
-        ]).strip(";")
-        return {"ok": True, "source":"openalex", "doi": d, "title": title, "authors": authors, "year": year}
-
-    # 3) Semantic Scholar
-    data = await fetch_json(
-        f"https://api.semanticscholar.org/graph/v1/paper/DOI:{d}?fields=title,year,authors"
-    )
-    if data:
-        title = (data.get("title") or "").strip()
-        year = data.get("year")
-        authors = ";".join([a.get("name","") for a in (data.get("authors") or [])]).strip(";")
-        return {"ok": True, "source":"semanticscholar", "doi": d, "title": title, "authors": authors, "year": year}
-
-    # 4) DOI content negotiation (CSL-JSON)
-    async with httpx.AsyncClient(timeout=10, headers={"User-Agent":"CiteCheck/1.0"}) as client:
-        r = await client.get(f"https://doi.org/{d}", headers={"Accept":"application/vnd.citationstyles.csl+json"})
-        if r.status_code == 200:
-            j = r.json()
-            title = (j.get("title") or "").strip()
-            issued = (j.get("issued") or {}).get("date-parts") or []
-            year = issued[0][0] if issued and issued[0] else None
-            authors = ";".join([
-                " ".join([a.get("family",""), a.get("given","")]).strip()
-                for a in (j.get("author") or [])
-            ]).strip(";")
-            return {"ok": True, "source":"doi_csl", "doi": d, "title": title, "authors": authors, "year": year}
+    # 多来源解析（带缓存）：Crossref → DataCite → OpenAlex → S2 → doi.org(csl)
+    res = await resolve_doi_multi(d)
+    if res.get("ok"):
+        return res
 
     # CNKI 常见：开放库里确实没有
     return {
         "ok": False,
         "doi": d,
-        "detail": "开放数据库未收录（Crossref/OpenAlex/S2/doi.org 均无元数据）。CNKI 文献建议用 RIS/BibTeX 导出后导入。",
+        "detail": "开放数据库未收录（Crossref/DataCite/OpenAlex/S2/doi.org 均无元数据）。CNKI 文献建议用 RIS/BibTeX 导出后导入。",
+    }
+
+@router.post("/resolve-batch")
+async def resolve_batch(data: BatchResolveIn, user: User = Depends(get_current_user)):
+    if len(data.dois) > config.BATCH_MAX_DOIS:
+        raise HTTPException(413, f"Too many DOIs (max {config.BATCH_MAX_DOIS})")
+
+    # NDJSON：每解析完一个 DOI 就推送一行，最后一行是汇总
+    async def stream():
+        total = ok = 0
+        async for res in resolve_doi_batch(data.dois, data.concurrency):
+            total += 1
+            ok += 1 if res.get("ok") else 0
+            yield json.dumps(res, ensure_ascii=False) + "\n"
+        summary = {"done": True, "input": len(data.dois), "unique": total, "ok": ok, "failed": total - ok}
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/cache/stats")
+def cache_stats(admin: User = Depends(get_admin_user)):
+    return {**doi_cache.stats(), "resolver": dict(doi_resolver.counters)}
+
+@router.get("/sources/stats")
+def sources_stats(prefix: Optional[str] = None, admin: User = Depends(get_admin_user)):
+    # 每个 DOI 前缀下各来源的命中率和延迟，路由的跳过/探索次数，以及各来源熔断器和令牌桶的当前状态
+    return {
+        "routing": dict(source_stats.counters),
+        "breakers": upstream.breaker_states(),
+        "buckets": upstream.bucket_states(),
+        "stats": source_stats.snapshot(prefix.lower() if prefix else None),
     }
+
+@router.delete("/cache/{doi:path}")
+def cache_invalidate(doi: str, admin: User = Depends(get_admin_user)):
+    removed = doi_cache.invalidate(normalize_doi(doi))
+    return {"ok": True, "removed": removed}
@@ -0,0 +1,71 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, insert, not_, or_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..db import get_async_session
+from ..deps import get_current_user
+from ..models import EnrichJob, Reference, User
+
+router = APIRouter(prefix="/enrich", tags=["enrich"])
+
+ACTIVE = ("queued", "running")
+
+@router.get("/status")
+async def enrich_status(
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    # 当前用户各状态的任务数；progress = 已结束 / 全部
+    rows = (await session.execute(
+        select(EnrichJob.status, func.count()).where(EnrichJob.user_id == user.id).group_by(EnrichJob.status)
+    )).all()
+    counts = {s: 0 for s in ("queued", "running", "done", "failed", "skipped")}
+    counts.update({status: n for status, n in rows})
+    total = sum(counts.values())
+    finished = total - counts["queued"] - counts["running"]
+    return {**counts, "total": total, "progress": round(finished / total, 4) if total else 1.0}
+
+@router.get("/jobs")
+async def enrich_jobs(
+    status: Optional[str] = Query(None, pattern="^(queued|running|done|failed|skipped)$"),
+    ref_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    stmt = select(EnrichJob).where(EnrichJob.user_id == user.id)
+    if status:
+        stmt = stmt.where(EnrichJob.status == status)
+    if ref_id is not None:
+        stmt = stmt.where(EnrichJob.ref_id == ref_id)
+    jobs = (await session.exec(stmt.order_by(EnrichJob.id.desc()).limit(limit))).all()
+    return [
+        {**j.model_dump(exclude={"user_id", "filled"}), "filled": j.filled.split(",") if j.filled else []}
+        for j in jobs
+    ]
+
+@router.post("")
+async def enrich_library(
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    from ..services.enrichment import job_rows, worker as enrich_worker  # 按需导入：不常用的路由不拖慢冷启动
+
+    # 把库里已有的、有 DOI 但缺字段、且没有排队中任务的文献都排上
+    active = select(EnrichJob.ref_id).where(EnrichJob.user_id == user.id, EnrichJob.status.in_(ACTIVE))
+    rows = (await session.execute(
+        select(Reference.id, Reference.doi, Reference.missing_cache).where(
+            Reference.user_id == user.id,
+            not_(or_(Reference.doi.is_(None), func.trim(Reference.doi) == "")),
+            Reference.id.not_in(active),
+        )
+    )).all()
+    jobs = job_rows(user.id, [(r.id, dict(r._mapping)) for r in rows])
+    if jobs:
+        await session.execute(insert(EnrichJob), jobs)
+        await session.commit()
+        enrich_worker.wake()
+    return {"ok": True, "queued": len(jobs)}
@@ -1,105 +1,542 @@
-from fastapi import APIRouter, Depends, HTTPException
+import io
+from itertools import chain
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import and_, bindparam, delete, func, insert, not_, or_, update
 from sqlmodel import Session, select
-from ..db import get_session
-from ..models import Reference, ReferenceCreate, ReferenceUpdate, User
+from .. import config
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..db import engine, get_async_session, get_session
+from ..models import EnrichJob, Reference, ReferenceCreate, ReferenceTombstone, ReferenceUpdate, User
 from ..deps import get_current_user
+from ..services.changes import add_tombstones, list_etag, next_stamp, next_stamp_sync, rev_stmt
+from ..services.formatter import CACHE_COLUMNS, apply_render, render, render_many, rendered, rendered_values
+from ..services.responses import JSONBody
+from ..services.static_files import etag_matches
+from ..services.styles import STYLE_PATTERN
 
 router = APIRouter(prefix="/references", tags=["references"])
 
-def missing_fields(r: Reference):
-    required = ["title", "authors", "year"]
-    if r.ref_type == "journal":
-        required += ["journal", "volume", "pages"]
-    if r.ref_type == "book":
-        required += ["publisher"]
-    if r.ref_type == "web":
-        required += ["url", "accessed_at"]
-    miss = []
-    for k in required:
-        v = getattr(r, k, None)
-        if v is None or (isinstance(v, str) and not v.strip()):
-            miss.append(k)
-    return miss
-
-def format_gbt7714(r: Reference) -> str:
-    # MVP：非常简化版（够演示），后续可迭代更严格规则
-    authors = r.authors.replace("；", ";").strip()
-    if r.ref_type == "journal":
-        # 作者. 题名[J]. 刊名, 年, 卷(期): 页码. DOI
-        vol_issue = f"{r.volume}({r.issue})" if r.issue else f"{r.volume}"
-        doi_part = f" DOI:{r.doi}" if r.doi else ""
-        return f"{authors}. {r.title}[J]. {r.journal}, {r.year}, {vol_issue}: {r.pages}.{doi_part}"
-    if r.ref_type == "book":
-        # 作者. 书名[M]. 出版地: 出版社, 年.
-        return f"{authors}. {r.title}[M]. {r.publisher}, {r.year}."
-    if r.ref_type == "web":
-        # 作者. 题名[EB/OL]. URL (访问日期).
-        return f"{authors}. {r.title}[EB/OL]. {r.url} ({r.accessed_at})."
-    return f"{authors}. {r.title}. {r.year}."
+# 列表接口可选的字段：表里的列 + 计算字段（citation 是 ?style= 指定格式的引用串，默认 gbt7714）
+REF_FIELDS = [c.name for c in Reference.__table__.columns if c.name not in CACHE_COLUMNS]
+COMPUTED_FIELDS = {"missing", "gbt7714", "citation"}
+_REF_COLUMNS = [Reference.__table__.c[f] for f in REF_FIELDS]
+_CACHE_COLUMNS = [Reference.gbt7714_cache, Reference.missing_cache, Reference.format_version]
+
+def _blank(col):
+    return or_(col.is_(None), func.trim(col) == "")
+
+def _missing_clause():
+    # 与 missing_fields() 同样的规则，写成 SQL 条件，方便在数据库里过滤
+    journal = and_(Reference.ref_type == "journal", or_(_blank(Reference.journal), _blank(Reference.volume), _blank(Reference.pages)))
+    book = and_(Reference.ref_type == "book", _blank(Reference.publisher))
+    web = and_(Reference.ref_type == "web", or_(_blank(Reference.url), _blank(Reference.accessed_at)))
+    return or_(_blank(Reference.title), _blank(Reference.authors), Reference.year.is_(None), journal, book, web)
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in REF_FIELDS and f not in COMPUTED_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return wanted
+
+def _ref_item(r: Reference) -> Dict[str, Any]:
+    gbt, miss = rendered(r)
+    return {**r.model_dump(exclude=CACHE_COLUMNS), "missing": miss, "gbt7714": gbt}
+
+def _row_items(rows) -> List[Dict[str, Any]]:
+    # 行元组（_REF_COLUMNS + _CACHE_COLUMNS）直接拼 dict：不构造 ORM 实例，也不走 model_dump / jsonable_encoder
+    n = len(REF_FIELDS)
+    items = []
+    for row in rows:
+        item = dict(zip(REF_FIELDS, row))
+        item["gbt7714"], item["missing"] = rendered_values(item, *row[n:])
+        items.append(item)
+    return items
 
 @router.get("")
-def list_refs(
+async def list_refs(
+    request: Request,
+    cursor: Optional[int] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="不传则返回全部"),
+    ref_type: Optional[str] = None,
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    has_missing: Optional[bool] = None,
+    has_doi: Optional[bool] = None,
+    fields: Optional[str] = Query(None, description="逗号分隔，如 id,title,gbt7714"),
+    style: Optional[str] = Query(None, pattern=STYLE_PATTERN, description="加上 citation 字段：gbt7714/apa/mla/ieee"),
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    wanted = _parse_fields(fields)
+    if style is None and wanted is not None and "citation" in wanted:
+        style = "gbt7714"
+    # 条件 GET：文献库版本号没变（同样的查询参数）就直接 304，不查行也不格式化
+    rev = (await session.execute(rev_stmt(user.id))).scalar()
+    etag = list_etag(user.id, rev, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # 只要列的话只查这些列；要计算字段时查全部列和缓存列
+    full_rows = wanted is None or any(f in COMPUTED_FIELDS for f in wanted)
+    if full_rows:
+        stmt = select(*_REF_COLUMNS, *_CACHE_COLUMNS)
+    else:
+        cols = ["id"] + [f for f in wanted if f != "id"]
+        stmt = select(*[getattr(Reference, c) for c in cols])
+
+    stmt = stmt.where(Reference.user_id == user.id)
+    if ref_type:
+        stmt = stmt.where(Reference.ref_type == ref_type)
+    if year_from is not None:
+        stmt = stmt.where(Reference.year >= year_from)
+    if year_to is not None:
+        stmt = stmt.where(Reference.year <= year_to)
+    if has_doi is not None:
+        stmt = stmt.where(not_(_blank(Reference.doi)) if has_doi else _blank(Reference.doi))
+    if has_missing is not None:
+        stmt = stmt.where(_missing_clause() if has_missing else not_(_missing_clause()))
+    # keyset 分页：走 (user_id, id) 索引，翻到第几页都一样快
+    if cursor is not None:
+        stmt = stmt.where(Reference.id < cursor)
+    stmt = stmt.order_by(Reference.id.desc())
+    if limit:
+        stmt = stmt.limit(limit + 1)
+
+    rows = (await session.execute(stmt)).all()
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = str(rows[-1].id)
+
+    if not full_rows:
+        items = [dict(zip(cols, row)) for row in rows]
+    else:
+        items = _row_items(rows)
+        if style:
+            # 整页一次格式化：模板按 ref_type 预编译，作者串改写有缓存
+            citations = [item["gbt7714"] for item in items] if style == "gbt7714" else render_many(items, style)
+            for item, citation in zip(items, citations):
+                item["citation"] = citation
+    if wanted is not None:
+        items = [{f: item[f] for f in wanted} for item in items]
+    return JSONBody(items, headers=headers)
+
+@router.get("/changes")
+async def list_changes(
+    since: int = Query(0, ge=0, description="上次响应里的 cursor；0 表示全量"),
+    limit: Optional[int] = Query(None, ge=1, le=5000, description="分页大小；不传则一次返回全部（兼容老客户端）"),
+    after: Optional[int] = Query(None, ge=1, description="上一页响应里的 next"),
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    # 先读版本号再读行：期间有新写入的话，这些行下次还会再返回一次（按 id 覆盖即可），不会漏。
+    # 分页时按 id 倒序 keyset 翻页，客户端用第一页的 cursor 做下次同步的起点（翻页期间的写入留给下一次增量）
+    rev = (await session.execute(rev_stmt(user.id))).scalar() or 0
+    headers = {"X-Library-Rev": str(rev)}
+    if since and since >= rev:
+        return JSONBody({"cursor": rev, "full": False, "items": [], "deleted": [], "next": None}, headers=headers)
+    stmt = select(*_REF_COLUMNS, *_CACHE_COLUMNS).where(Reference.user_id == user.id)
+    deleted: List[int] = []
+    if since:
+        stmt = stmt.where(Reference.rev > since)
+        if after is None:
+            # 墓碑只在第一页返回
+            deleted = list((await session.execute(
+                select(ReferenceTombstone.ref_id).where(ReferenceTombstone.user_id == user.id, ReferenceTombstone.rev > since)
+            )).scalars())
+    if after is not None:
+        stmt = stmt.where(Reference.id < after)
+    stmt = stmt.order_by(Reference.id.desc())
+    if limit:
+        stmt = stmt.limit(limit + 1)
+    rows = (await session.execute(stmt)).all()
+    next_after = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1].id
+    # 客户端先按 deleted 删，再按 id 覆盖 items
+    return JSONBody(
+        {"cursor": rev, "full": not since, "items": _row_items(rows), "deleted": deleted, "next": next_after},
+        headers=headers,
+    )
+
+@router.get("/search")
+async def search_refs(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: int = Query(0, ge=0, description="上一页响应头 X-Next-Cursor 的值"),
+    limit: int = Query(20, ge=1, le=100),
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    from ..services.search import search_ids  # 按需导入，同 dedupe
+
+    # 按相关度排序，只在当前用户的文献里搜
+    ids = await search_ids(session, user.id, q, limit + 1, cursor)
+    if len(ids) > limit:
+        ids = ids[:limit]
+        response.headers["X-Next-Cursor"] = str(cursor + limit)
+    if not ids:
+        return []
+    rows = (await session.exec(select(Reference).where(Reference.id.in_(ids)))).all()
+    by_id = {r.id: r for r in rows}
+    return [_ref_item(by_id[i]) for i in ids if i in by_id]
+
+@router.get("/duplicates")
+def list_duplicates(
     session: Session = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
-    refs = session.exec(select(Reference).where(Reference.user_id == user.id).order_by(Reference.id.desc())).all()
-    return [
-        {
-            **r.model_dump(),
-            "missing": missing_fields(r),
-            "gbt7714": format_gbt7714(r),
-        }
-        for r in refs
-    ]
+    # 同步路由：查重是纯 CPU 计算，放在线程池里跑，不卡事件循环
+    cols = [Reference.id, Reference.title, Reference.authors, Reference.year, Reference.doi, Reference.journal]
+    rows = session.execute(select(*cols).where(Reference.user_id == user.id)).all()
+    from ..services.dedupe import find_duplicates  # 不常用的功能按需导入，加快冷启动
+
+    groups = find_duplicates(rows)
+    by_id = {r.id: r for r in rows}
+    for g in groups:
+        g["items"] = [dict(by_id[i]._mapping) for i in g["ids"]]
+    return {"count": len(groups), "groups": groups}
+
+class MergeIn(BaseModel):
+    keep_id: int
+    merge_ids: List[int]
+
+@router.post("/merge")
+async def merge_refs(
+    data: MergeIn,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    merge_ids = [i for i in dict.fromkeys(data.merge_ids) if i != data.keep_id]
+    if not merge_ids:
+        raise HTTPException(status_code=400, detail="Nothing to merge")
+    # 一次查询同时校验归属
+    ids = [data.keep_id] + merge_ids
+    refs = (await session.exec(select(Reference).where(Reference.id.in_(ids), Reference.user_id == user.id))).all()
+    by_id = {r.id: r for r in refs}
+    if len(by_id) != len(ids):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    # 保留条目里为空的字段，按 merge_ids 的顺序用第一个非空值补上
+    keep = by_id[data.keep_id]
+    filled = []
+    for field in ReferenceCreate.model_fields:
+        cur = getattr(keep, field)
+        if cur is not None and not (isinstance(cur, str) and not cur.strip()):
+            continue
+        for i in merge_ids:
+            v = getattr(by_id[i], field)
+            if v is not None and not (isinstance(v, str) and not v.strip()):
+                setattr(keep, field, v)
+                filled.append(field)
+                break
+    stamp = await next_stamp(session, user.id)
+    for k, v in stamp.items():
+        setattr(keep, k, v)
+    apply_render(keep)
+    session.add(keep)
+    await session.execute(delete(Reference).where(Reference.id.in_(merge_ids), Reference.user_id == user.id))
+    await add_tombstones(session, user.id, merge_ids, stamp)
+    await session.commit()
+    return {"ok": True, "id": keep.id, "merged": merge_ids, "filled": filled}
+
+@router.get("/export")
+def export_refs(
+    format: str = Query("gbt7714", pattern="^(gbt7714|apa|mla|ieee|bibtex|csljson|ris)$"),
+    user: User = Depends(get_current_user),
+):
+    from ..services.exporters import EXPORT_FORMATS, export_lines
+
+    media_type, ext = EXPORT_FORMATS[format]
+    user_id = user.id
+
+    def batches():
+        # 自己开 Session：StreamingResponse 开始迭代时，依赖注入的 session 可能已经关闭
+        # stream_results + yield_per：服务端游标分批取，内存占用与文献总数无关
+        with Session(engine) as session:
+            stmt = (
+                select(Reference)
+                .where(Reference.user_id == user_id)
+                .order_by(Reference.id)
+                .execution_options(stream_results=True, yield_per=config.EXPORT_BATCH_SIZE)
+            )
+            yield from session.execute(stmt).scalars().partitions()
+
+    return StreamingResponse(
+        export_lines(format, batches()),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="citecheck.{ext}"'},
+    )
 
 @router.post("")
-def create_ref(
+async def create_ref(
     data: ReferenceCreate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     user: User = Depends(get_current_user),
 ):
-    ref = Reference(**data.model_dump(), user_id=user.id)
+    from ..services.enrichment import job_rows, worker as enrich_worker  # 按需导入：补全链路连带 DOI 解析各模块
+
+    stamp = await next_stamp(session, user.id)
+    ref = apply_render(Reference(**data.model_dump(), user_id=user.id, **stamp))
     session.add(ref)
-    session.commit()
-    session.refresh(ref)
-    return {"id": ref.id}
+    await session.flush()
+    # 有 DOI 但缺字段：同一个事务里排一个后台补全任务，不在这里等上游
+    jobs = job_rows(user.id, [(ref.id, ref.model_dump())])
+    if jobs:
+        await session.execute(insert(EnrichJob), jobs)
+    await session.commit()
+    if jobs:
+        enrich_worker.wake()
+    return {"id": ref.id, "enrich_queued": bool(jobs)}
+
+def _bulk_insert(session: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    # 一条 INSERT ... VALUES 多行（executemany），按输入顺序拿回主键
+    stmt = insert(Reference).returning(Reference.id, sort_by_parameter_order=True)
+    return list(session.execute(stmt, rows).scalars())
+
+@router.post("/import")
+def import_refs(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(ris|bibtex)$"),
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    from ..services.enrichment import job_rows, worker as enrich_worker
+    from ..services.importers import REPLACEMENT, detect_format, iter_bibtex, iter_ris, sniff_encoding
+
+    # 逐行流式解析上传文件，攒够 IMPORT_CHUNK_SIZE 条批量插入一次，全部在一个事务里提交。
+    # 编码先嗅探（UTF-8，不行就 GB18030）；GB18030 里仍解不出的字节会变成 U+FFFD，含 U+FFFD 的条目记为失败，不入库
+    encoding = sniff_encoding(file.file)
+    text = io.TextIOWrapper(file.file, encoding=encoding, errors="replace", newline="")
+    first = ""
+    for first in text:
+        if first.strip():
+            break
+    fmt = format or detect_format(file.filename, first)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Unrecognized file format (expected RIS or BibTeX)")
+    parser = iter_ris if fmt == "ris" else iter_bibtex
+
+    report: List[Dict[str, Any]] = []
+    rows: List[Dict[str, Any]] = []
+    pending: List[Dict[str, Any]] = []
+
+    enrich_jobs: List[Dict[str, Any]] = []
+    stamp: Dict[str, Any] = {}
+
+    def flush():
+        # 整个导入共用一个版本号，第一次真正插入时才领取
+        if not stamp:
+            stamp.update(next_stamp_sync(session, user.id))
+        for row in rows:
+            row.update(stamp)
+        ids = _bulk_insert(session, rows)
+        for item, ref_id in zip(pending, ids):
+            item["id"] = ref_id
+            report.append(item)
+        enrich_jobs.extend(job_rows(user.id, zip(ids, rows)))
+        rows.clear()
+        pending.clear()
+
+    try:
+        for idx, entry in enumerate(parser(chain([first], text))):
+            err = entry.pop("_error", None)
+            if not err and not entry.get("title"):
+                err = "Missing title"
+            if not err and any(isinstance(v, str) and REPLACEMENT in v for v in entry.values()):
+                err = "Undecodable characters (file is not valid UTF-8 or GB18030)"
+            if err:
+                report.append({"index": idx, "ok": False, "error": err})
+                continue
+            try:
+                data = ReferenceCreate(**entry)
+            except ValidationError as e:
+                report.append({"index": idx, "ok": False, "error": str(e.errors()[0].get("msg"))})
+                continue
+            ref = apply_render(Reference(**data.model_dump(), user_id=user.id))
+            rows.append(ref.model_dump(exclude={"id"}))
+            pending.append({"index": idx, "ok": True, "title": data.title})
+            if len(rows) >= config.IMPORT_CHUNK_SIZE:
+                flush()
+        if rows:
+            flush()
+        if enrich_jobs:
+            session.execute(insert(EnrichJob), enrich_jobs)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    if enrich_jobs:
+        enrich_worker.wake()
+
+    report.sort(key=lambda x: x["index"])
+    imported = sum(1 for x in report if x["ok"])
+    return {
+        "ok": True,
+        "format": fmt,
+        "encoding": encoding,
+        "imported": imported,
+        "failed": len(report) - imported,
+        "enrich_queued": len(enrich_jobs),
+        "entries": report,
+    }
+
+class BatchOp(BaseModel):
+    op: Literal["create", "patch", "delete"]
+    id: Optional[int] = None
+    data: Optional[Dict[str, Any]] = None
+
+class BatchIn(BaseModel):
+    ops: List[BatchOp]
+    # atomic：有一条失败就整批不写；best_effort：跳过失败的，其余照常提交
+    mode: Literal["atomic", "best_effort"] = "atomic"
+
+REF_INPUT_FIELDS = list(ReferenceCreate.model_fields)
+
+def _row_values(values: Dict[str, Any]) -> Dict[str, Any]:
+    # 校验后的字段 + 重新渲染的缓存列
+    data = ReferenceCreate(**{k: values.get(k) for k in REF_INPUT_FIELDS if values.get(k) is not None})
+    ref = apply_render(Reference(**data.model_dump(), user_id=values.get("user_id")))
+    return ref.model_dump(include=set(REF_INPUT_FIELDS) | CACHE_COLUMNS)
+
+@router.post("/batch")
+async def batch_refs(
+    data: BatchIn,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    from ..services.enrichment import job_rows, worker as enrich_worker
+
+    if len(data.ops) > config.REF_BATCH_MAX_OPS:
+        raise HTTPException(status_code=413, detail=f"Too many operations (max {config.REF_BATCH_MAX_OPS})")
+
+    # 一次查询拿到 patch/delete 涉及的、属于当前用户的行（Core 查询，不进 ORM identity map）
+    ids = {o.id for o in data.ops if o.op != "create" and o.id is not None}
+    table = Reference.__table__
+    current: Dict[int, Dict[str, Any]] = {}
+    if ids:
+        rows = await session.execute(select(table).where(table.c.id.in_(ids), table.c.user_id == user.id))
+        current = {r["id"]: dict(r) for r in rows.mappings()}
+
+    results: List[Dict[str, Any]] = []
+    creates: List[Dict[str, Any]] = []
+    create_items: List[Dict[str, Any]] = []
+    patched: Dict[int, Dict[str, Any]] = {}
+    deleted: List[int] = []
+    for idx, o in enumerate(data.ops):
+        item: Dict[str, Any] = {"index": idx, "op": o.op, "ok": True}
+        if o.op != "create":
+            item["id"] = o.id
+        results.append(item)
+        try:
+            # create 和 patch 一样：不认识的字段直接报错，不静默丢掉
+            unknown = [k for k in o.data or {} if k not in REF_INPUT_FIELDS]
+            if unknown and o.op != "delete":
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            if o.op == "create":
+                creates.append({**_row_values(o.data or {}), "user_id": user.id})
+                create_items.append(item)
+                continue
+            if o.id is None or o.id not in current:
+                raise ValueError("Not found")
+            if o.op == "patch":
+                # 同一条多次 patch 时在上一次的结果上继续改，最后只写一次
+                values = _row_values({**current[o.id], **(o.data or {})})
+                current[o.id].update(values)
+                patched[o.id] = values
+            else:
+                del current[o.id]
+                patched.pop(o.id, None)
+                deleted.append(o.id)
+        except ValidationError as e:
+            item.update(ok=False, error=str(e.errors()[0].get("msg")))
+        except ValueError as e:
+            item.update(ok=False, error=str(e))
+
+    failed = sum(1 for x in results if not x["ok"])
+    if failed and data.mode == "atomic":
+        raise HTTPException(status_code=422, detail={"message": "Batch rejected, nothing was written", "results": results})
+
+    # 每类操作一条语句：多行 INSERT、按主键 executemany UPDATE、IN 列表 DELETE
+    enrich_jobs: List[Dict[str, Any]] = []
+    try:
+        # 整批共用一个版本号
+        stamp = await next_stamp(session, user.id) if creates or patched or deleted else {}
+        if creates:
+            for row in creates:
+                row.update(stamp)
+            stmt = insert(Reference).returning(Reference.id, sort_by_parameter_order=True)
+            new_ids = (await session.execute(stmt, creates)).scalars().all()
+            for item, ref_id in zip(create_items, new_ids):
+                item["id"] = ref_id
+            enrich_jobs = job_rows(user.id, zip(new_ids, creates))
+            if enrich_jobs:
+                await session.execute(insert(EnrichJob), enrich_jobs)
+        if patched:
+            # SET 子句由参数里的列名决定，每行的列都一样
+            stmt = update(table).where(table.c.id == bindparam("_id"), table.c.user_id == user.id)
+            await session.execute(stmt, [{"_id": i, **v, **stamp} for i, v in patched.items()])
+        if deleted:
+            await session.execute(delete(table).where(table.c.id.in_(deleted), table.c.user_id == user.id))
+            await add_tombstones(session, user.id, deleted, stamp)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    if enrich_jobs:
+        enrich_worker.wake()
+    return {"ok": not failed, "applied": len(results) - failed, "failed": failed, "results": results}
 
 @router.patch("/{ref_id}")
-def update_ref(
+async def update_ref(
     ref_id: int,
     data: ReferenceUpdate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     user: User = Depends(get_current_user),
 ):
-    ref = session.get(Reference, ref_id)
+    ref = await session.get(Reference, ref_id)
     if not ref or ref.user_id != user.id:
         raise HTTPException(status_code=404, detail="Not found")
-    for k, v in data.model_dump().items():
+    for k, v in {**data.model_dump(), **await next_stamp(session, user.id)}.items():
         setattr(ref, k, v)
+    apply_render(ref)
     session.add(ref)
-    session.commit()
+    await session.commit()
     return {"ok": True}
 
 @router.delete("/{ref_id}")
-def delete_ref(
+async def delete_ref(
     ref_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     user: User = Depends(get_current_user),
 ):
-    ref = session.get(Reference, ref_id)
+    ref = await session.get(Reference, ref_id)
     if not ref or ref.user_id != user.id:
         raise HTTPException(status_code=404, detail="Not found")
-    session.delete(ref)
-    session.commit()
+    await session.delete(ref)
+    await add_tombstones(session, user.id, [ref_id], await next_stamp(session, user.id))
+    await session.commit()
     return {"ok": True}
 
 @router.get("/{ref_id}/format")
-def get_format(
+async def get_format(
     ref_id: int,
-    session: Session = Depends(get_session),
+    style: Optional[str] = Query(None, pattern=STYLE_PATTERN),
+    session: AsyncSession = Depends(get_async_session),
     user: User = Depends(get_current_user),
 ):
-    ref = session.get(Reference, ref_id)
+    ref = await session.get(Reference, ref_id)
     if not ref or ref.user_id != user.id:
         raise HTTPException(status_code=404, detail="Not found")
-    return {"gbt7714": format_gbt7714(ref), "missing": missing_fields(ref)}
\ No newline at end of file
+    gbt, miss = rendered(ref)
+    if style:
+        return {"gbt7714": gbt, "missing": miss, "style": style, "citation": render(ref, style)}
+    return {"gbt7714": gbt, "missing": miss}
\ No newline at end of file
@@ -0,0 +1,74 @@
+from __future__ import annotations
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models import ReferenceTombstone, User
+from .formatter import FORMATTER_VERSION
+
+# 文献库变更追踪（增量同步 + 条件 GET）：
+# - 每个写事务先把 user.library_rev 加一（UPDATE ... RETURNING，在同一个事务里，并发写入拿到的号不会重复），
+#   改动的行记下这个号（rev）和时间，删掉的 id 写进 referencetombstone
+# - GET /references/changes?since=N：rev > N 的条目 + rev > N 的墓碑，cursor 是当前版本号
+# - 列表接口的 ETag = 版本号 + 格式化版本 + 查询参数，库没变时直接 304，不查行也不做格式化
+
+_users = User.__table__
+
+
+def _bump_stmt(user_id: int):
+    return (
+        update(_users)
+        .where(_users.c.id == user_id)
+        .values(library_rev=func.coalesce(_users.c.library_rev, 0) + 1)
+        .returning(_users.c.library_rev)
+    )
+
+
+def rev_stmt(user_id: int):
+    return select(_users.c.library_rev).where(_users.c.id == user_id)
+
+
+def _stamp(rev: int) -> Dict[str, Any]:
+    return {"rev": rev, "updated_at": datetime.utcnow()}
+
+
+async def next_stamp(session: AsyncSession, user_id: int) -> Dict[str, Any]:
+    # 返回 {"rev", "updated_at"}：写进这次改动的每一行
+    return _stamp((await session.execute(_bump_stmt(user_id))).scalar_one())
+
+
+def next_stamp_sync(session: Session, user_id: int) -> Dict[str, Any]:
+    return _stamp(session.execute(_bump_stmt(user_id)).scalar_one())
+
+
+def next_stamps_sync(session: Session, user_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    # 一次给多个用户各领一个版本号（后台任务用）；用户已不存在的不在结果里
+    out = {}
+    for uid in user_ids:
+        rev = session.execute(_bump_stmt(uid)).scalar()
+        if rev is not None:
+            out[uid] = _stamp(rev)
+    return out
+
+
+def _tombstone_stmts(user_id: int, ids: List[int], stamp: Dict[str, Any]) -> list:
+    # 同一个用户的 id 以前删过、被复用后又删：先删这个用户的旧墓碑（只动自己的，别人的墓碑不受影响）
+    rows = [{"ref_id": i, "user_id": user_id, "rev": stamp["rev"], "deleted_at": stamp["updated_at"]} for i in ids]
+    old = delete(ReferenceTombstone).where(ReferenceTombstone.user_id == user_id, ReferenceTombstone.ref_id.in_(ids))
+    return [old, insert(ReferenceTombstone).values(rows)]
+
+
+async def add_tombstones(session: AsyncSession, user_id: int, ids: Iterable[int], stamp: Dict[str, Any]) -> None:
+    ids = list(ids)
+    if ids:
+        for stmt in _tombstone_stmts(user_id, ids, stamp):
+            await session.execute(stmt)
+
+
+def list_etag(user_id: int, rev: Optional[int], query: str) -> str:
+    digest = hashlib.sha1(f"{user_id}|{rev or 0}|{FORMATTER_VERSION}|{query}".encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
@@ -0,0 +1,177 @@
+from __future__ import annotations
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .doi_resolver import normalize_doi
+
+# 查重：先按规范化 DOI 精确分组，再用标题字符 3-gram 的 MinHash 签名分 band 做桶（LSH），
+# 只比较落进同一个桶的候选对，避免 O(n²) 两两比较。
+# 候选对还要满足：标题 3-gram Jaccard 够高、年份相差不超过 1、第一作者有共同的名字片段。
+
+TITLE_THRESHOLD = 0.75
+MINHASH_K = 24  # 签名 24 位
+BAND_ROWS = 3  # 每 3 位一个 band，共 8 个：一对标题至少进一个同桶的概率 J=0.75 约 99%，J=0.8 约 99.7%，J=0.3 约 20%
+MAX_BUCKET = 64  # 超大的桶（很常见的 shingle 组合）没有区分度，跳过
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_title(title: Optional[str]) -> str:
+    # 全角转半角、小写、去掉所有标点和空白："Deep  Learning: A Review" -> "deeplearningareview"
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", title or "").lower())
+
+
+def shingles(norm_title: str, n: int = 3) -> Set[int]:
+    # 直接存 shingle 的哈希值：MinHash 和 Jaccard 都只需要整数集合。
+    # 用单字符元组代替切片：单字符串是缓存的，zip/hash 都在 C 里，比逐个切片再算 SipHash 快
+    if len(norm_title) <= n:
+        return {hash(tuple(norm_title))} if norm_title else set()
+    return set(map(hash, zip(*[norm_title[i:] for i in range(n)])))
+
+
+def first_author_tokens(authors: Optional[str]) -> Set[str]:
+    first = re.split(r"[;；]|\s+and\s+", authors or "", maxsplit=1)[0]
+    first = unicodedata.normalize("NFKC", first).lower()
+    return {t for t in _NON_WORD.split(first) if t}
+
+
+class _UnionFind:
+    def __init__(self) -> None:
+        self.parent: Dict[int, int] = {}
+
+    def find(self, x: int) -> int:
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+def minhash(sh: Iterable[int]) -> Tuple[Optional[int], ...]:
+    # 单哈希分箱 MinHash（one permutation hashing）：哈希值按余数分进 K 个箱，每箱取最小值。
+    # 签名每一位都对齐到固定的箱，两个集合同一位相同的概率约等于 Jaccard；
+    # 一个 shingle 不同只影响它所在的那一位。每个 shingle 只算一次，比 K 个独立哈希快 K 倍。
+    # 空箱记 None（标题很短时会有）。shingle 本身已经是哈希值，不再二次哈希。
+    mins: List[Optional[int]] = [None] * MINHASH_K
+    for h in sh:
+        b = h % MINHASH_K
+        m = mins[b]
+        if m is None or h < m:
+            mins[b] = h
+    return tuple(mins)
+
+
+def find_duplicates(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    # rows 需要有 id/title/authors/year/doi 属性；返回分组列表，DOI 组在前
+    refs: Dict[int, Any] = {}
+    doi_of: Dict[int, str] = {}
+    by_doi: Dict[str, List[int]] = defaultdict(list)
+    for r in rows:
+        refs[r.id] = r
+        if r.doi and r.doi.strip():
+            d = normalize_doi(r.doi).lower()
+            doi_of[r.id] = d
+            by_doi[d].append(r.id)
+
+    uf = _UnionFind()
+    doi_groups = {d: ids for d, ids in by_doi.items() if len(ids) > 1}
+    for ids in doi_groups.values():
+        for other in ids[1:]:
+            uf.union(ids[0], other)
+
+    # 分桶：规范化标题完全相同的一个桶，MinHash 签名的每个 band 一个桶。
+    # 绝大多数桶只有一条：先记在 first 里，第二条进来才建列表（少建十几万个列表，GC 也轻）
+    norms: Dict[int, str] = {}
+    same_title: Dict[str, List[int]] = defaultdict(list)
+    first: Dict[Tuple[Optional[int], ...], int] = {}
+    bands: Dict[Tuple[Optional[int], ...], List[int]] = {}
+    for rid, r in refs.items():
+        norm = normalize_title(r.title)
+        if not norm:
+            continue
+        norms[rid] = norm
+        same_title[norm].append(rid)
+        # 桶键就是 band 里各位的最小值：值 % MINHASH_K 就是它所在的位，不同 band 的键不会相同，不用再带 band 序号。
+        # 整个 band 都是空箱的不分桶
+        for band in zip(*[iter(minhash(shingles(norm)))] * BAND_ROWS):
+            if band.count(None) == BAND_ROWS:
+                continue
+            other = first.setdefault(band, rid)
+            if other != rid:
+                if band in bands:
+                    bands[band].append(rid)
+                else:
+                    bands[band] = [other, rid]
+
+    # shingle 集合只给候选对算 Jaccard 用，用到时再算
+    sigs: Dict[int, Set[int]] = {}
+
+    def shingles_of(rid: int) -> Set[int]:
+        if rid not in sigs:
+            sigs[rid] = shingles(norms[rid])
+        return sigs[rid]
+
+    authors_cache: Dict[int, Set[str]] = {}
+
+    def authors_of(rid: int) -> Set[str]:
+        if rid not in authors_cache:
+            authors_cache[rid] = first_author_tokens(refs[rid].authors)
+        return authors_cache[rid]
+
+    fuzzy_linked: Set[int] = set()
+    checked: Set[Tuple[int, int]] = set()
+    # 常见 shingle（"ing"、"研究"之类）组成的 band 桶会超过 MAX_BUCKET，整桶跳过
+    candidates = [(True, ids) for ids in same_title.values() if len(ids) > 1]
+    candidates += [(False, ids) for ids in bands.values() if len(ids) <= MAX_BUCKET]
+    for exact, ids in candidates:
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                pair = (a, b) if a < b else (b, a)
+                if pair in checked or uf.find(a) == uf.find(b):
+                    continue
+                checked.add(pair)
+                ra, rb = refs[a], refs[b]
+                # DOI 都有且不同：是两篇文章（比如勘误），不算重复
+                if a in doi_of and b in doi_of and doi_of[a] != doi_of[b]:
+                    continue
+                if ra.year and rb.year and abs(ra.year - rb.year) > 1:
+                    continue
+                au_a, au_b = authors_of(a), authors_of(b)
+                if au_a and au_b and not (au_a & au_b):
+                    continue
+                if not exact and _jaccard(shingles_of(a), shingles_of(b)) < TITLE_THRESHOLD:
+                    continue
+                uf.union(a, b)
+                fuzzy_linked.update(pair)
+
+    members: Dict[int, List[int]] = defaultdict(list)
+    for rid in refs:
+        members[uf.find(rid)].append(rid)
+
+    # reason：doi = 只靠 DOI 相同；fuzzy = 只靠标题/作者/年份；mixed = 两者都有
+    order = {"doi": 0, "mixed": 1, "fuzzy": 2}
+    groups: List[Dict[str, Any]] = []
+    for ids in members.values():
+        if len(ids) < 2:
+            continue
+        ids.sort()
+        dois = [doi_of[i] for i in ids if i in doi_of and doi_of[i] in doi_groups]
+        fuzzy = any(i in fuzzy_linked for i in ids)
+        reason = "mixed" if dois and fuzzy else ("fuzzy" if fuzzy else "doi")
+        groups.append({"reason": reason, "doi": dois[0] if dois else None, "ids": ids})
+    groups.sort(key=lambda g: (order[g["reason"]], -len(g["ids"]), g["ids"][0]))
+    return groups
@@ -0,0 +1,150 @@
+from __future__ import annotations
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from .. import config
+from ..db import engine
+from ..models import DoiCache
+
+# 两级缓存：进程内 LRU（微秒级）→ SQLite 表 doi_cache（跨进程/重启保留）→ 远程 API
+# 值统一是 dict；ok=False 的条目是负缓存，调用方自己决定怎么返回 "查不到"
+
+Key = Tuple[str, str]  # (kind, doi)
+
+
+class DoiMetadataCache:
+    def __init__(self, maxsize: int, ttl: int, negative_ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lru: "OrderedDict[Key, Tuple[float, bool, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "invalidations": 0,
+            "db_errors": 0,
+        }
+
+    @staticmethod
+    def _key(kind: str, doi: str) -> Key:
+        # DOI 大小写不敏感
+        return kind, doi.strip().lower()
+
+    def _mem_get(self, key: Key) -> Optional[Tuple[bool, Dict[str, Any]]]:
+        with self._lock:
+            item = self._lru.get(key)
+            if item is None:
+                return None
+            expires, ok, value = item
+            if expires <= time.time():
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return ok, value
+
+    def _mem_put(self, key: Key, expires: float, ok: bool, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._lru[key] = (expires, ok, value)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def _db_get(self, key: Key) -> Optional[DoiCache]:
+        kind, doi = key
+        with Session(engine) as session:
+            return session.exec(
+                select(DoiCache).where(DoiCache.doi == doi, DoiCache.kind == kind)
+            ).first()
+
+    def _db_put(self, key: Key, ok: bool, value: Dict[str, Any], expires_at: datetime) -> None:
+        kind, doi = key
+        with Session(engine) as session:
+            session.merge(DoiCache(
+                doi=doi, kind=kind, ok=ok,
+                payload=json.dumps(value, ensure_ascii=False),
+                expires_at=expires_at, updated_at=datetime.utcnow(),
+            ))
+            session.commit()
+
+    def _db_delete(self, doi: str) -> int:
+        with Session(engine) as session:
+            rows = session.exec(select(DoiCache).where(DoiCache.doi == doi)).all()
+            for row in rows:
+                session.delete(row)
+            session.commit()
+            return len(rows)
+
+    async def get(self, kind: str, doi: str) -> Optional[Tuple[bool, Dict[str, Any]]]:
+        key = self._key(kind, doi)
+        item = self._mem_get(key)
+        if item is None:
+            try:
+                row = await asyncio.to_thread(self._db_get, key)
+            except Exception:
+                # 缓存库出问题时退化成直接查远程
+                self.counters["db_errors"] += 1
+                row = None
+            if row is not None and row.expires_at > datetime.utcnow():
+                item = row.ok, json.loads(row.payload)
+                remaining = (row.expires_at - datetime.utcnow()).total_seconds()
+                self._mem_put(key, time.time() + remaining, *item)
+                self.counters["db_hits"] += 1
+            else:
+                self.counters["misses"] += 1
+                return None
+        else:
+            self.counters["memory_hits"] += 1
+
+        ok, value = item
+        if not ok:
+            self.counters["negative_hits"] += 1
+        # 返回副本，调用方改字段不会污染缓存
+        return ok, dict(value)
+
+    async def set(self, kind: str, doi: str, value: Dict[str, Any], ok: bool = True) -> None:
+        key = self._key(kind, doi)
+        ttl = self.ttl if ok else self.negative_ttl
+        value = dict(value)
+        self._mem_put(key, time.time() + ttl, ok, value)
+        self.counters["stores"] += 1
+        try:
+            await asyncio.to_thread(self._db_put, key, ok, value, datetime.utcnow() + timedelta(seconds=ttl))
+        except Exception:
+            self.counters["db_errors"] += 1
+
+    def invalidate(self, doi: str) -> int:
+        doi = doi.strip().lower()
+        with self._lock:
+            keys = [k for k in self._lru if k[1] == doi]
+            for k in keys:
+                del self._lru[k]
+        removed = self._db_delete(doi)
+        self.counters["invalidations"] += 1
+        return max(removed, len(keys))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["memory_hits"] + self.counters["db_hits"] + self.counters["misses"]
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "memory_size": len(self._lru),
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+        }
+
+
+doi_cache = DoiMetadataCache(
+    maxsize=config.DOI_CACHE_SIZE,
+    ttl=config.DOI_CACHE_TTL,
+    negative_ttl=config.DOI_CACHE_NEGATIVE_TTL,
+)
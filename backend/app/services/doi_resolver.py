@@ -1,6 +1,16 @@
 from __future__ import annotations
-from typing import Any, Dict, Optional, Tuple, List
-import httpx
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Optional, Tuple, List
+
+from .. import config
+from .doi_cache import doi_cache
+from .http_client import get_client
+from .source_stats import doi_prefix, source_stats
+from .upstream import UpstreamUnavailable, fetch
+
+if TYPE_CHECKING:
+    import httpx
 
 CSL_ACCEPT = "application/vnd.citationstyles.csl+json"
 
@@ -30,8 +40,14 @@ def _year_from_crossref(msg: Dict[str, Any]) -> Optional[int]:
                 return y
     return None
 
-async def _get_json(client: httpx.AsyncClient, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any]:
-    r = await client.get(url, headers=headers)
+async def _get_json(
+    client: httpx.AsyncClient, url: str, source: str, headers: Optional[Dict[str, str]] = None
+) -> Tuple[int, Any]:
+    # 熔断/限速/指标都在 upstream.fetch 里；429、5xx、熔断中会抛异常，由 _run_source 记为 "没有明确答复"。
+    # 只有 200 和 404 算明确答复，其余状态码（403、400、3xx 等）同样按 error 处理，不能记成 miss 进负缓存
+    r = await fetch(source, url, headers=headers, client=client)
+    if r.status_code not in (200, 404):
+        raise UpstreamUnavailable(source, f"HTTP {r.status_code}")
     ct = r.headers.get("content-type", "")
     if "application/json" in ct:
         return r.status_code, r.json()
@@ -40,7 +56,7 @@ async def _get_json(client: httpx.AsyncClient, url: str, headers: Optional[Dict[
 async def try_crossref(client: httpx.AsyncClient, doi: str) -> Optional[Dict[str, Any]]:
     # Crossref: /works/{doi} :contentReference[oaicite:1]{index=1}
     url = f"https://api.crossref.org/works/{doi}"
-    code, data = await _get_json(client, url)
+    code, data = await _get_json(client, url, "crossref")
     if code != 200 or not isinstance(data, dict):
         return None
     msg = data.get("message") or {}
@@ -52,7 +68,7 @@ async def try_crossref(client: httpx.AsyncClient, doi: str) -> Optional[Dict[str
 async def try_datacite(client: httpx.AsyncClient, doi: str) -> Optional[Dict[str, Any]]:
     # DataCite REST API commonly used: api.datacite.org/dois/{doi}
     url = f"https://api.datacite.org/dois/{doi}"
-    code, data = await _get_json(client, url)
+    code, data = await _get_json(client, url, "datacite")
     if code != 200 or not isinstance(data, dict):
         return None
     attr = ((data.get("data") or {}).get("attributes")) or {}
@@ -68,7 +84,7 @@ async def try_datacite(client: httpx.AsyncClient, doi: str) -> Optional[Dict[str
 async def try_openalex(client: httpx.AsyncClient, doi: str) -> Optional[Dict[str, Any]]:
     # OpenAlex: works can be fetched by external IDs, including DOI URL form :contentReference[oaicite:2]{index=2}
     url = f"https://api.openalex.org/works/https://doi.org/{doi}"
-    code, data = await _get_json(client, url)
+    code, data = await _get_json(client, url, "openalex")
     if code != 200 or not isinstance(data, dict):
         return None
     title = (data.get("title") or "").strip()
@@ -86,7 +102,7 @@ async def try_semantic_scholar(client: httpx.AsyncClient, doi: str) -> Optional[
     # Semantic Scholar Academic Graph API: paper id can be DOI:<doi> :contentReference[oaicite:3]{index=3}
     fields = "title,year,authors"
     url = f"https://api.semanticscholar.org/graph/v1/paper/DOI:{doi}?fields={fields}"
-    code, data = await _get_json(client, url)
+    code, data = await _get_json(client, url, "semanticscholar")
     if code != 200 or not isinstance(data, dict):
         return None
     title = (data.get("title") or "").strip()
@@ -98,7 +114,7 @@ async def try_doi_csl(client: httpx.AsyncClient, doi: str) -> Optional[Dict[str,
     # DOI content negotiation: Accept: application/vnd.citationstyles.csl+json :contentReference[oaicite:4]{index=4}
     url = f"https://doi.org/{doi}"
     headers = {"Accept": CSL_ACCEPT}
-    code, data = await _get_json(client, url, headers=headers)
+    code, data = await _get_json(client, url, "doi_csl", headers=headers)
     if code != 200 or not isinstance(data, dict):
         return None
 
@@ -118,27 +134,271 @@ async def try_doi_csl(client: httpx.AsyncClient, doi: str) -> Optional[Dict[str,
     authors = ";".join(names)
     return {"doi": doi, "title": title, "authors": authors, "year": year, "source": "doi_csl"}
 
-async def resolve_doi_multi(doi_raw: str) -> Dict[str, Any]:
+# 默认优先级（也是并行模式下挑结果的顺序）；名字与 SOURCE_TIMEOUTS、指标、source_stats 一致
+SOURCES = {
+    "crossref": try_crossref,
+    "datacite": try_datacite,
+    "openalex": try_openalex,
+    "semanticscholar": try_semantic_scholar,
+    "doi_csl": try_doi_csl,
+}
+
+def _is_hit(hit: Optional[Dict[str, Any]]) -> bool:
+    return bool(hit and (hit.get("title") or hit.get("authors") or hit.get("year")))
+
+Outcome = Tuple[Optional[Dict[str, Any]], bool]  # (命中结果, 是否得到了明确答复)
+
+async def _run_source(
+    name: str, client: httpx.AsyncClient, doi: str, delay: float, go: Optional[asyncio.Event] = None
+) -> Outcome:
+    # 错峰：等 delay 秒，或者等 go 被置位（前一个来源已经明确没查到）就提前出发
+    if delay > 0:
+        if go is None:
+            await asyncio.sleep(delay)
+        else:
+            try:
+                await asyncio.wait_for(go.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    t0 = time.perf_counter()
+    try:
+        hit = await SOURCES[name](client, doi)
+    except UpstreamUnavailable as e:
+        # 熔断器直接拒绝时根本没发请求，不计入来源统计
+        if e.reason != "circuit open":
+            source_stats.record(doi_prefix(doi), name, "error", time.perf_counter() - t0)
+        return None, False
+    except Exception:
+        # 单个来源挂了不影响其他来源，但这次 "没查到" 不算数
+        source_stats.record(doi_prefix(doi), name, "error", time.perf_counter() - t0)
+        return None, False
+    hit = hit if _is_hit(hit) else None
+    source_stats.record(doi_prefix(doi), name, "hit" if hit else "miss", time.perf_counter() - t0)
+    return hit, True
+
+async def _resolve_sequential(client: httpx.AsyncClient, doi: str, sources: List[str]) -> Outcome:
+    conclusive = True
+    for name in sources:
+        hit, answered = await _run_source(name, client, doi, 0)
+        if hit:
+            return hit, True
+        conclusive = conclusive and answered
+    return None, conclusive
+
+async def _resolve_parallel(
+    client: httpx.AsyncClient, doi: str, sources: List[str], deadline: float, stagger: float
+) -> Outcome:
+    # 默认错峰：优先级高的来源够快时后面的根本不发请求；前一个来源返回了但没命中，下一个立即出发
+    gos = [asyncio.Event() for _ in sources]
+    tasks = [
+        asyncio.create_task(_run_source(name, client, doi, i * stagger, gos[i]))
+        for i, name in enumerate(sources)
+    ]
+    index = {t: i for i, t in enumerate(tasks)}
+    results: List[Optional[Dict[str, Any]]] = [None] * len(tasks)
+    finished = [False] * len(tasks)
+    conclusive = True
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    pending = set(tasks)
+    try:
+        while pending:
+            timeout = end - loop.time()
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for t in done:
+                i = index[t]
+                finished[i] = True
+                results[i], answered = t.result()
+                conclusive = conclusive and answered
+                if not results[i] and i + 1 < len(gos):
+                    gos[i + 1].set()
+
+            # 按优先级扫描：前面的来源还没返回就继续等，前面都失败了才轮到后面的命中
+            best = None
+            for i in range(len(tasks)):
+                if results[i]:
+                    best = i
+                    break
+                if not finished[i]:
+                    break
+            if best is not None:
+                return results[best], True
+
+            # 已有命中时，优先级更低的来源不可能胜出，直接取消
+            first_hit = next((i for i, r in enumerate(results) if r), None)
+            if first_hit is not None:
+                for t in tasks[first_hit + 1:]:
+                    if not t.done():
+                        t.cancel()
+                pending = {t for t in pending if index[t] <= first_hit}
+
+        # 到总时限：用已返回结果里优先级最高的
+        hit = next((r for r in results if r), None)
+        return hit, bool(hit) or (conclusive and all(finished))
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# 同一个 DOI、同样的查询参数正在查询时，后来的调用直接等这次的结果，不再重复打上游。
+# mode/deadline/use_cache 都算进键：时限更长或不走缓存的调用不能拿时限更短/走缓存那次的结果
+_inflight: Dict[Tuple[str, str, float, bool], "asyncio.Task[Dict[str, Any]]"] = {}
+counters = {"upstream_lookups": 0, "coalesced": 0}
+
+async def resolve_doi_multi(
+    doi_raw: str,
+    mode: Optional[str] = None,
+    deadline: Optional[float] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
     doi = normalize_doi(doi_raw)
     if not doi.startswith("10."):
         return {"ok": False, "detail": "Invalid DOI format", "doi": doi}
 
-    # 依次尝试：Crossref → DataCite → OpenAlex → S2 → doi.org(csl)
+    if use_cache:
+        cached = await doi_cache.get("resolve", doi)
+        if cached is not None:
+            return cached[1]
+
+    mode = mode or config.RESOLVE_MODE
+    deadline = config.RESOLVE_DEADLINE if deadline is None else deadline
+    key = (doi.lower(), mode, deadline, use_cache)
+    task = _inflight.get(key)
+    if task is None:
+        counters["upstream_lookups"] += 1
+        task = asyncio.create_task(_lookup(doi, mode, deadline, use_cache))
+        _inflight[key] = task
+
+        def _forget(t: "asyncio.Task[Dict[str, Any]]") -> None:
+            if _inflight.get(key) is t:
+                del _inflight[key]
+            # 所有等待者都已取消时也要取走异常，避免 "exception was never retrieved"
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(_forget)
+    else:
+        counters["coalesced"] += 1
+
+    # shield：某个调用方被取消（比如客户端断开）不会连带取消其他人在等的查询
+    res = await asyncio.shield(task)
+    return dict(res)
+
+async def _lookup(doi: str, mode: str, deadline: float, use_cache: bool) -> Dict[str, Any]:
+    # 优先级：Crossref → DataCite → OpenAlex → S2 → doi.org(csl)
     # 顺序解释：优先权威登记元数据，其次覆盖面，再兜底 content negotiation
-    async with httpx.AsyncClient(timeout=10, headers={"User-Agent": "CiteCheck/1.0"}) as client:
-        for fn in [try_crossref, try_datacite, try_openalex, try_semantic_scholar, try_doi_csl]:
-            try:
-                hit = await fn(client, doi)
-                if hit and (hit.get("title") or hit.get("authors") or hit.get("year")):
-                    hit["ok"] = True
-                    return hit
-            except Exception:
-                # 单个来源挂了不影响后续来源
-                continue
+    # parallel 模式下各来源同时发出，但仍按上面的优先级挑选结果
+    # 按 DOI 前缀的历史命中率跳过/重排来源（见 source_stats.py）；全部跳过时不打上游直接返回，也不做负缓存
+    sources = await source_stats.plan(doi_prefix(doi), list(SOURCES), sequential=mode == "sequential")
+    client = get_client()
+    if not sources:
+        hit, conclusive = None, False
+    elif mode == "sequential":
+        try:
+            hit, conclusive = await asyncio.wait_for(_resolve_sequential(client, doi, sources), timeout=deadline)
+        except asyncio.TimeoutError:
+            hit, conclusive = None, False
+    else:
+        hit, conclusive = await _resolve_parallel(client, doi, sources, deadline, config.RESOLVE_STAGGER)
+
+    if hit:
+        hit["ok"] = True
+        if use_cache:
+            await doi_cache.set("resolve", doi, hit)
+        return hit
 
     # 都没查到：对 CNKI/国内期刊很常见
-    return {
+    result = {
         "ok": False,
         "doi": doi,
         "detail": "No metadata found in open sources (Crossref/DataCite/OpenAlex/S2/doi.org). For CNKI journals, please export RIS/BibTeX and import.",
     }
+    # 只有每个来源都明确答复 "没有" 才做负缓存；超时/报错的下次再试
+    if use_cache and conclusive:
+        await doi_cache.set("resolve", doi, result, ok=False)
+    return result
+
+async def crossref_metadata(doi: str) -> Optional[Dict[str, Any]]:
+    # Crossref 的完整字段（含刊名/卷/期/页码），给 /metadata/doi 和后台补全用；查不到返回 None（做负缓存），
+    # Crossref 不可用时抛 UpstreamUnavailable（不缓存）
+    cached = await doi_cache.get("crossref", doi)
+    if cached is not None:
+        ok, data = cached
+        return data if ok else None
+
+    r = await fetch("crossref", f"https://api.crossref.org/works/{doi}")
+    if r.status_code == 404:
+        await doi_cache.set("crossref", doi, {"doi": doi}, ok=False)
+        return None
+    if r.status_code != 200:
+        raise UpstreamUnavailable("crossref", f"HTTP {r.status_code}")
+    msg = r.json().get("message", {})
+
+    # MVP：提取常用字段
+    title = (msg.get("title") or [""])[0]
+    authors_list = []
+    for a in msg.get("author") or []:
+        given = a.get("given", "")
+        family = a.get("family", "")
+        name = (family + given).strip() or (given + " " + family).strip()
+        if name:
+            authors_list.append(name)
+    authors = "; ".join(authors_list)
+
+    year = None
+    issued = msg.get("issued", {}).get("date-parts", [])
+    if issued and issued[0] and issued[0][0]:
+        year = issued[0][0]
+
+    data = {
+        "title": title,
+        "authors": authors,
+        "year": year,
+        "journal": (msg.get("container-title") or [""])[0],
+        "volume": msg.get("volume"),
+        "issue": msg.get("issue"),
+        "pages": msg.get("page"),
+        "doi": doi,
+        "url": msg.get("URL"),
+    }
+    await doi_cache.set("crossref", doi, data)
+    return data
+
+async def resolve_doi_batch(dois: List[str], concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    # 去重后并发解析，谁先完成先产出谁；index 是该 DOI 在输入里第一次出现的位置
+    concurrency = max(1, min(concurrency or config.BATCH_CONCURRENCY, config.BATCH_MAX_CONCURRENCY))
+    seen: Dict[str, int] = {}
+    unique: List[Tuple[int, str]] = []
+    for i, raw in enumerate(dois):
+        d = normalize_doi(raw or "")
+        key = d.lower()
+        if key in seen:
+            continue
+        seen[key] = i
+        unique.append((i, d))
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int, d: str) -> Dict[str, Any]:
+        async with sem:
+            try:
+                res = await resolve_doi_multi(d)
+            except Exception as e:
+                res = {"ok": False, "doi": d, "detail": f"Resolve failed: {e}"}
+        return {"index": i, **res}
+
+    tasks = [asyncio.create_task(one(i, d)) for i, d in unique]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        # 客户端断开等情况：剩下的任务全部取消
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,265 @@
+from __future__ import annotations
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+
+from .. import config
+from ..db import engine
+from ..models import EnrichJob, Reference
+from .doi_resolver import crossref_metadata, normalize_doi, resolve_doi_multi
+from .changes import next_stamp_sync
+from .formatter import apply_render
+
+# 后台补全：只填了 DOI 和题名就保存的文献，写入时往 enrichjob 表里排一个任务，写请求立即返回；
+# lifespan 里启动的协程池按 DOI 查元数据（先 Crossref 完整字段，查不到再走多来源解析），只补空着的列。
+# - 一个调度协程从表里取到期的 queued 任务交给 ENRICH_CONCURRENCY 个工作协程，队列有界，上游并发不会超过这个数
+# - 入队后调用 wake() 立即唤醒调度（同步路由在线程池里调用也安全），否则每 ENRICH_POLL_INTERVAL 秒查一次
+# - Crossref 暂时不可用（熔断/限流/超时）时退避重试；进程退出时 running 的任务下次启动重新排队
+# - 调度/收尾时数据库出错（锁超时、连接断开）只记日志并退避，协程不退出
+
+log = logging.getLogger("citecheck.enrich")
+
+ENRICH_FIELDS = ["title", "authors", "year", "journal", "volume", "issue", "pages", "url"]
+
+
+def _blank(v: Any) -> bool:
+    return v is None or (isinstance(v, str) and not v.strip())
+
+
+def needs_enrichment(values: Dict[str, Any]) -> bool:
+    # values 是 apply_render 之后的行：有 DOI，且缺失字段里有元数据能补上的
+    if _blank(values.get("doi")):
+        return False
+    return any(f in ENRICH_FIELDS for f in (values.get("missing_cache") or "").split(","))
+
+
+def job_rows(user_id: int, refs: Iterable[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    # (ref_id, 行数据) → 要插入 enrichjob 的行；调用方在写文献的同一个事务里 insert(EnrichJob)，提交后再 wake()
+    now = datetime.utcnow()
+    return [
+        {"user_id": user_id, "ref_id": ref_id, "doi": normalize_doi(values["doi"]), "status": "queued",
+         "attempts": 0, "run_after": now, "created_at": now}
+        for ref_id, values in refs
+        if needs_enrichment(values)
+    ]
+
+
+Job = Tuple[int, int, int, str, int]  # (job_id, user_id, ref_id, doi, attempts)
+
+
+class EnrichmentWorker:
+    def __init__(self) -> None:
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._queue: Optional["asyncio.Queue[Job]"] = None
+        self.counters = {"done": 0, "failed": 0, "skipped": 0, "retried": 0, "fields_filled": 0, "errors": 0}
+
+    def start(self) -> None:
+        if not config.ENRICH_ENABLED or self._tasks:
+            return
+        concurrency = max(1, config.ENRICH_CONCURRENCY)
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._queue = asyncio.Queue(maxsize=concurrency)
+        self._tasks = [asyncio.create_task(self._dispatch())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(concurrency)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def wake(self) -> None:
+        loop, event = self._loop, self._wake
+        if loop is None or event is None:
+            return
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # 事件循环已关闭（进程退出中）：任务留在表里，下次启动再做
+            pass
+
+    # ---- 调度与执行 ----
+
+    async def _dispatch(self) -> None:
+        assert self._wake is not None and self._queue is not None
+        requeued = False
+        pending: List[Job] = []  # 已标记 running、还没交给工作协程的任务；出错时留着下一轮接着放
+        failures = 0
+        while True:
+            try:
+                if not requeued:
+                    await asyncio.to_thread(_requeue_running)
+                    requeued = True
+                self._wake.clear()
+                claimed, next_due = bool(pending), None
+                if not pending:
+                    pending, next_due = await asyncio.to_thread(_claim, self._queue.maxsize)
+                    claimed = bool(pending)
+                while pending:
+                    await self._queue.put(pending[0])  # 工作协程都忙时在这里等，不会一次取出太多
+                    del pending[0]
+                failures = 0
+                if claimed:
+                    continue
+                timeout = config.ENRICH_POLL_INTERVAL if next_due is None else min(next_due, config.ENRICH_POLL_INTERVAL)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=max(timeout, 0.05))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                failures += 1
+                self.counters["errors"] += 1
+                log.exception("enrichment dispatcher error (%d in a row)", failures)
+                await asyncio.sleep(_backoff(failures))
+
+    async def _work(self) -> None:
+        assert self._queue is not None
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["failed"] += 1
+                try:
+                    await asyncio.to_thread(_finish, job[0], "failed", error=str(e)[:500])
+                except Exception:
+                    # 状态没写进去：任务停在 running，下次启动时重新排队
+                    self.counters["errors"] += 1
+                    log.exception("enrichment job %s: could not record failure", job[0])
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job_id, user_id, ref_id, doi, attempts = job
+        data, retry = await lookup_metadata(doi)
+        if data is None:
+            if retry and attempts < config.ENRICH_MAX_ATTEMPTS:
+                delay = config.ENRICH_RETRY_DELAY * 2 ** (attempts - 1)
+                await asyncio.to_thread(_finish, job_id, "queued", error="upstream unavailable", retry_in=delay)
+                self.counters["retried"] += 1
+            else:
+                await asyncio.to_thread(_finish, job_id, "failed", error="upstream unavailable" if retry else "DOI not found")
+                self.counters["failed"] += 1
+            return
+        status, filled = await asyncio.to_thread(_apply, job_id, user_id, ref_id, doi, data)
+        self.counters[status] += 1
+        self.counters["fields_filled"] += len(filled)
+
+
+def _backoff(failures: int) -> float:
+    # 1s、2s、4s … 封顶 ENRICH_POLL_INTERVAL
+    return min(float(2 ** min(failures - 1, 16)), max(config.ENRICH_POLL_INTERVAL, 1.0))
+
+
+async def lookup_metadata(doi: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    # 先 Crossref 完整字段，查不到再走多来源解析；返回 (元数据, 查不到时是否值得重试)。/check 也用它
+    crossref_down = False
+    try:
+        data = await crossref_metadata(doi)
+    except Exception:
+        # 熔断/限流/5xx/超时：Crossref 这次没有明确答复
+        data, crossref_down = None, True
+    if data:
+        return data, False
+    res = await resolve_doi_multi(doi)
+    if res.get("ok"):
+        return res, False
+    return None, crossref_down
+
+
+# ---- 数据库操作（在线程池里跑） ----
+
+def _requeue_running() -> None:
+    with Session(engine) as session:
+        session.execute(update(EnrichJob).where(EnrichJob.status == "running").values(status="queued"))
+        session.commit()
+
+
+def _claim(limit: int) -> Tuple[List[Job], Optional[float]]:
+    # 取到期的任务标记为 running；没有到期的时返回下一个任务还要等几秒
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        jobs = session.exec(
+            select(EnrichJob)
+            .where(EnrichJob.status == "queued", EnrichJob.run_after <= now)
+            .order_by(EnrichJob.id)
+            .limit(limit)
+        ).all()
+        if not jobs:
+            next_at = session.exec(select(func.min(EnrichJob.run_after)).where(EnrichJob.status == "queued")).one()
+            return [], None if next_at is None else (next_at - now).total_seconds()
+        out = []
+        for j in jobs:
+            j.status = "running"
+            j.attempts += 1
+            session.add(j)
+            out.append((j.id, j.user_id, j.ref_id, j.doi, j.attempts))
+        session.commit()
+        return out, None
+
+
+def _finish(job_id: int, status: str, error: Optional[str] = None, retry_in: Optional[float] = None) -> None:
+    with Session(engine) as session:
+        job = session.get(EnrichJob, job_id)
+        if job is None:
+            return
+        job.status = status
+        job.error = error
+        if retry_in is not None:
+            job.run_after = datetime.utcnow() + timedelta(seconds=retry_in)
+        else:
+            job.finished_at = datetime.utcnow()
+        session.add(job)
+        session.commit()
+
+
+def _apply(job_id: int, user_id: int, ref_id: int, doi: str, data: Dict[str, Any]) -> Tuple[str, List[str]]:
+    # 只补空着的列；文献已删除或 DOI 已被改掉就跳过
+    with Session(engine) as session:
+        ref = session.get(Reference, ref_id)
+        job = session.get(EnrichJob, job_id)
+        now = datetime.utcnow()
+        if ref is None or ref.user_id != user_id or normalize_doi(ref.doi or "").lower() != doi.lower():
+            if job is not None:
+                job.status, job.error, job.finished_at = "skipped", "reference deleted or DOI changed", now
+                session.add(job)
+                session.commit()
+            return "skipped", []
+        filled = []
+        for f in ENRICH_FIELDS:
+            v = data.get(f)
+            if _blank(v) or not _blank(getattr(ref, f)):
+                continue
+            if f == "year":
+                try:
+                    v = int(v)
+                except (TypeError, ValueError):
+                    continue
+            else:
+                v = str(v).strip()
+            setattr(ref, f, v)
+            filled.append(f)
+        if filled:
+            for k, v in next_stamp_sync(session, user_id).items():
+                setattr(ref, k, v)
+            session.add(apply_render(ref))
+        if job is not None:
+            job.status, job.error, job.filled, job.finished_at = "done", None, ",".join(filled), now
+            session.add(job)
+        session.commit()
+        return "done", filled
+
+
+worker = EnrichmentWorker()
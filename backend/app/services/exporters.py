@@ -0,0 +1,115 @@
+from __future__ import annotations
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List
+
+from ..models import Reference
+from .formatter import render_many
+from .styles import STYLES
+
+# 导出格式：与 importers.py 的映射方向相反。每个函数只处理一条，
+# export_lines() 把一批批的行拼成文本块，交给 StreamingResponse 边查边发。
+
+EXPORT_FORMATS = {
+    # format: (media_type, 文件扩展名)
+    "gbt7714": ("text/plain; charset=utf-8", "txt"),
+    "apa": ("text/plain; charset=utf-8", "txt"),
+    "mla": ("text/plain; charset=utf-8", "txt"),
+    "ieee": ("text/plain; charset=utf-8", "txt"),
+    "bibtex": ("application/x-bibtex; charset=utf-8", "bib"),
+    "csljson": ("application/vnd.citationstyles.csl+json; charset=utf-8", "json"),
+    "ris": ("application/x-research-info-systems; charset=utf-8", "ris"),
+}
+
+RIS_TYPES = {"journal": "JOUR", "book": "BOOK", "web": "ELEC"}
+BIBTEX_TYPES = {"journal": "article", "book": "book", "web": "online"}
+CSL_TYPES = {"journal": "article-journal", "book": "book", "web": "webpage"}
+
+
+def split_authors(authors: str) -> List[str]:
+    return [a.strip() for a in re.split(r"[;；]", authors or "") if a.strip()]
+
+
+def to_ris(r: Reference) -> str:
+    lines = [f"TY  - {RIS_TYPES.get(r.ref_type, 'GEN')}", f"TI  - {r.title}"]
+    lines += [f"AU  - {a}" for a in split_authors(r.authors)]
+    pairs = [
+        ("PY", r.year), ("JO", r.journal), ("VL", r.volume), ("IS", r.issue),
+        ("PB", r.publisher), ("SN", r.isbn), ("DO", r.doi), ("UR", r.url), ("Y2", r.accessed_at),
+    ]
+    if r.pages:
+        sp, _, ep = r.pages.partition("-")
+        pairs += [("SP", sp.strip()), ("EP", ep.strip())]
+    lines += [f"{tag}  - {v}" for tag, v in pairs if v not in (None, "")]
+    lines.append("ER  - ")
+    return "\n".join(lines) + "\n\n"
+
+
+def _bib_escape(v: Any) -> str:
+    return str(v).replace("{", "\\{").replace("}", "\\}")
+
+
+def to_bibtex(r: Reference) -> str:
+    fields = [
+        ("title", r.title),
+        ("author", " and ".join(split_authors(r.authors))),
+        ("year", r.year),
+        ("journal", r.journal),
+        ("volume", r.volume),
+        ("number", r.issue),
+        ("pages", r.pages.replace("-", "--") if r.pages and "--" not in r.pages else r.pages),
+        ("publisher", r.publisher),
+        ("isbn", r.isbn),
+        ("doi", r.doi),
+        ("url", r.url),
+        ("urldate", r.accessed_at),
+    ]
+    body = ",\n".join(f"  {k} = {{{_bib_escape(v)}}}" for k, v in fields if v not in (None, ""))
+    return f"@{BIBTEX_TYPES.get(r.ref_type, 'misc')}{{citecheck{r.id},\n{body}\n}}\n\n"
+
+
+def to_csl(r: Reference) -> Dict[str, Any]:
+    item: Dict[str, Any] = {
+        "id": f"citecheck{r.id}",
+        "type": CSL_TYPES.get(r.ref_type, "article"),
+        "title": r.title,
+        "author": [{"literal": a} for a in split_authors(r.authors)],
+    }
+    if r.year:
+        item["issued"] = {"date-parts": [[r.year]]}
+    optional = {
+        "container-title": r.journal, "volume": r.volume, "issue": r.issue, "page": r.pages,
+        "publisher": r.publisher, "ISBN": r.isbn, "DOI": r.doi, "URL": r.url,
+    }
+    item.update({k: v for k, v in optional.items() if v not in (None, "")})
+    if r.accessed_at:
+        item["accessed"] = {"raw": r.accessed_at}
+    return item
+
+
+def export_lines(fmt: str, batches: Iterable[List[Reference]]) -> Iterator[str]:
+    # 每批输出一个文本块；csljson 需要自己拼 JSON 数组的括号和逗号
+    n = 0
+    if fmt == "csljson":
+        yield "["
+    for batch in batches:
+        parts = []
+        if fmt in STYLES:
+            # 引用格式整批渲染（模板预编译 + 作者串缓存）
+            for citation in render_many(batch, fmt):
+                n += 1
+                parts.append(f"[{n}] {citation}\n")
+        else:
+            for r in batch:
+                if fmt == "bibtex":
+                    parts.append(to_bibtex(r))
+                elif fmt == "ris":
+                    parts.append(to_ris(r))
+                else:
+                    sep = ",\n" if n else "\n"
+                    parts.append(sep + json.dumps(to_csl(r), ensure_ascii=False))
+                n += 1
+        if parts:
+            yield "".join(parts)
+    if fmt == "csljson":
+        yield "\n]\n"
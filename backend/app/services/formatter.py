@@ -0,0 +1,128 @@
+from __future__ import annotations
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, update
+from sqlmodel import Session, select
+
+from ..db import engine
+from ..models import Reference
+from .styles import STYLES
+
+# 引用串和缺失字段只在条目变化时才会变：写入时算好存进 Reference 的缓存列，读取时直接用。
+# 改了下面的格式化规则就把 FORMATTER_VERSION 加一，启动时后台会把旧版本的行重新渲染。
+FORMATTER_VERSION = 1
+
+CACHE_COLUMNS = {"gbt7714_cache", "missing_cache", "format_version"}
+
+_gbt = STYLES["gbt7714"]
+
+# 渲染结果依赖的列：引用串模板用到的 + missing_fields 检查的
+RENDER_INPUTS = sorted(_gbt.fields | {"title", "authors", "year", "journal", "volume", "pages", "publisher", "url", "accessed_at"})
+
+def missing_fields(r: Reference):
+    required = ["title", "authors", "year"]
+    if r.ref_type == "journal":
+        required += ["journal", "volume", "pages"]
+    if r.ref_type == "book":
+        required += ["publisher"]
+    if r.ref_type == "web":
+        required += ["url", "accessed_at"]
+    miss = []
+    for k in required:
+        v = getattr(r, k, None)
+        if v is None or (isinstance(v, str) and not v.strip()):
+            miss.append(k)
+    return miss
+
+def format_gbt7714(r: Reference) -> str:
+    # 规则在 styles.STYLES["gbt7714"] 的模板里：
+    # 期刊 作者. 题名[J]. 刊名, 年, 卷(期): 页码. DOI；图书 作者. 书名[M]. 出版社, 年.；网页 作者. 题名[EB/OL]. URL (访问日期).
+    return _gbt.render(r)
+
+def render(r: Reference, style: str = "gbt7714") -> str:
+    if style == "gbt7714":
+        return rendered(r)[0]
+    return STYLES[style].render(r)
+
+def render_many(refs: Sequence[Any], style: str = "gbt7714") -> List[str]:
+    # 一次格式化一批行：gbt7714 优先用缓存列，缓存过期的行一起走编译好的模板
+    if style != "gbt7714":
+        return STYLES[style].render_many(refs)
+    out: List[Optional[str]] = []
+    for r in refs:
+        d = r if isinstance(r, dict) else r.__dict__  # 同 styles：不走 ORM 属性访问；列没加载时取不到，按过期处理
+        out.append(d.get("gbt7714_cache") if d.get("format_version") == FORMATTER_VERSION else None)
+    stale = [i for i, s in enumerate(out) if s is None]
+    for i, s in zip(stale, _gbt.render_many([refs[i] for i in stale])):
+        out[i] = s
+    return out  # type: ignore[return-value]
+
+def apply_render(r: Reference) -> Reference:
+    # create/update/导入等写路径调用：把渲染结果写进缓存列
+    r.gbt7714_cache = format_gbt7714(r)
+    r.missing_cache = ",".join(missing_fields(r))
+    r.format_version = FORMATTER_VERSION
+    return r
+
+def rendered(r: Reference) -> Tuple[str, List[str]]:
+    # 缓存是当前版本就直接用，否则现算（后台重渲染完成前的兜底）
+    if r.format_version == FORMATTER_VERSION and r.gbt7714_cache is not None:
+        return r.gbt7714_cache, (r.missing_cache.split(",") if r.missing_cache else [])
+    return format_gbt7714(r), missing_fields(r)
+
+def rendered_values(d: Dict[str, Any], cache: Optional[str], missing: Optional[str], version: Optional[int]) -> Tuple[str, List[str]]:
+    # 同 rendered()，给列表接口按列查出的行用：d 是字段 dict，后三个是缓存列的值
+    if version == FORMATTER_VERSION and cache is not None:
+        return cache, (missing.split(",") if missing else [])
+    return _gbt.render(d), missing_fields(SimpleNamespace(**d))
+
+def _rerender_stmt():
+    # 条件写回：渲染用到的列和 format_version 都还是读出来时的值才写。
+    # 读和写之间有请求改了这一行（它自己会按当前版本重新渲染），这里就跳过，不会用旧内容盖掉新的缓存
+    t = Reference.__table__
+    cond = [t.c.id == bindparam("b_id"), t.c.format_version.is_not_distinct_from(bindparam("b_version"))]
+    cond += [t.c[f].is_not_distinct_from(bindparam(f"b_{f}")) for f in RENDER_INPUTS]
+    return update(t).where(*cond).values(
+        gbt7714_cache=bindparam("b_cache"), missing_cache=bindparam("b_missing"), format_version=FORMATTER_VERSION,
+        rev=bindparam("b_rev"), updated_at=bindparam("b_updated"),
+    )
+
+def rerender_stale(batch_size: int = 500, stop: Optional[threading.Event] = None) -> int:
+    # 分批把 format_version 不是当前版本的行重新渲染，返回实际写回的行数。
+    # 引用串变了也是一次写入：每批给涉及的用户各领一个库版本号写进 rev，增量同步的客户端才会拿到新格式。
+    # 在线程里跑，取消不了线程本身：进程退出时 set() stop，当前批次写完就返回
+    from .changes import next_stamps_sync  # changes 依赖本模块的 FORMATTER_VERSION
+
+    stmt = _rerender_stmt()
+    done = 0
+    last_id = 0
+    while stop is None or not stop.is_set():
+        with Session(engine) as session:
+            refs = session.exec(
+                select(Reference)
+                .where(Reference.id > last_id)
+                .where((Reference.format_version.is_(None)) | (Reference.format_version != FORMATTER_VERSION))
+                .order_by(Reference.id)
+                .limit(batch_size)
+            ).all()
+            if not refs:
+                return done
+            params = []
+            for r in refs:
+                p = {f"b_{f}": getattr(r, f) for f in RENDER_INPUTS}
+                p.update(b_id=r.id, b_version=r.format_version, b_cache=format_gbt7714(r), b_missing=",".join(missing_fields(r)))
+                p.update(b_rev=r.rev, b_updated=r.updated_at, b_user=r.user_id)
+                params.append(p)
+            last_id = refs[-1].id
+            session.expunge_all()
+            # 渲染完再领版本号：写锁只在这一小段里持有
+            stamps = next_stamps_sync(session, {p["b_user"] for p in params})
+            for p in params:
+                stamp = stamps.get(p.pop("b_user"))
+                if stamp:
+                    p.update(b_rev=stamp["rev"], b_updated=stamp["updated_at"])
+            done += session.connection().execute(stmt, params).rowcount
+            session.commit()
+    return done
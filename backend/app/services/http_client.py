@@ -0,0 +1,73 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+
+from .. import config
+
+if TYPE_CHECKING:
+    import httpx
+
+# 全局共享的 AsyncClient：第一次用到（或启动后的后台预热）时创建，lifespan 结束时关闭，
+# 所有上游元数据请求复用同一个连接池，避免每次查询都重新 TCP+TLS 握手。
+# httpx 导入要几十毫秒，放到函数里按需导入，不拖慢冷启动
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    # HTTP/2 需要可选依赖 h2（pip install "httpx[http2]"），没装就退回 HTTP/1.1
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def limits() -> httpx.Limits:
+    import httpx
+
+    return httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _build_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    # transport 给基准测试/测试用：把请求转到本地的假上游
+    import httpx
+
+    return httpx.AsyncClient(
+        http2=config.HTTP2 and _http2_available(),
+        limits=limits(),
+        transport=transport,
+        timeout=httpx.Timeout(10.0, connect=config.HTTP_CONNECT_TIMEOUT),
+        headers={"User-Agent": config.USER_AGENT},
+        follow_redirects=True,
+    )
+
+
+def source_timeout(source: str) -> httpx.Timeout:
+    import httpx
+
+    return httpx.Timeout(config.SOURCE_TIMEOUTS.get(source, 10.0), connect=config.HTTP_CONNECT_TIMEOUT)
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def use_transport(transport: httpx.AsyncBaseTransport) -> httpx.AsyncClient:
+    global _client
+    _client = _build_client(transport)
+    return _client
+
+
+def get_client() -> httpx.AsyncClient:
+    # 脚本/测试里没有走 lifespan 时按需创建
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
@@ -0,0 +1,278 @@
+from __future__ import annotations
+import codecs
+import re
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
+
+# RIS / BibTeX 流式解析：逐行读取，每解析完一条就 yield 一个 dict（字段名同 ReferenceCreate），
+# 整个文件不会一次性读进内存。解析失败的条目 yield {"_error": "..."}，由调用方写进导入报告。
+
+RIS_TYPES = {
+    "JOUR": "journal", "JFULL": "journal", "MGZN": "journal", "NEWS": "journal",
+    "BOOK": "book", "CHAP": "book", "EBOOK": "book", "EDBOOK": "book",
+    "ELEC": "web", "WEB": "web", "BLOG": "web",
+}
+
+BIBTEX_TYPES = {
+    "article": "journal",
+    "book": "book", "inbook": "book", "incollection": "book",
+    "online": "web", "electronic": "web", "www": "web",
+}
+
+SNIFF_CHUNK = 1 << 16
+REPLACEMENT = "\ufffd"
+
+_RIS_LINE = re.compile(r"^([A-Z][A-Z0-9])  -(?: (.*))?$")
+_YEAR = re.compile(r"(\d{4})")
+
+
+def detect_format(filename: Optional[str], first_line: str) -> Optional[str]:
+    name = (filename or "").lower()
+    if name.endswith(".ris"):
+        return "ris"
+    if name.endswith((".bib", ".bibtex")):
+        return "bibtex"
+    head = first_line.lstrip("﻿").strip()
+    if _RIS_LINE.match(head):
+        return "ris"
+    if head.startswith("@"):
+        return "bibtex"
+    return None
+
+
+def sniff_encoding(f: IO[bytes]) -> str:
+    # 整个文件都是合法 UTF-8 才按 UTF-8 读，否则按 GB18030（GBK/GB2312 的超集，国内导出工具常见）。
+    # 分块解码只做校验，读完退回开头；上传文件落在临时文件里，可以 seek
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while True:
+            chunk = f.read(SNIFF_CHUNK)
+            if not chunk:
+                decoder.decode(b"", final=True)
+                return "utf-8-sig"
+            decoder.decode(chunk)
+    except UnicodeDecodeError:
+        return "gb18030"
+    finally:
+        f.seek(0)
+
+
+def _year(v: Optional[str]) -> Optional[int]:
+    m = _YEAR.search(v or "")
+    return int(m.group(1)) if m else None
+
+
+def _clean(v: Optional[str]) -> Optional[str]:
+    v = (v or "").strip()
+    return v or None
+
+
+def _ris_entry(tags: Dict[str, List[str]]) -> Dict[str, Any]:
+    def first(*keys: str) -> Optional[str]:
+        for k in keys:
+            for v in tags.get(k) or []:
+                if v.strip():
+                    return v.strip()
+        return None
+
+    ref_type = RIS_TYPES.get((first("TY") or "").upper(), "other")
+    authors = [a.strip() for k in ("AU", "A1") for a in tags.get(k) or [] if a.strip()]
+    sp, ep = first("SP"), first("EP")
+    pages = f"{sp}-{ep}" if sp and ep else (sp or ep)
+    return {
+        "ref_type": ref_type,
+        "title": first("TI", "T1", "CT", "BT"),
+        "authors": "; ".join(authors),
+        "year": _year(first("PY", "Y1", "DA")),
+        "journal": first("JF", "JO", "T2", "JA", "J2") if ref_type != "book" else None,
+        "volume": first("VL"),
+        "issue": first("IS"),
+        "pages": pages,
+        "publisher": first("PB"),
+        # SN 在期刊里是 ISSN，只有图书才当 ISBN
+        "isbn": first("SN") if ref_type == "book" else None,
+        "doi": first("DO"),
+        "url": first("UR", "L2"),
+        "accessed_at": first("Y2"),
+    }
+
+
+def iter_ris(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    tags: Dict[str, List[str]] = {}
+    last: Optional[str] = None
+    for raw in lines:
+        line = raw.lstrip("﻿").rstrip("\r\n")
+        m = _RIS_LINE.match(line)
+        if not m:
+            # 续行：拼到上一个字段后面
+            if last and line.strip() and tags.get(last):
+                tags[last][-1] += " " + line.strip()
+            continue
+        tag, value = m.group(1), (m.group(2) or "")
+        if tag == "TY":
+            tags = {}
+        if tag == "ER":
+            if tags:
+                yield _ris_entry(tags)
+            tags, last = {}, None
+            continue
+        tags.setdefault(tag, []).append(value)
+        last = tag
+    if tags:
+        # 文件末尾缺 ER 的也收下
+        yield _ris_entry(tags)
+
+
+def _strip_braces(v: str) -> str:
+    # 去掉分组用的大括号，保留转义的 \{ \}
+    v = re.sub(r"(?<!\\)[{}]", "", v).replace("\\{", "{").replace("\\}", "}")
+    return re.sub(r"\s+", " ", v).strip()
+
+
+def _bibtex_fields(body: str) -> Dict[str, str]:
+    # body 是 "key, field = {value}, field2 = "value", year = 2020" 这一段
+    fields: Dict[str, str] = {}
+    n = len(body)
+    comma = body.find(",")
+    if comma < 0:
+        return fields
+    i = comma + 1
+    while i < n:
+        eq = body.find("=", i)
+        if eq < 0:
+            break
+        name = body[i:eq].strip().strip(",").strip().lower()
+        j = eq + 1
+        while j < n and body[j].isspace():
+            j += 1
+        if j >= n:
+            break
+        if body[j] == "{":
+            depth, k = 0, j
+            while k < n:
+                if body[k] == "\\":
+                    k += 2  # 转义的 \{ \} 不算分组
+                    continue
+                if body[k] == "{":
+                    depth += 1
+                elif body[k] == "}":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                k += 1
+            value, i = body[j + 1:k], k + 1
+        elif body[j] == '"':
+            k = j + 1
+            depth = 0
+            while k < n and not (body[k] == '"' and depth == 0):
+                if body[k] == "\\":
+                    k += 2
+                    continue
+                if body[k] == "{":
+                    depth += 1
+                elif body[k] == "}":
+                    depth -= 1
+                k += 1
+            value, i = body[j + 1:k], k + 1
+        else:
+            k = body.find(",", j)
+            k = n if k < 0 else k
+            value, i = body[j:k], k
+        if name:
+            fields[name] = _strip_braces(value)
+        comma = body.find(",", i)
+        if comma < 0:
+            break
+        i = comma + 1
+    return fields
+
+
+def _bibtex_entry(kind: str, body: str) -> Dict[str, Any]:
+    f = _bibtex_fields(body)
+    ref_type = BIBTEX_TYPES.get(kind, "other")
+    if ref_type == "other" and kind == "misc" and f.get("url"):
+        ref_type = "web"
+    authors = [a.strip() for a in re.split(r"\s+and\s+", f.get("author") or "") if a.strip()]
+    pages = f.get("pages")
+    return {
+        "ref_type": ref_type,
+        "title": _clean(f.get("title")),
+        "authors": "; ".join(authors),
+        "year": _year(f.get("year") or f.get("date")),
+        "journal": _clean(f.get("journal") or f.get("journaltitle")),
+        "volume": _clean(f.get("volume")),
+        "issue": _clean(f.get("number") or f.get("issue")),
+        "pages": pages.replace("--", "-") if pages else None,
+        "publisher": _clean(f.get("publisher")),
+        "isbn": _clean(f.get("isbn")),
+        "doi": _clean(f.get("doi")),
+        "url": _clean(f.get("url")),
+        "accessed_at": _clean(f.get("urldate")),
+    }
+
+
+def _scan_entry(line: str, state: List[Any]) -> int:
+    # 在一行里找当前条目的结束位置，找不到返回 -1；state = [结束符, 大括号深度, 是否在引号里]，跨行保留。
+    # @type 后第一个 { 或 ( 决定结束符：{...} 条目在深度 0 的 } 结束，(...) 条目在深度 0、引号外的 ) 结束；
+    # 反斜杠转义的字符（\{ \}）不计入深度
+    close, depth, quoted = state
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i]
+        if c == "\\":
+            i += 2
+            continue
+        if close is None:
+            if c in "{(":
+                close = "}" if c == "{" else ")"
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            if depth == 0 and close == "}":
+                return i
+            depth -= 1
+        elif depth == 0 and close == ")":
+            if c == '"':
+                quoted = not quoted
+            elif c == ")" and not quoted:
+                return i
+        i += 1
+    state[:] = [close, depth, quoted]
+    return -1
+
+
+def _bibtex_text(text: str) -> Optional[Dict[str, Any]]:
+    # 一整条 "@type{...}" / "@type(...)"；@comment 等不是文献的返回 None
+    m = re.match(r"@\s*(\w+)\s*[{(]", text)
+    if not m:
+        return {"_error": "Malformed BibTeX entry"}
+    kind = m.group(1).lower()
+    if kind in ("comment", "preamble", "string"):
+        return None
+    return _bibtex_entry(kind, text[m.end():-1])
+
+
+def iter_bibtex(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    # 按行累积，直到当前条目闭合（见 _scan_entry）；条目之间的文字忽略，一行里结束一条又开始下一条也能拆开
+    buf: List[str] = []
+    state: Optional[List[Any]] = None
+    for raw in lines:
+        line = raw.lstrip("\ufeff")
+        while line:
+            if state is None:
+                at = line.find("@")
+                if at < 0:
+                    break
+                line = line[at:]
+                state = [None, 0, False]
+            end = _scan_entry(line, state)
+            if end < 0:
+                buf.append(line)
+                break
+            buf.append(line[:end + 1])
+            line = line[end + 1:]
+            entry = _bibtex_text("".join(buf).strip())
+            buf, state = [], None
+            if entry is not None:
+                yield entry
+    if state is not None and buf:
+        yield {"_error": "Unterminated BibTeX entry"}
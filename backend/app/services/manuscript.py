@@ -0,0 +1,322 @@
+from __future__ import annotations
+import asyncio
+import io
+import re
+import unicodedata
+import zipfile
+from collections import Counter, defaultdict
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from .dedupe import _jaccard, first_author_tokens, normalize_title, shingles
+from .doi_resolver import normalize_doi
+from .formatter import format_gbt7714, rendered
+from ..models import Reference
+
+# 稿件参考文献核查（POST /check）：
+# 1. 拆条目：按 [1] / 1. / 1) 编号切分，续行并进上一条；没有编号时每段一条
+# 2. 抽字段：DOI、题名、年份、作者（GB/T 7714 的 [J]/[M] 标记、APA 的 (2020) 两种写法，其余按 ". " 粗分）
+# 3. 匹配文献库：先按规范化 DOI 精确匹配，再用标题 3-gram 倒排索引找候选、按 Jaccard 取最像的
+# 4. 库里没有但带 DOI 的条目并发查元数据（走 DOI 缓存、熔断和限速）；
+#    查到是 not_in_library，查不到是 not_found，resolve=false 不查时是 unresolved
+# 5. 逐字段比对，并给出按 format_gbt7714 应写成的样子
+# 库内匹配的条目立即产出，需要查上游的谁先查完谁先产出。
+
+TITLE_MATCH = 0.7
+MAX_POSTING = 200  # 出现在太多标题里的 shingle 不参与候选打分
+MAX_CANDIDATES = 5
+
+_DOI = re.compile(r"10\.\d{4,9}/[^\s,;，；]+", re.IGNORECASE)
+_NUMBERED = re.compile(r"^\s*(?:[\[［]\s*(\d{1,4})\s*[\]］]|(\d{1,4})\s*[.)．、）](?=\s|\D))\s*")
+_HEADING = re.compile(r"^\s*(参考文献|references|bibliography|works cited)\s*[:：]?\s*$", re.IGNORECASE)
+_TYPE_MARK = re.compile(r"\[(?:J|M|C|D|R|S|P|N|G|Z|A|EB|DB|CP|J/OL|M/OL|C/OL|EB/OL|DB/OL|CP/OL|N/OL)\]")
+_GBT_JOURNAL = re.compile(
+    r"^[.．]\s*(?P<journal>[^,，]+)[,，]\s*(?P<year>\d{4})[a-z]?\s*"
+    r"(?:[,，]\s*(?P<volume>[^(（:：.,，]*)\s*(?:[(（](?P<issue>[^)）]*)[)）])?)?"
+    r"\s*(?:[:：]\s*(?P<pages>[\dA-Za-z]+(?:\s*[-–—~]\s*[\dA-Za-z]+)?))?"
+)
+_GBT_BOOK = re.compile(r"^[.．]\s*(?:[^:：,，]+[:：])?\s*(?P<publisher>[^,，]+)[,，]\s*(?P<year>\d{4})")
+_APA = re.compile(r"^(?P<authors>.+?)\s*[(（](?P<year>\d{4})[a-z]?[^)）]*[)）][.．]?\s*(?P<title>[^.．?？!！]+[?？!！]?)")
+_YEAR = re.compile(r"(?<!\d)(1[89]\d{2}|20\d{2})(?!\d)")
+_SPACE = re.compile(r"\s+")
+_AUTHOR_SEP = re.compile(r"[;；,，、]|\s+and\s+|\s*&\s*")
+
+TYPE_OF_MARK = {"J": "journal", "M": "book", "EB/OL": "web"}
+
+
+# ---- 读取与拆分 ----
+
+def docx_paragraphs(data: bytes) -> List[str]:
+    # .docx 是 zip 里的 word/document.xml：按 <w:p> 取段落，<w:t> 拼文字，<w:tab>/<w:br> 当空白
+    from xml.etree import ElementTree
+
+    ns = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        root = ElementTree.fromstring(z.read("word/document.xml"))
+    out = []
+    for p in root.iter(f"{ns}p"):
+        parts = []
+        for node in p.iter():
+            if node.tag == f"{ns}t":
+                parts.append(node.text or "")
+            elif node.tag in (f"{ns}tab", f"{ns}br"):
+                parts.append(" ")
+        out.append("".join(parts))
+    return out
+
+
+def split_entries(lines: Iterable[str]) -> List[str]:
+    entries: List[str] = []
+    numbered = False
+    current: List[str] = []
+    plain: List[str] = []
+    for raw in lines:
+        line = raw.strip()
+        if not line or _HEADING.match(line):
+            if current and not numbered:
+                plain.append(" ".join(current))
+                current = []
+            continue
+        m = _NUMBERED.match(line)
+        if m:
+            if current:
+                entries.append(" ".join(current))
+            numbered = True
+            current = [line[m.end():]]
+        elif numbered and current:
+            # 编号条目被换行断开：续到上一条
+            current.append(line)
+        else:
+            plain.append(line)
+    if current:
+        entries.append(" ".join(current))
+    # 没有编号时每行/每段一条
+    return [_SPACE.sub(" ", e).strip() for e in (entries if numbered else plain) if e.strip()]
+
+
+# ---- 抽字段 ----
+
+def _strip(v: Optional[str]) -> Optional[str]:
+    v = (v or "").strip().strip(".．,，;；:：").strip()
+    return v or None
+
+
+def parse_entry(text: str) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"ref_type": None, "doi": None, "title": None, "authors": None, "year": None}
+    m = _DOI.search(text)
+    body = text
+    if m:
+        out["doi"] = normalize_doi(m.group(0).rstrip(".)]）】>"))
+        # DOI 前面常带 "DOI:" / "https://doi.org/"
+        body = re.sub(r"(?:DOI\s*[:：]?\s*|https?://(?:dx\.)?doi\.org/)?$", "", text[:m.start()], flags=re.IGNORECASE).rstrip()
+
+    mark = _TYPE_MARK.search(body)
+    if mark:
+        # GB/T 7714：作者. 题名[J]. 刊名, 年, 卷(期): 页码.
+        code = mark.group(0)[1:-1]
+        out["ref_type"] = TYPE_OF_MARK.get(code, "other")
+        head = body[:mark.start()]
+        authors, title = _split_head(head)
+        out["authors"], out["title"] = _strip(authors), _strip(title)
+        tail = body[mark.end():]
+        if out["ref_type"] == "journal":
+            jm = _GBT_JOURNAL.match(tail)
+            if jm:
+                out.update({k: _strip(v) for k, v in jm.groupdict().items() if k != "year"})
+                out["year"] = int(jm.group("year"))
+        elif out["ref_type"] == "book":
+            bm = _GBT_BOOK.match(tail)
+            if bm:
+                out["publisher"] = _strip(bm.group("publisher"))
+                out["year"] = int(bm.group("year"))
+    else:
+        am = _APA.match(body)
+        if am:
+            out["authors"], out["title"] = _strip(am.group("authors")), _strip(am.group("title"))
+            out["year"] = int(am.group("year"))
+        else:
+            authors, title = _split_head(body)
+            out["authors"], out["title"] = _strip(authors), _strip(title)
+    if out["year"] is None:
+        years = _YEAR.findall(body)
+        out["year"] = int(years[-1]) if years else None
+    return out
+
+
+def _split_head(head: str) -> Tuple[str, str]:
+    # "作者. 题名" → (作者, 题名)；只有一段时当作题名
+    parts = re.split(r"[.．]\s+|[.．](?=[^\s\w])", head.strip(), maxsplit=1)
+    if len(parts) == 2 and parts[1].strip():
+        title = re.split(r"[.．]\s+", parts[1], maxsplit=1)[0]
+        return parts[0], title
+    return "", head
+
+
+# ---- 文献库索引 ----
+
+class LibraryIndex:
+    def __init__(self, refs: Iterable[Reference]):
+        self.refs: Dict[int, Reference] = {}
+        self.by_doi: Dict[str, int] = {}
+        self.sigs: Dict[int, Set[int]] = {}
+        self.norm_titles: Dict[str, int] = {}
+        postings: Dict[int, List[int]] = defaultdict(list)
+        for r in refs:
+            self.refs[r.id] = r
+            if r.doi and r.doi.strip():
+                self.by_doi.setdefault(normalize_doi(r.doi).lower(), r.id)
+            norm = normalize_title(r.title)
+            if norm:
+                self.norm_titles.setdefault(norm, r.id)
+                sh = shingles(norm)
+                self.sigs[r.id] = sh
+                for h in sh:
+                    postings[h].append(r.id)
+        self.postings = {h: ids for h, ids in postings.items() if len(ids) <= MAX_POSTING}
+
+    def match(self, parsed: Dict[str, Any]) -> Optional[Tuple[Reference, str, float]]:
+        # 返回 (文献, 匹配方式 doi/title, 相似度)
+        doi = parsed.get("doi")
+        if doi and doi.lower() in self.by_doi:
+            return self.refs[self.by_doi[doi.lower()]], "doi", 1.0
+        norm = normalize_title(parsed.get("title"))
+        if not norm:
+            return None
+        if norm in self.norm_titles:
+            return self.refs[self.norm_titles[norm]], "title", 1.0
+        sh = shingles(norm)
+        votes: Counter = Counter()
+        for h in sh:
+            votes.update(self.postings.get(h, ()))
+        best, best_score = None, 0.0
+        for rid, _ in votes.most_common(MAX_CANDIDATES):
+            score = _jaccard(sh, self.sigs[rid])
+            if score > best_score:
+                best, best_score = rid, score
+        if best is None or best_score < TITLE_MATCH:
+            return None
+        return self.refs[best], "title", round(best_score, 3)
+
+
+# ---- 比对 ----
+
+def _norm_text(s: Optional[str]) -> str:
+    return _SPACE.sub(" ", unicodedata.normalize("NFKC", s or "")).strip().rstrip(".")
+
+
+def _first_author(authors: Optional[str]) -> str:
+    # 各种分隔写法里的第一作者："张三; 李四"、"ZHANG S, LI S"、"Zhang, S., & Li, S."
+    return normalize_title(_AUTHOR_SEP.split(authors or "", maxsplit=1)[0])
+
+
+def _same_author(a: Optional[str], b: Optional[str]) -> bool:
+    fa, fb = _first_author(a), _first_author(b)
+    if not fa or not fb or fa in fb or fb in fa:
+        return True
+    # 名/姓顺序不同、缩写："San Zhang" 对 "Zhang San"、"Zhang S"
+    return bool(first_author_tokens(a) & first_author_tokens(b))
+
+
+def diff_fields(parsed: Dict[str, Any], expected: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # 只比较条目里确实写了、且期望值也有的字段
+    diffs = []
+
+    def add(field: str) -> None:
+        diffs.append({"field": field, "entry": parsed.get(field), "expected": expected.get(field)})
+
+    if parsed.get("doi") and expected.get("doi") and normalize_doi(parsed["doi"]).lower() != normalize_doi(expected["doi"]).lower():
+        add("doi")
+    if parsed.get("title") and expected.get("title"):
+        a, b = normalize_title(parsed["title"]), normalize_title(expected["title"])
+        if a != b and _jaccard(shingles(a), shingles(b)) < 0.9:
+            add("title")
+    if parsed.get("year") and expected.get("year") and int(parsed["year"]) != int(expected["year"]):
+        add("year")
+    if parsed.get("authors") and expected.get("authors") and not _same_author(parsed["authors"], expected["authors"]):
+        add("authors")
+    for field in ("journal", "volume", "issue", "pages"):
+        if parsed.get(field) and expected.get(field) and normalize_title(parsed[field]) != normalize_title(str(expected[field])):
+            add(field)
+    return diffs
+
+
+def _ref_fields(r: Reference) -> Dict[str, Any]:
+    return {k: getattr(r, k) for k in ("doi", "title", "authors", "year", "journal", "volume", "issue", "pages")}
+
+
+def library_verdict(index: int, text: str, parsed: Dict[str, Any], ref: Reference, by: str, score: float) -> Dict[str, Any]:
+    expected, _ = rendered(ref)
+    diffs = diff_fields(parsed, _ref_fields(ref))
+    format_ok = _norm_text(text) == _norm_text(expected)
+    status = "mismatch" if diffs else ("ok" if format_ok else "format")
+    return {
+        "index": index, "status": status, "text": text, "parsed": parsed,
+        "match": {"ref_id": ref.id, "by": by, "score": score},
+        "diffs": diffs, "expected": expected, "format_ok": format_ok,
+    }
+
+
+def resolved_verdict(index: int, text: str, parsed: Dict[str, Any], data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not data:
+        return {"index": index, "status": "not_found", "text": text, "parsed": parsed, "match": None, "diffs": []}
+    # 用查到的元数据（缺的用条目里抽出的补上）拼一条临时 Reference，按 GB/T 7714 格式化
+    fields = {k: data.get(k) or parsed.get(k) for k in ("title", "authors", "year", "journal", "volume", "issue", "pages", "doi")}
+    ref_type = parsed.get("ref_type") or ("journal" if fields.get("journal") else "other")
+    try:
+        year = int(fields["year"]) if fields.get("year") else None
+    except (TypeError, ValueError):
+        year = None
+    ref = Reference(
+        user_id=0, ref_type=ref_type, title=fields.get("title") or "", authors=fields.get("authors") or "",
+        year=year, journal=fields.get("journal"), volume=fields.get("volume"), issue=fields.get("issue"),
+        pages=fields.get("pages"), doi=fields.get("doi"),
+    )
+    expected = format_gbt7714(ref)
+    return {
+        "index": index, "status": "not_in_library", "text": text, "parsed": parsed, "match": None,
+        "source": data.get("source", "crossref"), "diffs": diff_fields(parsed, {**fields, "year": year}),
+        "expected": expected, "format_ok": _norm_text(text) == _norm_text(expected),
+    }
+
+
+async def check_entries(
+    entries: List[str], library: LibraryIndex, concurrency: int, resolve: bool = True
+) -> AsyncIterator[Dict[str, Any]]:
+    from .enrichment import lookup_metadata
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def resolve_one(i: int, text: str, parsed: Dict[str, Any]) -> Dict[str, Any]:
+        async with sem:
+            try:
+                data, _ = await lookup_metadata(parsed["doi"])
+            except Exception:
+                data = None
+        return resolved_verdict(i, text, parsed, data)
+
+    immediate: List[Dict[str, Any]] = []
+    tasks: List["asyncio.Task[Dict[str, Any]]"] = []
+    for i, text in enumerate(entries):
+        parsed = parse_entry(text)
+        hit = library.match(parsed)
+        if hit is not None:
+            immediate.append(library_verdict(i, text, parsed, *hit))
+        elif parsed.get("doi") and resolve:
+            # 先把上游查询都发出去，产出库内结果的同时它们已经在跑
+            tasks.append(asyncio.create_task(resolve_one(i, text, parsed)))
+        else:
+            # 有 DOI 但没查上游（resolve=false）：不知道 DOI 是否存在，记 unresolved，不能说 not_found
+            immediate.append({
+                "index": i, "status": "unresolved" if parsed.get("doi") else "unmatched",
+                "text": text, "parsed": parsed, "match": None, "diffs": [],
+            })
+    try:
+        for v in immediate:
+            yield v
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+        # 等取消真正落地，别把还在收尾的任务留给事件循环（否则会有 "Task was destroyed but it is pending"）
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,231 @@
+from __future__ import annotations
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .. import config
+
+# 进程内指标：按路由的延迟直方图和状态码计数、每个上游来源的耗时和结果、SQL 查询数和耗时。
+# 全部是普通 dict 里的整数/浮点累加（单线程事件循环 + GIL，不加锁），开着跑压测也几乎没有开销。
+# /metrics 以 Prometheus 文本格式输出；CITECHECK_SLOW_REQUEST_MS > 0 时慢请求会打一条带分解的日志。
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+log = logging.getLogger("citecheck.metrics")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一格是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+
+class RequestStats:
+    # 当前请求的分解：SQL 次数/耗时、上游调用列表（慢请求日志用）
+    __slots__ = ("db_count", "db_time", "upstream")
+
+    def __init__(self) -> None:
+        self.db_count = 0
+        self.db_time = 0.0
+        self.upstream: List[Tuple[str, str, float]] = []
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("citecheck_request_stats", default=None)
+
+http_requests: Dict[Tuple[str, str, int], int] = {}
+http_latency: Dict[Tuple[str, str], Histogram] = {}
+upstream_results: Dict[Tuple[str, str], int] = {}
+upstream_latency: Dict[str, Histogram] = {}
+db_queries: Dict[str, int] = {}
+db_seconds: Dict[str, float] = {}
+db_latency = Histogram(DB_BUCKETS)
+
+
+def _hist(store: Dict[Any, Histogram], key: Any, buckets: Tuple[float, ...]) -> Histogram:
+    h = store.get(key)
+    if h is None:
+        h = store[key] = Histogram(buckets)
+    return h
+
+
+# ---- 上游 ----
+
+def observe_upstream(source: str, seconds: float, outcome: str) -> None:
+    # outcome: hit / miss(404) / error / timeout / cancelled / throttled(429) / open(熔断器直接拒绝，没发请求)
+    if not config.METRICS_ENABLED:
+        return
+    if outcome != "open":
+        _hist(upstream_latency, source, LATENCY_BUCKETS).observe(seconds)
+    key = (source, outcome)
+    upstream_results[key] = upstream_results.get(key, 0) + 1
+    stats = _current.get()
+    if stats is not None:
+        stats.upstream.append((source, outcome, seconds))
+
+
+# ---- SQLAlchemy ----
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    db_latency.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.db_count += 1
+        stats.db_time += elapsed
+
+
+def _handle_error(context) -> None:
+    # 出错的语句不会走到 after_cursor_execute，把起始时间弹掉
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(sync_engine) -> None:
+    if not config.METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+# ---- HTTP ----
+
+def _route_of(scope: Dict[str, Any]) -> str:
+    # 用路由模板（/references/{ref_id}）而不是实际路径，避免标签数量爆炸
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _record_request(method: str, route: str, status: int, elapsed: float, stats: RequestStats) -> None:
+    key = (method, route, status)
+    http_requests[key] = http_requests.get(key, 0) + 1
+    _hist(http_latency, (method, route), LATENCY_BUCKETS).observe(elapsed)
+    if stats.db_count:
+        db_queries[route] = db_queries.get(route, 0) + stats.db_count
+        db_seconds[route] = db_seconds.get(route, 0.0) + stats.db_time
+
+    if config.SLOW_REQUEST_MS > 0 and elapsed * 1000 >= config.SLOW_REQUEST_MS:
+        upstream = ", ".join(f"{s}={o}:{t * 1000:.0f}ms" for s, o, t in stats.upstream) or "-"
+        log.warning(
+            "slow request %s %s -> %s in %.0fms (db: %d queries %.0fms; upstream: %s)",
+            method, route, status, elapsed * 1000, stats.db_count, stats.db_time * 1000, upstream,
+        )
+
+
+class MetricsMiddleware:
+    # 纯 ASGI 中间件：不包装请求体/响应体，流式响应照常流式
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            _current.reset(token)
+            _record_request(scope["method"], _route_of(scope), status, elapsed, stats)
+
+
+# ---- Prometheus 文本格式 ----
+
+def _labels(**kv: Any) -> str:
+    parts = []
+    for k, v in kv.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _histogram_lines(name: str, labels: Dict[str, Any], h: Histogram) -> Iterable[str]:
+    acc = 0
+    for le, c in zip(h.buckets, h.counts):
+        acc += c
+        yield f"{name}_bucket{_labels(**labels, le=le)} {acc}"
+    yield f"{name}_bucket{_labels(**labels, le='+Inf')} {h.count}"
+    yield f"{name}_sum{_labels(**labels) if labels else ''} {h.sum}"
+    yield f"{name}_count{_labels(**labels) if labels else ''} {h.count}"
+
+
+def render(
+    extra_counters: Optional[Dict[str, float]] = None,
+    extra_gauges: Optional[Dict[str, float]] = None,
+    extra_lines: Optional[List[str]] = None,
+) -> str:
+    # extra_lines：其他模块自己拼好的带标签指标（含 HELP/TYPE 行），原样追加
+    lines: List[str] = []
+
+    def header(name: str, kind: str, help_: str) -> None:
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    header("citecheck_http_requests_total", "counter", "HTTP requests by route and status.")
+    for (method, route, status), n in sorted(http_requests.items()):
+        lines.append(f"citecheck_http_requests_total{_labels(method=method, route=route, status=status)} {n}")
+
+    header("citecheck_http_request_duration_seconds", "histogram", "HTTP request latency by route.")
+    for (method, route), h in sorted(http_latency.items()):
+        lines.extend(_histogram_lines("citecheck_http_request_duration_seconds", {"method": method, "route": route}, h))
+
+    header("citecheck_upstream_requests_total", "counter", "Upstream metadata requests by source and outcome.")
+    for (source, outcome), n in sorted(upstream_results.items()):
+        lines.append(f"citecheck_upstream_requests_total{_labels(source=source, outcome=outcome)} {n}")
+
+    header("citecheck_upstream_request_duration_seconds", "histogram", "Upstream metadata request latency by source.")
+    for source, h in sorted(upstream_latency.items()):
+        lines.extend(_histogram_lines("citecheck_upstream_request_duration_seconds", {"source": source}, h))
+
+    header("citecheck_db_queries_total", "counter", "SQL statements executed, by HTTP route.")
+    for route, n in sorted(db_queries.items()):
+        lines.append(f"citecheck_db_queries_total{_labels(route=route)} {n}")
+
+    header("citecheck_db_seconds_total", "counter", "Time spent in SQL statements, by HTTP route.")
+    for route, s in sorted(db_seconds.items()):
+        lines.append(f"citecheck_db_seconds_total{_labels(route=route)} {s}")
+
+    header("citecheck_db_query_duration_seconds", "histogram", "SQL statement latency.")
+    lines.extend(_histogram_lines("citecheck_db_query_duration_seconds", {}, db_latency))
+
+    for kind, extra in (("counter", extra_counters), ("gauge", extra_gauges)):
+        for name, v in sorted((extra or {}).items()):
+            if v is None:
+                continue
+            header(name, kind, name.replace("_", " ") + ".")
+            lines.append(f"{name} {v}")
+    lines.extend(extra_lines or [])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,53 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from .. import config
+
+# 按上游主机限速的令牌桶：批量解析时并发再高，也不会超过各 API 的速率限制
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        # 拿锁排队，保证先来先得；等待中被取消不会消耗令牌
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+
+
+def bucket_for(url: str) -> Optional[TokenBucket]:
+    host = urlsplit(url).hostname or ""
+    bucket = _buckets.get(host)
+    if bucket is None:
+        rate = config.HOST_RATE_LIMITS.get(host, 0)
+        if rate <= 0:
+            return None
+        bucket = _buckets[host] = TokenBucket(rate)
+    return bucket
+
+
+async def throttle(url: str) -> None:
+    bucket = bucket_for(url)
+    if bucket is not None:
+        await bucket.acquire()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+import json
+import zlib
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+from .. import config
+from .static_files import accepts_encoding
+
+# 响应序列化与压缩：
+# - JSONBody 是全局默认响应类：装了 orjson 就用它直接出 bytes（datetime 原生支持），没装退回标准库 json，输出一致
+# - 热点列表接口直接从查询出的行元组拼 dict 交给 JSONBody，不走 SQLModel → model_dump → jsonable_encoder
+# - CompressionMiddleware：超过 COMPRESS_MIN_SIZE 的 JSON/文本响应按 Accept-Encoding 压缩，
+#   br 需要可选依赖 brotli，没装就只协商 gzip；流式响应逐块压缩并 flush，NDJSON 照样边算边发
+
+
+def _orjson():
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+_orjson_mod = _orjson()
+_brotli_mod = _brotli()
+
+
+def _default(obj: Any) -> Any:
+    # 标准库 json 的兜底：和 orjson / jsonable_encoder 一样输出 ISO 时间
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if _orjson_mod is not None:
+        return _orjson_mod.dumps(content, option=_orjson_mod.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class JSONBody(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_backend() -> str:
+    return "orjson" if _orjson_mod is not None else "json"
+
+
+# ---- 压缩 ----
+
+_COMPRESSIBLE = ("text/", "application/json", "application/x-ndjson", "+json", "javascript", "xml",
+                 "application/x-bibtex", "application/x-research-info-systems")
+
+
+def encodings() -> List[str]:
+    # 服务端支持的编码，优先级从高到低
+    return (["br"] if _brotli_mod is not None else []) + ["gzip"]
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    for enc in encodings():
+        if accepts_encoding(accept_encoding, enc):
+            return enc
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._c = _brotli_mod.Compressor(quality=config.BROTLI_QUALITY)
+            self._feed, self._flush, self._finish = self._c.process, self._c.flush, self._c.finish
+        else:
+            self._c = zlib.compressobj(config.GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31：gzip 封装
+            self._feed = self._c.compress
+            self._flush = lambda: self._c.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._c.flush
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._feed(data) + self._flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._feed(data) + self._finish()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    return _Compressor(encoding).finish(data)
+
+
+def _compressible(status: int, headers: Headers) -> bool:
+    if status < 200 or status in (204, 206, 304) or "content-encoding" in headers:
+        return False
+    ctype = headers.get("content-type", "")
+    return any(t in ctype for t in _COMPRESSIBLE)
+
+
+class CompressionMiddleware:
+    # 纯 ASGI 中间件：等到第一块响应体才决定压不压（小响应、已压缩、二进制类型原样发）
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.COMPRESS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Dict[str, Any]] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                # http.response.pathsend 之类的扩展：不碰
+                passthrough = True
+                if start is not None:
+                    await send(start)
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                if not _compressible(start["status"], headers) or (not more and len(body) < config.COMPRESS_MIN_SIZE):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # 压缩后的字节和原来不同，强 ETag 改成弱的
+                    headers["ETag"] = f"W/{etag}"
+                if more:
+                    del headers["Content-Length"]
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressor.chunk(body), "more_body": True})
+                else:
+                    data = compressor.finish(body)
+                    headers["Content-Length"] = str(len(data))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": data})
+                return
+            await send({
+                "type": "http.response.body",
+                "body": compressor.chunk(body) if more else compressor.finish(body),
+                "more_body": more,
+            })
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# 文献全文检索：SQLite FTS5 外部内容表 reference_fts，对 title/authors/journal/publisher 建索引，
+# 由触发器与 reference 表保持同步（导入的批量 INSERT 也会触发）。
+# 分词用 trigram：中文没有空格，按三字切分才能做子串匹配。trigram 要求检索词至少 3 个字符，
+# 更短的词（如两个字的人名 "张三"）退回 LIKE 过滤。非 SQLite 或不支持 trigram 时整体退回 LIKE。
+
+FTS_COLUMNS = ["title", "authors", "journal", "publisher"]
+# bm25 列权重：标题最重要
+BM25_WEIGHTS = "10.0, 5.0, 2.0, 1.0"
+
+fts_enabled = False
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS reference_fts USING fts5(
+        {", ".join(FTS_COLUMNS)},
+        content='reference', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS reference_fts_ai AFTER INSERT ON reference BEGIN
+        INSERT INTO reference_fts(rowid, {", ".join(FTS_COLUMNS)})
+        VALUES (new.id, {", ".join("new." + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS reference_fts_ad AFTER DELETE ON reference BEGIN
+        INSERT INTO reference_fts(reference_fts, rowid, {", ".join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {", ".join("old." + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS reference_fts_au AFTER UPDATE OF {", ".join(FTS_COLUMNS)} ON reference BEGIN
+        INSERT INTO reference_fts(reference_fts, rowid, {", ".join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {", ".join("old." + c for c in FTS_COLUMNS)});
+        INSERT INTO reference_fts(rowid, {", ".join(FTS_COLUMNS)})
+        VALUES (new.id, {", ".join("new." + c for c in FTS_COLUMNS)});
+    END""",
+]
+
+
+def ensure_fts(engine: Engine) -> bool:
+    global fts_enabled
+    if engine.dialect.name != "sqlite":
+        fts_enabled = False
+        return False
+    try:
+        with engine.begin() as conn:
+            names = set(conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE name IN "
+                "('reference_fts', 'reference_fts_ai', 'reference_fts_ad', 'reference_fts_au')"
+            )).scalars())
+            if len(names) == 4:
+                # 表和触发器都在：启动时不再执行 DDL
+                fts_enabled = True
+                return True
+            existed = "reference_fts" in names
+            for ddl in _DDL:
+                conn.execute(text(ddl))
+            if not existed:
+                # 第一次建表：把已有数据灌进索引
+                conn.execute(text("INSERT INTO reference_fts(reference_fts) VALUES ('rebuild')"))
+    except OperationalError:
+        # SQLite 太旧（< 3.34）没有 trigram 分词器
+        fts_enabled = False
+        return False
+    fts_enabled = True
+    return True
+
+
+def _split_terms(q: str) -> Tuple[List[str], List[str]]:
+    terms = [t for t in re.split(r"\s+", q.strip()) if t]
+    if not fts_enabled:
+        return [], terms
+    return [t for t in terms if len(t) >= 3], [t for t in terms if len(t) < 3]
+
+
+def _like(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+async def search_ids(session: AsyncSession, user_id: int, q: str, limit: int, offset: int) -> List[int]:
+    # 返回按相关度排好序的 id；始终限定在当前用户的文献里
+    fts_terms, like_terms = _split_terms(q)
+    params: Dict[str, Any] = {"uid": user_id, "limit": limit, "offset": offset}
+    where = ["r.user_id = :uid"]
+    for i, term in enumerate(like_terms):
+        params[f"t{i}"] = _like(term)
+        where.append("(" + " OR ".join(f"r.{c} LIKE :t{i} ESCAPE '\\'" for c in FTS_COLUMNS) + ")")
+
+    if fts_terms:
+        # 每个词当作短语加引号，用户输入里的 FTS 语法字符不会被解释
+        params["match"] = " ".join('"' + t.replace('"', '""') + '"' for t in fts_terms)
+        sql = (
+            "SELECT r.id FROM reference_fts JOIN reference r ON r.id = reference_fts.rowid "
+            f"WHERE reference_fts MATCH :match AND {' AND '.join(where)} "
+            f"ORDER BY bm25(reference_fts, {BM25_WEIGHTS}) LIMIT :limit OFFSET :offset"
+        )
+    else:
+        sql = f"SELECT r.id FROM reference r WHERE {' AND '.join(where)} ORDER BY r.id DESC LIMIT :limit OFFSET :offset"
+    rows = await session.execute(text(sql), params)
+    return [row[0] for row in rows]
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlmodel import Session, select
+
+from .. import config
+from ..db import engine
+from ..models import SourceStat
+
+# 按 DOI 前缀（10.1016、10.5281 …）统计每个来源的命中率和延迟，决定这次解析问哪些来源、按什么顺序问：
+# - 样本够多且几乎从不命中的来源直接跳过（比如数据集前缀问 Crossref）；所有来源都被跳过的前缀立即返回查不到
+# - 顺序模式下按 "命中率 / 中位延迟" 排序，先问最可能快速命中的；并行模式保持原优先级（权威性），只做跳过
+# - 一小部分请求（ROUTING_EXPLORE）照旧问全部来源，让统计保持新鲜
+# 命中率用指数衰减计数（近期的权重大）；超时/报错不计入命中率，避免上游短暂故障把来源 "拉黑"。
+# 统计先在内存里累积，每隔 ROUTING_FLUSH_INTERVAL 秒写回 source_stat 表。
+
+LATENCY_SAMPLES = 64
+
+Key = Tuple[str, str]  # (prefix, source)
+
+
+def doi_prefix(doi: str) -> str:
+    return doi.split("/", 1)[0].strip().lower()
+
+
+class _Stat:
+    __slots__ = ("attempts", "hits", "errors", "latencies")
+
+    def __init__(self, attempts: float = 0.0, hits: float = 0.0, errors: int = 0, latencies: Sequence[float] = ()):
+        self.attempts = attempts
+        self.hits = hits
+        self.errors = errors
+        self.latencies: Deque[float] = deque(latencies, maxlen=LATENCY_SAMPLES)
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        return self.hits / self.attempts if self.attempts else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        xs = sorted(self.latencies)
+        return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+class SourceStats:
+    def __init__(self) -> None:
+        self._stats: Dict[Key, _Stat] = {}
+        self._loaded: Set[str] = set()
+        self._dirty: Set[Key] = set()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        self.counters = {"planned": 0, "explored": 0, "skipped_sources": 0, "fail_fast": 0}
+
+    # ---- 读写数据库 ----
+
+    def _db_load(self, prefix: str) -> List[SourceStat]:
+        with Session(engine) as session:
+            return list(session.exec(select(SourceStat).where(SourceStat.prefix == prefix)))
+
+    async def _ensure_loaded(self, prefix: str) -> None:
+        if prefix in self._loaded:
+            return
+        try:
+            rows = await asyncio.to_thread(self._db_load, prefix)
+        except Exception:
+            rows = []
+        with self._lock:
+            for row in rows:
+                key = (row.prefix, row.source)
+                if key not in self._stats:
+                    self._stats[key] = _Stat(row.attempts, row.hits, row.errors, json.loads(row.latencies or "[]"))
+            self._loaded.add(prefix)
+
+    def flush(self) -> int:
+        with self._lock:
+            keys, self._dirty = self._dirty, set()
+            snapshot = [
+                (k, s.attempts, s.hits, s.errors, json.dumps([round(x, 4) for x in s.latencies]))
+                for k in keys
+                for s in [self._stats[k]]
+            ]
+        if not snapshot:
+            return 0
+        now = datetime.utcnow()
+        with Session(engine) as session:
+            for (prefix, source), attempts, hits, errors, latencies in snapshot:
+                session.merge(SourceStat(
+                    prefix=prefix, source=source, attempts=attempts, hits=hits,
+                    errors=errors, latencies=latencies, updated_at=now,
+                ))
+            session.commit()
+        return len(snapshot)
+
+    async def _flush_in_background(self) -> None:
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception:
+            pass
+        finally:
+            self._flushing = False
+
+    def _maybe_flush(self) -> None:
+        if self._flushing or not self._dirty or time.monotonic() - self._last_flush < config.ROUTING_FLUSH_INTERVAL:
+            return
+        self._last_flush = time.monotonic()
+        self._flushing = True
+        asyncio.get_running_loop().create_task(self._flush_in_background())
+
+    # ---- 记录与规划 ----
+
+    def record(self, prefix: str, source: str, outcome: str, seconds: float) -> None:
+        # outcome: hit / miss / error
+        with self._lock:
+            s = self._stats.get((prefix, source))
+            if s is None:
+                s = self._stats[(prefix, source)] = _Stat()
+            if outcome == "error":
+                s.errors += 1
+            else:
+                decay = config.ROUTING_DECAY
+                s.attempts = s.attempts * decay + 1
+                s.hits = s.hits * decay + (1 if outcome == "hit" else 0)
+                s.latencies.append(seconds)
+            self._dirty.add((prefix, source))
+        self._maybe_flush()
+
+    async def plan(self, prefix: str, sources: Sequence[str], sequential: bool) -> List[str]:
+        # 返回这次要问的来源（按先后），空列表表示这个前缀已知查不到
+        if not config.ROUTING_ENABLED:
+            return list(sources)
+        await self._ensure_loaded(prefix)
+        self.counters["planned"] += 1
+        if random.random() < config.ROUTING_EXPLORE:
+            self.counters["explored"] += 1
+            return list(sources)
+
+        keep: List[str] = []
+        for name in sources:
+            s = self._stats.get((prefix, name))
+            if s is not None and s.attempts >= config.ROUTING_MIN_SAMPLES and (s.hit_rate or 0) < config.ROUTING_SKIP_BELOW:
+                self.counters["skipped_sources"] += 1
+                continue
+            keep.append(name)
+        if not keep:
+            self.counters["fail_fast"] += 1
+            return []
+        if sequential:
+            keep.sort(key=lambda name: -self._score(prefix, name))
+        return keep
+
+    def _score(self, prefix: str, name: str) -> float:
+        # 每秒期望命中数；样本不够的来源给一个中性分数，排在已知好用的来源之后、已知差的之前
+        s = self._stats.get((prefix, name))
+        if s is None or s.attempts < config.ROUTING_MIN_SAMPLES:
+            return 0.5
+        p50 = s.quantile(0.5) or 1.0
+        return (s.hit_rate or 0) / max(p50, 0.01)
+
+    def snapshot(self, prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(k, s) for k, s in self._stats.items() if prefix is None or k[0] == prefix]
+        out = []
+        for (p, source), s in sorted(items):
+            p50, p95 = s.quantile(0.5), s.quantile(0.95)
+            out.append({
+                "prefix": p,
+                "source": source,
+                "samples": round(s.attempts, 2),
+                "hit_rate": round(s.hit_rate, 4) if s.hit_rate is not None else None,
+                "errors": s.errors,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            })
+        return out
+
+
+source_stats = SourceStats()
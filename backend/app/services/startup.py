@@ -0,0 +1,39 @@
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# 冷启动计时：各阶段耗时（秒），launcher.py 在浏览器打开前打印，/metrics 里也能看到
+
+timings: Dict[str, float] = {}
+_origin: Optional[float] = None
+
+
+def set_origin(t0: float) -> None:
+    # launcher 传入进程最早的 perf_counter，用来算总耗时
+    global _origin
+    _origin = t0
+
+
+def record(phase: str, seconds: float) -> None:
+    timings[phase] = round(seconds, 4)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0)
+
+
+def since_origin() -> Optional[float]:
+    return None if _origin is None else time.perf_counter() - _origin
+
+
+def report() -> str:
+    parts = [f"{k} {v * 1000:.0f}ms" for k, v in timings.items() if k != "total"]
+    total = timings.get("total") or since_origin()
+    head = f"启动耗时 {total:.2f}s" if total is not None else "启动耗时"
+    return head + "：" + ", ".join(parts)
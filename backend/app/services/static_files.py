@@ -0,0 +1,105 @@
+from __future__ import annotations
+import hashlib
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+# 前端静态文件：启动时扫描一次 frontend/dist 建内存清单，之后每个请求只查 dict，不碰文件系统判断存在与否。
+# Vite 产物 assets/xxx-<hash>.js 内容变了文件名就变，可以长期强缓存（immutable）；
+# index.html 等不带 hash 的文件用 no-cache + ETag，每次协商，没变就 304。
+# 构建时如果生成了 .br / .gz 同名文件，按 Accept-Encoding 直接发预压缩版本。
+
+HASHED_MAX_AGE = 365 * 24 * 3600
+_HASHED_NAME = re.compile(r"[-.][A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]  # 优先级从高到低
+
+
+class StaticEntry:
+    __slots__ = ("path", "stat", "media_type", "etag", "cache_control", "variants")
+
+    def __init__(self, path: Path, stat: os.stat_result, hashed: bool):
+        self.path = path
+        self.stat = stat
+        self.media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.etag = _etag(stat)
+        self.cache_control = f"public, max-age={HASHED_MAX_AGE}, immutable" if hashed else "no-cache"
+        # encoding -> (预压缩文件, stat, etag)
+        self.variants: Dict[str, tuple] = {}
+
+
+def _etag(stat: os.stat_result) -> str:
+    return '"' + hashlib.md5(f"{stat.st_mtime_ns}-{stat.st_size}".encode(), usedforsecurity=False).hexdigest() + '"'
+
+
+class StaticManifest:
+    def __init__(self, root: Path):
+        self.root = root
+        self.files: Dict[str, StaticEntry] = {}
+        self.index: Optional[StaticEntry] = None
+
+    def load(self) -> "StaticManifest":
+        files: Dict[str, StaticEntry] = {}
+        if self.root.is_dir():
+            siblings = []
+            for dirpath, _, names in os.walk(self.root):
+                for name in names:
+                    full = Path(dirpath) / name
+                    rel = full.relative_to(self.root).as_posix()
+                    if name.endswith((".br", ".gz")):
+                        siblings.append((rel, full))
+                        continue
+                    hashed = rel.startswith("assets/") and bool(_HASHED_NAME.search(name))
+                    files[rel] = StaticEntry(full, full.stat(), hashed)
+            for rel, full in siblings:
+                for encoding, suffix in ENCODINGS:
+                    base = files.get(rel[: -len(suffix)]) if rel.endswith(suffix) else None
+                    if base is not None:
+                        st = full.stat()
+                        base.variants[encoding] = (full, st, base.etag[:-1] + f'-{suffix[1:]}"')
+        self.files = files
+        self.index = files.get("index.html")
+        return self
+
+    def lookup(self, rel: str) -> Optional[StaticEntry]:
+        # 只查清单：不在 dist 里的路径（包括 ../ 之类）一律查不到
+        return self.files.get(rel.lstrip("/"))
+
+    def response(self, request: Request, entry: StaticEntry) -> Response:
+        accept = request.headers.get("accept-encoding", "")
+        path, stat, etag = entry.path, entry.stat, entry.etag
+        encoding = None
+        for enc, _ in ENCODINGS:
+            if enc in entry.variants and accepts_encoding(accept, enc):
+                path, stat, etag = entry.variants[enc]
+                encoding = enc
+                break
+        headers = {"Cache-Control": entry.cache_control, "ETag": etag}
+        if entry.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return FileResponse(path, stat_result=stat, media_type=entry.media_type, headers=headers)
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return etag in tags or f"W/{etag}" in tags
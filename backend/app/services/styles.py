@@ -0,0 +1,248 @@
+from __future__ import annotations
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# 引用格式引擎：每种格式按 ref_type 写一个模板，启动时编译成 Python 函数（一条 % 格式化表达式），
+# 格式化时只剩取值和一次字符串拼接；作者串的拆分/改写按原串缓存，同一作者串只处理一次。
+# 取值直接读行对象的 __dict__：ORM 实例逐个属性 getattr 比格式化本身还慢（1 万行约 40ms）。
+#
+# 模板语法：
+#   {field}          Reference 的字段；authors 会先经过该格式的作者改写
+#   {field|默认}     字段为空时输出 "默认"（比如 APA 的 n.d.）
+#   [[ ... ]]        可选段：本段直接引用的字段都不为空时才输出；可嵌套，内层段单独判断
+# 其余字符原样输出。空值默认输出空串；gbt7714 为了和旧版逐字一致，空值照旧输出 "None"（靠 missing 提示补全）。
+
+AUTHOR_CACHE_SIZE = 65536
+
+_FIELDS = {"ref_type", "title", "authors", "year", "journal", "volume", "issue", "pages",
+           "publisher", "isbn", "doi", "url", "accessed_at"}
+
+
+# ---- 作者改写 ----
+
+_CJK = re.compile(r"[㐀-鿿豈-﫿]")
+_AUTHOR_SPLIT = re.compile(r"\s*[;；]\s*")
+
+Name = Tuple[str, str, bool]  # (姓, 名, 是否中日韩姓名)
+
+
+@lru_cache(maxsize=AUTHOR_CACHE_SIZE)
+def split_names(authors: str) -> Tuple[Name, ...]:
+    # "张三; 李四" / "Zhang San; Li Si" / "Zhang, San"：库里约定姓在前
+    out = []
+    for raw in _AUTHOR_SPLIT.split(authors.replace("；", ";").strip()):
+        name = raw.strip()
+        if not name:
+            continue
+        if _CJK.search(name):
+            out.append((name, "", True))
+        elif "," in name:
+            family, given = name.split(",", 1)
+            out.append((family.strip(), given.strip(), False))
+        else:
+            parts = name.split()
+            out.append((parts[0], " ".join(parts[1:]), False))
+    return tuple(out)
+
+
+def _initials(given: str, sep: str = " ") -> str:
+    # "San" -> "S."，"Xiao-Ming" -> "X.-M."，已经是缩写的保持不变
+    words = []
+    for word in given.replace(".", " ").split():
+        words.append("-".join(p[0].upper() + "." for p in word.split("-") if p))
+    return sep.join(words)
+
+
+def _join(items: Sequence[str], last: str, comma_before_last: bool = True) -> str:
+    if len(items) <= 1:
+        return "".join(items)
+    if len(items) == 2:
+        return f"{items[0]}{',' if comma_before_last else ''} {last} {items[1]}"
+    return ", ".join(items[:-1]) + f", {last} {items[-1]}"
+
+
+@lru_cache(maxsize=AUTHOR_CACHE_SIZE)
+def _authors_gbt(authors: str) -> str:
+    return authors.replace("；", ";").strip()
+
+
+@lru_cache(maxsize=AUTHOR_CACHE_SIZE)
+def _authors_apa(authors: str) -> str:
+    # Zhang, S., & Li, S.；超过 20 位：前 19 位 … 最后一位
+    names = [n[0] if n[2] else f"{n[0]}, {_initials(n[1])}".rstrip(", ") for n in split_names(authors)]
+    out = ", ".join(names[:19]) + ", … " + names[-1] if len(names) > 20 else _join(names, "&")
+    # 作者段以句点结束（中文姓名后面补一个）："李四. (2020)."
+    return out if not out or out.endswith(".") else out + "."
+
+
+@lru_cache(maxsize=AUTHOR_CACHE_SIZE)
+def _authors_mla(authors: str) -> str:
+    # Zhang, San, and Si Li；三位及以上：第一作者 et al.
+    names = split_names(authors)
+    if not names:
+        return ""
+    first = names[0][0] if names[0][2] else f"{names[0][0]}, {names[0][1]}".rstrip(", ")
+    if len(names) >= 3:
+        return f"{first}, et al"
+    if len(names) == 2:
+        second = names[1][0] if names[1][2] else f"{names[1][1]} {names[1][0]}".strip()
+        return f"{first}, and {second}"
+    return first
+
+
+@lru_cache(maxsize=AUTHOR_CACHE_SIZE)
+def _authors_ieee(authors: str) -> str:
+    # S. Zhang and S. Li；超过 6 位：第一作者 et al.
+    names = [n[0] if n[2] else f"{_initials(n[1])} {n[0]}".strip() for n in split_names(authors)]
+    if len(names) > 6:
+        return f"{names[0]} et al."
+    return _join(names, "and", comma_before_last=False)
+
+
+# ---- 模板编译 ----
+
+def _parse(template: str) -> List[Any]:
+    # 返回节点列表：str（原样文本）、("field", 名, 默认值)、("group", 子节点列表)
+    root: List[Any] = []
+    stack = [root]
+    i = 0
+    text = []
+
+    def flush() -> None:
+        if text:
+            stack[-1].append("".join(text))
+            text.clear()
+
+    while i < len(template):
+        if template.startswith("[[", i):
+            flush()
+            group: List[Any] = []
+            stack[-1].append(("group", group))
+            stack.append(group)
+            i += 2
+        elif template.startswith("]]", i) and len(stack) > 1:
+            flush()
+            stack.pop()
+            i += 2
+        elif template[i] == "{":
+            flush()
+            end = template.index("}", i)
+            name, _, default = template[i + 1:end].partition("|")
+            if name not in _FIELDS:
+                raise ValueError(f"Unknown field in citation template: {name}")
+            stack[-1].append(("field", name, default))
+            i = end + 1
+        else:
+            text.append(template[i])
+            i += 1
+    flush()
+    if len(stack) != 1:
+        raise ValueError(f"Unclosed [[ in citation template: {template}")
+    return root
+
+
+def _fields_in(nodes: List[Any], nested: bool = True) -> List[str]:
+    out = []
+    for n in nodes:
+        if isinstance(n, tuple):
+            if n[0] == "field":
+                out.append(n[1])
+            elif nested:
+                out += _fields_in(n[1])
+    return out
+
+
+def _emit(nodes: List[Any], blank_none: bool) -> str:
+    fmt: List[str] = []
+    args: List[str] = []
+    for n in nodes:
+        if isinstance(n, str):
+            fmt.append(n.replace("%", "%%"))
+        elif n[0] == "group":
+            cond = " and ".join(f"d[{f!r}]" for f in dict.fromkeys(_fields_in(n[1], nested=False))) or "True"
+            fmt.append("%s")
+            args.append(f"({_emit(n[1], blank_none)} if {cond} else '')")
+        else:
+            _, name, default = n
+            value = "_a(d['authors'] or '')" if name == "authors" else f"d[{name!r}]"
+            if default:
+                value = f"({value} or {default!r})"
+            elif blank_none and name != "authors":
+                value = f"('' if d[{name!r}] is None else d[{name!r}])"
+            fmt.append("%s")
+            args.append(value)
+    if not args:
+        return repr("".join(n for n in nodes if isinstance(n, str)))
+    return f"{''.join(fmt)!r} % ({', '.join(args)},)"
+
+
+def compile_template(template: str, authors: Callable[[str], str], blank_none: bool = True, name: str = "") -> Callable[[Dict[str, Any]], str]:
+    # 编译结果接收字段字典 d（行对象的 __dict__ 或同样键的 dict）
+    src = f"def render(d):\n    return {_emit(_parse(template), blank_none)}\n"
+    ns: Dict[str, Any] = {"_a": authors}
+    exec(compile(src, f"<citation style {name}>", "exec"), ns)
+    return ns["render"]
+
+
+class Style:
+    def __init__(self, name: str, templates: Dict[str, str], authors: Callable[[str], str], blank_none: bool = True):
+        # templates 必须有 "other"：没有专门模板的 ref_type 都用它
+        self.name = name
+        self.renderers = {
+            ref_type: compile_template(t, authors, blank_none, f"{name}/{ref_type}") for ref_type, t in templates.items()
+        }
+        self.default = self.renderers["other"]
+        self.fields = frozenset(["ref_type"] + [f for t in templates.values() for f in _fields_in(_parse(t))])
+
+    def _values(self, r: Any) -> Dict[str, Any]:
+        # 列表接口直接传行元组拼出的 dict；ORM 实例已加载的列都在 __dict__ 里，
+        # 过期/延迟加载的列不在，这时退回 getattr（会触发加载）
+        d = r if isinstance(r, dict) else getattr(r, "__dict__", None)
+        if d is None or not self.fields <= d.keys():
+            return {f: getattr(r, f) for f in self.fields}
+        return d
+
+    def render(self, r: Any) -> str:
+        d = self._values(r)
+        return self.renderers.get(d["ref_type"], self.default)(d)
+
+    def render_many(self, refs: Sequence[Any]) -> List[str]:
+        get, default, values = self.renderers.get, self.default, self._values
+        out = []
+        for r in refs:
+            d = values(r)
+            out.append(get(d["ref_type"], default)(d))
+        return out
+
+
+STYLES: Dict[str, Style] = {
+    # GB/T 7714：与旧版 format_gbt7714 逐字一致
+    "gbt7714": Style("gbt7714", {
+        "journal": "{authors}. {title}[J]. {journal}, {year}, {volume}[[({issue})]]: {pages}.[[ DOI:{doi}]]",
+        "book": "{authors}. {title}[M]. {publisher}, {year}.",
+        "web": "{authors}. {title}[EB/OL]. {url} ({accessed_at}).",
+        "other": "{authors}. {title}. {year}.",
+    }, _authors_gbt, blank_none=False),
+    "apa": Style("apa", {
+        "journal": "[[{authors} ]]({year|n.d.}). {title}.[[ {journal}[[, {volume}[[({issue})]]]][[, {pages}]].]][[ https://doi.org/{doi}]]",
+        "book": "[[{authors} ]]({year|n.d.}). {title}.[[ {publisher}.]][[ https://doi.org/{doi}]]",
+        "web": "[[{authors} ]]({year|n.d.}). {title}.[[ Retrieved {accessed_at}, from]][[ {url}]]",
+        "other": "[[{authors} ]]({year|n.d.}). {title}.",
+    }, _authors_apa),
+    "mla": Style("mla", {
+        "journal": '[[{authors}. ]]"{title}."[[ {journal}[[, vol. {volume}]][[, no. {issue}]][[, {year}]][[, pp. {pages}]].]][[ https://doi.org/{doi}.]]',
+        "book": "[[{authors}. ]]{title}.[[ {publisher}[[, {year}]].]]",
+        "web": '[[{authors}. ]]"{title}."[[ {url}.]][[ Accessed {accessed_at}.]]',
+        "other": "[[{authors}. ]]{title}.[[ {year}.]]",
+    }, _authors_mla),
+    "ieee": Style("ieee", {
+        "journal": '[[{authors}, ]]"{title},"[[ {journal}]][[, vol. {volume}]][[, no. {issue}]][[, pp. {pages}]][[, {year}]][[, doi: {doi}]].',
+        "book": "[[{authors}, ]]{title}.[[ {publisher}[[, {year}]].]]",
+        "web": '[[{authors}, ]]"{title}." [Online].[[ Available: {url}[[ (accessed {accessed_at})]].]]',
+        "other": "[[{authors}, ]]{title}[[, {year}]].",
+    }, _authors_ieee),
+}
+
+STYLE_NAMES = list(STYLES)
+STYLE_PATTERN = "^(" + "|".join(STYLE_NAMES) + ")$"
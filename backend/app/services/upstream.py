@@ -0,0 +1,193 @@
+from __future__ import annotations
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .. import config
+from .http_client import get_client, source_timeout
+from .metrics import observe_upstream
+from .rate_limit import _buckets, throttle
+
+if TYPE_CHECKING:
+    import httpx
+
+# 上游请求的统一出口：熔断 → 限速（按主机的令牌桶，每个来源一个主机）→ 请求 → 记指标/熔断状态。
+# 熔断器按来源全局共享：
+# - closed：正常放行；连续失败 BREAKER_FAILURES 次（超时、连接错误、5xx、慢于 BREAKER_SLOW_CALL 秒）就打开
+# - open：直接拒绝，不占连接也不等超时；到期后进入 half_open
+# - half_open：只放一个探测请求，成功就关闭，失败就再次打开（打开时长翻倍，封顶 BREAKER_MAX_OPEN）
+# 429 / 带 Retry-After 的 503 不用攒次数，直接按 Retry-After（没有就用 BREAKER_RESET）打开。
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class UpstreamUnavailable(Exception):
+    # 熔断中、被限流（429）或上游 5xx：这次 "没查到" 不算明确答复
+    def __init__(self, source: str, reason: str):
+        super().__init__(f"{source} unavailable: {reason}")
+        self.source = source
+        self.reason = reason
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.trips = 0  # 连续打开的次数，决定退避时长
+        self.probing = False
+        self.counters = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() < self.open_until:
+                self.counters["rejected"] += 1
+                return False
+            self.state = HALF_OPEN
+            self.probing = False
+        if self.state == HALF_OPEN:
+            if self.probing:
+                self.counters["rejected"] += 1
+                return False
+            self.probing = True
+        return True
+
+    def success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.probing = False
+
+    def failure(self, retry_after: Optional[float] = None) -> None:
+        self.failures += 1
+        self.probing = False
+        if retry_after is not None or self.state == HALF_OPEN or self.failures >= config.BREAKER_FAILURES:
+            self._open(retry_after)
+
+    def release(self) -> None:
+        # 请求被取消（并行模式下更高优先级的来源先命中）：不算成功也不算失败，探测名额还回去
+        self.probing = False
+
+    def _open(self, retry_after: Optional[float]) -> None:
+        self.trips += 1
+        if retry_after is None:
+            retry_after = config.BREAKER_RESET * 2 ** (self.trips - 1)
+        self.open_until = time.monotonic() + min(max(retry_after, 0.0), config.BREAKER_MAX_OPEN)
+        if self.state != OPEN:
+            self.counters["opened"] += 1
+        self.state = OPEN
+        self.failures = 0
+
+    @property
+    def current_state(self) -> str:
+        # 打开时长已到、还没有请求来探测时，对外显示 half_open
+        if self.state == OPEN and time.monotonic() >= self.open_until:
+            return HALF_OPEN
+        return self.state
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"state": self.current_state, **self.counters}
+        if out["state"] == OPEN:
+            out["retry_in"] = round(max(0.0, self.open_until - time.monotonic()), 1)
+        return out
+
+
+# 已知来源先建好，/health 里一开始就能看到全部来源
+_breakers: Dict[str, CircuitBreaker] = {name: CircuitBreaker(name) for name in config.SOURCE_TIMEOUTS}
+
+
+def breaker_for(source: str) -> CircuitBreaker:
+    b = _breakers.get(source)
+    if b is None:
+        b = _breakers[source] = CircuitBreaker(source)
+    return b
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    return {name: b.snapshot() for name, b in sorted(_breakers.items())}
+
+
+def metrics_lines() -> List[str]:
+    lines = [
+        "# HELP citecheck_upstream_breaker_state Circuit breaker state per source (0 closed, 1 half-open, 2 open).",
+        "# TYPE citecheck_upstream_breaker_state gauge",
+    ]
+    lines += [f'citecheck_upstream_breaker_state{{source="{n}"}} {STATE_VALUES[b.current_state]}' for n, b in sorted(_breakers.items())]
+    lines += [
+        "# HELP citecheck_upstream_breaker_rejected_total Requests rejected by an open circuit breaker.",
+        "# TYPE citecheck_upstream_breaker_rejected_total counter",
+    ]
+    lines += [f'citecheck_upstream_breaker_rejected_total{{source="{n}"}} {b.counters["rejected"]}' for n, b in sorted(_breakers.items())]
+    return lines
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # 秒数或 HTTP 日期两种写法
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+async def fetch(
+    source: str, url: str, headers: Optional[Dict[str, str]] = None, client: Optional[httpx.AsyncClient] = None
+) -> httpx.Response:
+    # 返回上游的答复（200/404 等由调用方解释）；熔断中、429、5xx 抛 UpstreamUnavailable，超时/连接错误原样抛出
+    # 指标里的耗时不含限速排队；熔断直接拒绝记为 outcome=open
+    import httpx
+
+    breaker = breaker_for(source)
+    if not breaker.allow():
+        observe_upstream(source, 0.0, "open")
+        raise UpstreamUnavailable(source, "circuit open")
+
+    try:
+        await throttle(url)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    t0 = time.perf_counter()
+    try:
+        r = await (client or get_client()).get(url, headers=headers, timeout=source_timeout(source))
+    except asyncio.CancelledError:
+        observe_upstream(source, time.perf_counter() - t0, "cancelled")
+        breaker.release()
+        raise
+    except Exception as e:
+        observe_upstream(source, time.perf_counter() - t0, "timeout" if isinstance(e, httpx.TimeoutException) else "error")
+        breaker.failure()
+        raise
+    elapsed = time.perf_counter() - t0
+
+    if r.status_code == 429 or r.status_code >= 500:
+        retry_after = parse_retry_after(r.headers.get("retry-after"))
+        if r.status_code == 429 and retry_after is None:
+            retry_after = config.BREAKER_RESET
+        breaker.failure(retry_after)
+        observe_upstream(source, elapsed, "throttled" if r.status_code == 429 else "error")
+        raise UpstreamUnavailable(source, f"HTTP {r.status_code}")
+
+    if config.BREAKER_SLOW_CALL > 0 and elapsed > config.BREAKER_SLOW_CALL:
+        # 答复了但太慢：结果照常返回，同时计一次失败，持续变慢就熔断
+        breaker.failure()
+    else:
+        breaker.success()
+    observe_upstream(source, elapsed, "hit" if r.status_code == 200 else ("miss" if r.status_code == 404 else "error"))
+    return r
+
+
+def bucket_states() -> Dict[str, Any]:
+    # 各主机令牌桶的当前余量（只列已创建的），看限速是否在排队
+    return {host: round(b.tokens, 2) for host, b in sorted(_buckets.items())}
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import asyncio
+import multiprocessing
+import random
+import socket
+import time
+import zlib
+from typing import Any, Dict, Optional
+from urllib.parse import unquote
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+# 本地假上游：按 Host 头区分 Crossref / DataCite / OpenAlex / S2 / doi.org，
+# 返回 doi_resolver.py 和 metadata_routes.py 解析的 JSON 结构。
+# 每个来源可以单独设置延迟、抖动、5xx 比例和 404 比例（404 由 DOI 哈希决定，同一个 DOI 每次结果一样）。
+# 跑在单独的进程里，不和被测代码抢 GIL。
+
+HOSTS = {
+    "api.crossref.org": "crossref",
+    "api.datacite.org": "datacite",
+    "api.openalex.org": "openalex",
+    "api.semanticscholar.org": "semanticscholar",
+    "doi.org": "doi_csl",
+}
+
+DEFAULT_PROFILE = {"latency": 0.02, "jitter": 0.01, "error_rate": 0.0, "not_found": 0.1}
+
+
+def _title(doi: str) -> str:
+    return f"Benchmark article {zlib.crc32(doi.encode()) % 100000}"
+
+
+def _payload(source: str, doi: str) -> Dict[str, Any]:
+    title = _title(doi)
+    if source == "crossref":
+        return {"message": {
+            "DOI": doi, "title": [title], "URL": f"https://doi.org/{doi}",
+            "author": [{"family": "Zhang", "given": "San"}, {"family": "Li", "given": "Si"}],
+            "issued": {"date-parts": [[2021, 5]]}, "published-print": {"date-parts": [[2021]]},
+            "container-title": ["Journal of Benchmarks"], "volume": "12", "issue": "3", "page": "100-110",
+        }}
+    if source == "datacite":
+        return {"data": {"id": doi, "attributes": {
+            "titles": [{"title": title}], "creators": [{"name": "Zhang, San"}], "publicationYear": 2021,
+        }}}
+    if source == "openalex":
+        return {"id": "https://openalex.org/W1", "title": title, "publication_year": 2021,
+                "authorships": [{"author": {"display_name": "San Zhang"}}]}
+    if source == "semanticscholar":
+        return {"paperId": "x", "title": title, "year": 2021, "authors": [{"name": "San Zhang"}]}
+    return {"DOI": doi, "title": title, "issued": {"date-parts": [[2021]]},
+            "author": [{"family": "Zhang", "given": "San"}]}
+
+
+def _make_app(profiles: Dict[str, Dict[str, float]], seed: int) -> FastAPI:
+    rng = random.Random(seed)
+    requests = {s: 0 for s in HOSTS.values()}
+    app = FastAPI()
+
+    def not_found(source: str, doi: str) -> bool:
+        ratio = profiles[source]["not_found"]
+        return zlib.crc32(f"{source}:{doi.lower()}".encode()) % 10000 < ratio * 10000
+
+    @app.get("/{path:path}")
+    async def handle(request: Request, path: str):
+        source = HOSTS.get((request.headers.get("host") or "").split(":")[0])
+        if source is None:
+            # 直接访问（Host 是 127.0.0.1）：返回各来源收到的请求数
+            return requests
+        requests[source] += 1
+        p = profiles[source]
+        await asyncio.sleep(p["latency"] + rng.uniform(0, p["jitter"]))
+        if rng.random() < p["error_rate"]:
+            return PlainTextResponse("upstream error", status_code=503)
+        raw = unquote(request.url.path)
+        at = raw.find("10.")
+        doi = raw[at:] if at >= 0 else ""
+        if not doi or not_found(source, doi):
+            return JSONResponse({"message": "not found"}, status_code=404)
+        return JSONResponse(_payload(source, doi))
+
+    return app
+
+
+def _serve(profiles: Dict[str, Dict[str, float]], seed: int, ports: "multiprocessing.Queue[int]") -> None:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    ports.put(sock.getsockname()[1])
+    cfg = uvicorn.Config(_make_app(profiles, seed), log_level="warning", access_log=False, lifespan="off")
+    uvicorn.Server(cfg).run(sockets=[sock])
+
+
+class FakeUpstream:
+    def __init__(self, profiles: Optional[Dict[str, Dict[str, float]]] = None, seed: int = 0):
+        self.profiles = {s: {**DEFAULT_PROFILE, **(profiles or {}).get(s, {})} for s in HOSTS.values()}
+        self.seed = seed
+        self.port = 0
+        self._proc: Optional[multiprocessing.Process] = None
+
+    def start(self) -> "FakeUpstream":
+        ctx = multiprocessing.get_context("spawn")
+        ports = ctx.Queue()
+        self._proc = ctx.Process(target=_serve, args=(self.profiles, self.seed, ports), daemon=True)
+        self._proc.start()
+        self.port = ports.get(timeout=30)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                self.requests()
+                return self
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("fake upstream did not start")
+                time.sleep(0.05)
+
+    def requests(self) -> Dict[str, int]:
+        return httpx.get(f"http://127.0.0.1:{self.port}/_stats", timeout=5).json()
+
+    def stop(self) -> None:
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.join(timeout=5)
+
+
+class LocalTransport(httpx.AsyncBaseTransport):
+    # 保留原来的 Host 头，只把连接目标换成本地假上游（https -> http）
+    def __init__(self, port: int, limits: httpx.Limits):
+        self.port = port
+        self._inner = httpx.AsyncHTTPTransport(limits=limits)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        return await self._inner.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
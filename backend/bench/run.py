@@ -0,0 +1,455 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# 离线基准测试：本地假上游 + 临时 SQLite 库，结果写成 JSON 方便前后对比。
+# 用法（在 backend 目录下）：
+#   python -m bench.run --out bench-results.json
+#   python -m bench.run --sizes 1000,10000 --latency 0.05 --not-found 0.3 --compare old.json
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="CiteCheck offline benchmarks")
+    p.add_argument("--out", default="bench-results.json", help="结果 JSON 路径")
+    p.add_argument("--compare", help="和之前的结果 JSON 对比 p50")
+    p.add_argument("--sizes", default="1000,10000,100000", help="文献库规模，逗号分隔")
+    p.add_argument("--dois", type=int, default=200, help="每轮解析的 DOI 个数")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--repeat", type=int, default=20, help="列表/鉴权等单请求测试的重复次数")
+    p.add_argument("--latency", type=float, default=0.02, help="假上游基础延迟（秒）")
+    p.add_argument("--jitter", type=float, default=0.01)
+    p.add_argument("--error-rate", type=float, default=0.0, help="假上游返回 503 的比例")
+    p.add_argument("--not-found", type=float, default=0.1, help="假上游返回 404 的比例")
+    p.add_argument(
+        "--source", action="append", default=[],
+        help="单个来源的配置，如 semanticscholar:latency=0.3,not_found=0.5（可重复）",
+    )
+    p.add_argument("--skip", default="", help="跳过的分组：resolve,http,library,format,serialize,auth")
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args(argv)
+
+
+def source_profiles(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    base = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate, "not_found": args.not_found}
+    from .fake_upstream import HOSTS
+    profiles = {s: dict(base) for s in HOSTS.values()}
+    for item in args.source:
+        name, _, opts = item.partition(":")
+        if name not in profiles:
+            raise SystemExit(f"unknown source: {name} (expected one of {', '.join(profiles)})")
+        for kv in opts.split(","):
+            k, _, v = kv.partition("=")
+            if k.strip():
+                profiles[name][k.strip()] = float(v)
+    return profiles
+
+
+def summarize(samples: List[float], wall: Optional[float] = None) -> Dict[str, Any]:
+    # 毫秒；wall 是整轮耗时（并发时用来算吞吐）
+    xs = sorted(samples)
+    n = len(xs)
+    if not n:
+        return {"n": 0}
+
+    def pct(q: float) -> float:
+        return round(xs[min(n - 1, int(q * n))] * 1000, 3)
+
+    out = {
+        "n": n,
+        "mean_ms": round(statistics.fmean(xs) * 1000, 3),
+        "p50_ms": pct(0.50),
+        "p90_ms": pct(0.90),
+        "p99_ms": pct(0.99),
+        "max_ms": round(xs[-1] * 1000, 3),
+    }
+    total = wall if wall is not None else sum(xs)
+    out["throughput_per_s"] = round(n / total, 2) if total > 0 else None
+    return out
+
+
+async def timed_concurrent(items: List[Any], fn: Callable[[Any], Awaitable[Any]], concurrency: int) -> Dict[str, Any]:
+    sem = asyncio.Semaphore(concurrency)
+    samples: List[float] = []
+
+    async def one(x: Any) -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            await fn(x)
+            samples.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(x) for x in items))
+    return summarize(samples, time.perf_counter() - t0)
+
+
+async def timed_serial(n: int, fn: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def fake_dois(prefix: str, n: int) -> List[str]:
+    return [f"10.{5000 + i % 7}/bench.{prefix}.{i}" for i in range(n)]
+
+
+def fake_rows(user_id: int, n: int) -> List[Dict[str, Any]]:
+    from app.models import Reference
+    from app.services.formatter import apply_render
+
+    rows = []
+    for i in range(n):
+        kind = ("journal", "book", "web")[i % 3]
+        ref = Reference(
+            user_id=user_id, ref_type=kind,
+            title=f"基准测试文献 {i}：大规模文献库的检索与格式化",
+            authors="张三; 李四; Wang Wu" if i % 4 else "",
+            year=2000 + i % 25 if i % 10 else None,
+            journal="计算机学报" if kind == "journal" else None,
+            volume=str(i % 40) if kind == "journal" else None,
+            issue=str(i % 12) if kind == "journal" else None,
+            pages=f"{i % 300}-{i % 300 + 12}" if kind == "journal" and i % 5 else None,
+            publisher="科学出版社" if kind == "book" else None,
+            doi=f"10.1234/bench.{i}" if i % 2 else None,
+            url=f"https://example.com/{i}" if kind == "web" else None,
+            accessed_at="2026-01-29" if kind == "web" else None,
+        )
+        rows.append(apply_render(ref).model_dump(exclude={"id"}))
+    return rows
+
+
+async def bench_resolve(args: argparse.Namespace, upstream: Any) -> Dict[str, Any]:
+    from app import config
+    from app.services import doi_resolver
+
+    out: Dict[str, Any] = {}
+    # parallel 用配置的错峰间隔；parallel_nostagger 是所有来源同时发出（旧默认值），对比上游请求量和延迟
+    default_stagger = config.RESOLVE_STAGGER
+    for name, mode, stagger in (
+        ("parallel", "parallel", default_stagger),
+        ("parallel_nostagger", "parallel", 0.0),
+        ("sequential", "sequential", default_stagger),
+    ):
+        dois = fake_dois(f"resolve-{name}", args.dois)
+        config.RESOLVE_STAGGER = stagger
+        before = upstream.requests()
+        try:
+            res = await timed_concurrent(
+                dois, lambda d: doi_resolver.resolve_doi_multi(d, mode=mode, use_cache=False), args.concurrency
+            )
+        finally:
+            config.RESOLVE_STAGGER = default_stagger
+        after = upstream.requests()
+        res["upstream_requests"] = {s: after[s] - before[s] for s in before}
+        res["stagger_s"] = stagger
+        out[f"uncached_{name}"] = res
+
+    # 带缓存：第一轮冷（查上游 + 写缓存），第二轮全部命中内存 LRU
+    dois = fake_dois("resolve-cached", args.dois)
+    out["cache_cold"] = await timed_concurrent(dois, doi_resolver.resolve_doi_multi, args.concurrency)
+    out["cache_warm"] = await timed_concurrent(dois, doi_resolver.resolve_doi_multi, args.concurrency)
+    return out
+
+
+async def bench_http(args: argparse.Namespace, client: Any) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+
+    async def get(url: str) -> None:
+        r = await client.get(url)
+        if r.status_code >= 500:
+            raise RuntimeError(f"{url}: HTTP {r.status_code} {r.text[:200]}")
+
+    for name, path in (("doi_resolve", "/doi/resolve?doi={}"), ("metadata_doi", "/metadata/doi/{}")):
+        dois = fake_dois(f"http-{name}", args.dois)
+        out[f"{name}_cold"] = await timed_concurrent(dois, lambda d: get(path.format(d)), args.concurrency)
+        out[f"{name}_warm"] = await timed_concurrent(dois, lambda d: get(path.format(d)), args.concurrency)
+    return out
+
+
+async def bench_library(args: argparse.Namespace, client: Any, sizes: List[int]) -> Dict[str, Any]:
+    from sqlalchemy import insert
+    from sqlmodel import Session
+
+    from app.auth import create_access_token, hash_password
+    from app.db import engine
+    from app.models import Reference, User
+
+    out: Dict[str, Any] = {}
+    for n in sizes:
+        with Session(engine) as session:
+            user = User(email=f"bench{n}@example.com", password_hash=hash_password("bench"))
+            session.add(user)
+            session.commit()
+            uid, email = user.id, user.email
+            t0 = time.perf_counter()
+            rows = fake_rows(uid, n)
+            for i in range(0, n, 1000):
+                session.execute(insert(Reference), rows[i:i + 1000])
+            session.commit()
+            seed_s = time.perf_counter() - t0
+        token = create_access_token(email, 60, user_id=uid, token_version=0)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        async def fetch(url: str) -> Any:
+            r = await client.get(url, headers=headers)
+            r.raise_for_status()
+            return r
+
+        res: Dict[str, Any] = {"seed_s": round(seed_s, 3)}
+        res["first_page_50"] = await timed_serial(args.repeat, lambda: fetch("/references?limit=50"))
+        res["first_page_50_columns"] = await timed_serial(
+            args.repeat, lambda: fetch("/references?limit=50&fields=id,title,year")
+        )
+        res["has_missing_page_50"] = await timed_serial(args.repeat, lambda: fetch("/references?limit=50&has_missing=true"))
+
+        async def walk() -> None:
+            cursor = None
+            while True:
+                r = await fetch("/references?limit=1000" + (f"&cursor={cursor}" if cursor else ""))
+                cursor = r.headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+
+        res["keyset_walk_1000"] = await timed_serial(max(1, args.repeat // 10), walk)
+        res["full_list"] = await timed_serial(max(1, args.repeat // 10), lambda: fetch("/references"))
+        out[str(n)] = res
+    return out
+
+
+def _gbt7714_v1(r: Any) -> str:
+    # 引擎之前的逐行 f-string 实现，作为基线和逐字比对的标准
+    authors = r.authors.replace("；", ";").strip()
+    if r.ref_type == "journal":
+        vol_issue = f"{r.volume}({r.issue})" if r.issue else f"{r.volume}"
+        doi_part = f" DOI:{r.doi}" if r.doi else ""
+        return f"{authors}. {r.title}[J]. {r.journal}, {r.year}, {vol_issue}: {r.pages}.{doi_part}"
+    if r.ref_type == "book":
+        return f"{authors}. {r.title}[M]. {r.publisher}, {r.year}."
+    if r.ref_type == "web":
+        return f"{authors}. {r.title}[EB/OL]. {r.url} ({r.accessed_at})."
+    return f"{authors}. {r.title}. {r.year}."
+
+
+def bench_format(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.models import Reference
+    from app.services.formatter import format_gbt7714, missing_fields
+    from app.services.styles import STYLES
+
+    refs = [Reference(**row) for row in fake_rows(1, 10000)]
+    if STYLES["gbt7714"].render_many(refs) != [_gbt7714_v1(r) for r in refs]:
+        raise SystemExit("gbt7714 engine output differs from the v1 formatter")
+
+    def per_row(fn: Callable[[Any], Any]) -> Callable[[], Any]:
+        return lambda: [fn(r) for r in refs]
+
+    cases: Dict[str, Callable[[], Any]] = {
+        "gbt7714_v1_per_row": per_row(_gbt7714_v1),
+        "format_gbt7714": per_row(format_gbt7714),
+        "missing_fields": per_row(missing_fields),
+    }
+    for name, style in STYLES.items():
+        cases[f"{name}_batch"] = lambda style=style: style.render_many(refs)
+    out: Dict[str, Any] = {}
+    for name, fn in cases.items():
+        samples = []
+        for _ in range(5):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) / len(refs))
+        best = min(samples)
+        out[name] = {"n": len(refs), "us_per_call": round(best * 1e6, 3), "calls_per_s": round(1 / best, 1)}
+    return out
+
+
+def bench_serialize(args: argparse.Namespace) -> Dict[str, Any]:
+    # 1 万条文献的列表响应体：旧路径 ORM 实例 → model_dump → jsonable_encoder → json.dumps，
+    # 新路径 行元组 → dict → JSONBody（orjson）；再看各编码压缩后的字节数和耗时
+    from fastapi.encoders import jsonable_encoder
+    from starlette.responses import JSONResponse
+
+    from app.models import Reference
+    from app.routers.reference_routes import _CACHE_COLUMNS, _REF_COLUMNS, _ref_item, _row_items
+    from app.services import responses
+
+    refs = [Reference(id=i + 1, **row) for i, row in enumerate(fake_rows(1, 10000))]
+    names = [c.name for c in _REF_COLUMNS + _CACHE_COLUMNS]
+    rows = [tuple(getattr(r, n) for n in names) for r in refs]
+
+    def before() -> bytes:
+        return JSONResponse(jsonable_encoder([_ref_item(r) for r in refs])).body
+
+    def after() -> bytes:
+        return responses.JSONBody(_row_items(rows)).body
+
+    old_body, new_body = before(), after()
+    if json.loads(old_body) != json.loads(new_body):
+        raise SystemExit("row-tuple list body differs from the model_dump body")
+
+    def best_ms(fn: Callable[[], Any]) -> float:
+        samples = []
+        for _ in range(5):
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+        return round(min(samples) * 1000, 3)
+
+    out: Dict[str, Any] = {
+        "n": len(refs),
+        "json_backend": responses.json_backend(),
+        "before": {"ms": best_ms(before), "bytes": len(old_body)},
+        "after": {"ms": best_ms(after), "bytes": len(new_body)},
+    }
+    for enc in responses.encodings():
+        out[enc] = {
+            "ms": best_ms(lambda: responses.compress(new_body, enc)),
+            "bytes": len(responses.compress(new_body, enc)),
+        }
+    return out
+
+
+async def bench_auth(args: argparse.Namespace) -> Dict[str, Any]:
+    from fastapi.security import HTTPAuthorizationCredentials
+    from sqlmodel import Session, select
+
+    from app import deps
+    from app.auth import create_access_token
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from app.db import async_engine, engine
+    from app.models import User
+
+    with Session(engine, expire_on_commit=False) as session:
+        user = session.exec(select(User)).first()
+    if user is None:
+        return {"skipped": "no users (library benchmark skipped)"}
+    creds = HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=create_access_token(user.email, 60, user_id=user.id, token_version=0)
+    )
+    legacy = HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token(user.email, 60))
+    n = args.repeat * 50
+    out: Dict[str, Any] = {}
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        out["cached_principal"] = await timed_serial(n, lambda: deps.get_current_user(creds, session))
+
+        async def cold() -> None:
+            deps.invalidate_principal(user.id)
+            await deps.get_current_user(creds, session)
+            session.expunge_all()
+
+        out["uncached_principal"] = await timed_serial(n, cold)
+
+        async def by_email() -> None:
+            await deps.get_current_user(legacy, session)
+            session.expunge_all()
+
+        out["legacy_email_token"] = await timed_serial(n, by_email)
+    return out
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], path: str = "") -> None:
+    # 逐项打印 p50（或 us_per_call）的变化，>1 表示变慢
+    for k, v in new.items():
+        if not isinstance(v, dict):
+            continue
+        o = old.get(k) if isinstance(old, dict) else None
+        key = f"{path}.{k}" if path else k
+        metric = "p50_ms" if "p50_ms" in v else ("us_per_call" if "us_per_call" in v else None)
+        if metric and isinstance(o, dict) and o.get(metric):
+            print(f"{key:60s} {o[metric]:>10} -> {v[metric]:>10}  x{v[metric] / o[metric]:.2f}")
+        elif isinstance(o, dict):
+            compare(o, v, key)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    from .fake_upstream import FakeUpstream, LocalTransport
+    from app.main import app
+    from app.services import http_client
+
+    skip = {s.strip() for s in args.skip.split(",") if s.strip()}
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    upstream = FakeUpstream(source_profiles(args), seed=args.seed).start()
+    http_client.use_transport(LocalTransport(upstream.port, http_client.limits()))
+    results: Dict[str, Any] = {}
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                if "resolve" not in skip:
+                    results["resolve_doi_multi"] = await bench_resolve(args, upstream)
+                if "http" not in skip:
+                    results["http"] = await bench_http(args, client)
+                if "library" not in skip:
+                    results["list_refs"] = await bench_library(args, client, sizes)
+                if "format" not in skip:
+                    results["formatter"] = bench_format(args)
+                if "serialize" not in skip:
+                    results["list_serialization"] = bench_serialize(args)
+                if "auth" not in skip:
+                    results["auth_dependency"] = await bench_auth(args)
+        results["upstream_requests"] = upstream.requests()
+    finally:
+        upstream.stop()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    tmp = tempfile.TemporaryDirectory(prefix="citecheck-bench-")
+    # 必须在导入 app 之前设置：临时库、关掉上游限速（假上游不需要）
+    os.environ["CITECHECK_DATABASE_URL"] = f"sqlite:///{Path(tmp.name) / 'bench.db'}"
+    os.environ["CITECHECK_ASYNC_DATABASE_URL"] = ""
+    from .fake_upstream import HOSTS
+    os.environ["CITECHECK_HOST_RATES"] = ",".join(f"{h}=0" for h in HOSTS)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    started = time.time()
+    results = asyncio.run(run(args))
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "duration_s": round(time.time() - started, 2),
+            "git_commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    print(f"\nwritten to {args.out}")
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        print(f"\ncompared with {args.compare} (p50 ms / us per call):")
+        compare(old.get("results", {}), results)
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
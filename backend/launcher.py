@@ -1,20 +1,48 @@
-import threading
 import time
+
+T0 = time.perf_counter()
+
+import threading
 import webbrowser
 import traceback
+import urllib.request
 
-def open_browser():
-    time.sleep(1.5)
-    webbrowser.open("http://127.0.0.1:8000/login")
+HOST = "127.0.0.1"
+PORT = 8000
+
+def open_browser_when_ready(server, timeout: float = 60.0):
+    # uvicorn 跑完 lifespan、开始监听后 server.started 变成 True；再确认 /health 能答复就立刻打开浏览器
+    from app.services import startup
+
+    deadline = time.monotonic() + timeout
+    while not server.started:
+        if server.should_exit or time.monotonic() > deadline:
+            return
+        time.sleep(0.01)
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://{HOST}:{PORT}/health", timeout=1) as r:
+                if r.status == 200:
+                    break
+        except OSError:
+            time.sleep(0.02)
+    startup.record("total", startup.since_origin() or 0.0)
+    print(startup.report(), flush=True)
+    webbrowser.open(f"http://{HOST}:{PORT}/login")
 
 if __name__ == "__main__":
     try:
-        from app.main import app
-        import uvicorn
+        from app.services import startup
+
+        startup.set_origin(T0)
+        with startup.phase("import"):
+            from app.main import app
+            import uvicorn
 
-        threading.Thread(target=open_browser, daemon=True).start()
-        uvicorn.run(app, host="127.0.0.1", port=8000)
+        server = uvicorn.Server(uvicorn.Config(app, host=HOST, port=PORT))
+        threading.Thread(target=open_browser_when_ready, args=(server,), daemon=True).start()
+        server.run()
 
     except Exception:
         traceback.print_exc()
-        input("\n启动失败，按回车退出...")
\ No newline at end of file
+        input("\n启动失败，按回车退出...")
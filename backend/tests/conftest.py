@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# 必须在导入 app 之前设置：临时库，关掉后台补全和来源路由（测试里不访问上游）
+_tmp = tempfile.TemporaryDirectory(prefix="citecheck-test-")
+os.environ["CITECHECK_DATABASE_URL"] = f"sqlite:///{Path(_tmp.name) / 'test.db'}"
+os.environ["CITECHECK_ASYNC_DATABASE_URL"] = ""
+os.environ["CITECHECK_ENRICH"] = "0"
+os.environ["CITECHECK_ROUTING"] = "0"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def auth(client, request):
+    # 每个测试一个新用户，文献库互不影响
+    email = f"{request.node.name[:40]}-{id(request)}@test.local"
+    client.post("/auth/register", json={"email": email, "password": "secret123"})
+    token = client.post("/auth/login", json={"email": email, "password": "secret123"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
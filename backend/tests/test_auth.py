@@ -0,0 +1,78 @@
+from app import deps
+from app.auth import create_access_token, decode_payload
+
+
+def _register(client, email, password="secret123"):
+    client.post("/auth/register", json={"email": email, "password": password})
+    token = client.post("/auth/login", json={"email": email, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _uid(headers):
+    return decode_payload(headers["Authorization"].split()[1])["uid"]
+
+
+def test_old_token_rejected_after_password_change_with_warm_cache(client, request):
+    old = _register(client, f"{request.node.name}@test.local")
+    assert client.get("/references", headers=old).status_code == 200
+    assert _uid(old) in deps._principals
+
+    r = client.post("/auth/password", headers=old, json={"old_password": "secret123", "new_password": "secret456"})
+    assert r.status_code == 200
+    new = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    assert client.get("/references", headers=old).status_code == 401
+    # 新 token 把缓存重新焐热（新版本号）之后，旧 token 仍然无效
+    assert client.get("/references", headers=new).status_code == 200
+    assert _uid(new) in deps._principals
+    r = client.get("/references", headers=old)
+    assert (r.status_code, r.json()["detail"]) == (401, "Token revoked")
+    assert client.get("/references", headers=new).status_code == 200
+    # 旧密码不能再登录，也不能再改一次
+    assert client.post("/auth/login", json={"email": f"{request.node.name}@test.local", "password": "secret123"}).status_code == 400
+    r = client.post("/auth/password", headers=new, json={"old_password": "secret123", "new_password": "x"})
+    assert r.status_code == 400
+
+
+def test_legacy_email_token_rejected_once_token_version_set(client, request):
+    email = f"{request.node.name}@test.local"
+    current = _register(client, email)
+    legacy = {"Authorization": f"Bearer {create_access_token(subject=email)}"}
+    assert "uid" not in decode_payload(legacy["Authorization"].split()[1])
+    # 从没改过密码：旧格式 token 照常可用
+    assert client.get("/references", headers=legacy).status_code == 200
+
+    r = client.post("/auth/password", headers=current, json={"old_password": "secret123", "new_password": "secret456"})
+    assert r.status_code == 200
+    r = client.get("/references", headers=legacy)
+    assert (r.status_code, r.json()["detail"]) == (401, "Token revoked")
+
+
+def test_token_for_unknown_user_rejected(client):
+    ghost = {"Authorization": f"Bearer {create_access_token(subject='ghost@test.local', user_id=10**9)}"}
+    assert client.get("/references", headers=ghost).status_code == 401
+    legacy = {"Authorization": f"Bearer {create_access_token(subject='ghost@test.local')}"}
+    assert client.get("/references", headers=legacy).status_code == 401
+    assert client.get("/references", headers={"Authorization": "Bearer not-a-jwt"}).status_code == 401
+
+
+def test_principal_cache_expires_and_evicts(monkeypatch):
+    from app.models import User
+
+    now = [100.0]
+    monkeypatch.setattr(deps.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(deps, "_principals", deps.OrderedDict())
+    monkeypatch.setattr(deps.config, "AUTH_CACHE_TTL", 60)
+    monkeypatch.setattr(deps.config, "AUTH_CACHE_SIZE", 2)
+
+    users = [User(id=i, email=f"u{i}@test.local", password_hash="") for i in (1, 2, 3)]
+    deps._remember_principal(users[0])
+    deps._remember_principal(users[1])
+    assert deps._cached_principal(1) is users[0]
+    # 1 刚被用过，超出容量时淘汰最久没用的 2
+    deps._remember_principal(users[2])
+    assert list(deps._principals) == [1, 3]
+    now[0] += 60
+    assert deps._cached_principal(1) is None and 1 not in deps._principals
+    deps.invalidate_principal(3)
+    assert not deps._principals
@@ -0,0 +1,60 @@
+def _create(client, auth, title):
+    r = client.post("/references", headers=auth, json={"ref_type": "other", "title": title, "authors": "张三", "year": 2020})
+    assert r.status_code == 200
+    return r.json()["id"]
+
+
+def _titles(client, auth):
+    return sorted(r["title"] for r in client.get("/references", headers=auth).json())
+
+
+def _ops(existing):
+    return [
+        {"op": "create", "data": {"ref_type": "other", "title": "新建", "authors": "李四"}},
+        {"op": "create", "data": {"title": "字段写错", "authors": "李四", "yaer": 2020}},
+        {"op": "create", "data": {"title": "缺作者"}},
+        {"op": "patch", "id": existing, "data": {"title": "改过"}},
+        {"op": "patch", "id": existing, "data": {"colour": "red"}},
+        {"op": "delete", "id": 999999},
+    ]
+
+
+def _check_results(results, existing):
+    assert [(r["index"], r["op"], r["ok"]) for r in results] == [
+        (0, "create", True), (1, "create", False), (2, "create", False),
+        (3, "patch", True), (4, "patch", False), (5, "delete", False),
+    ]
+    assert results[1]["error"] == "Unknown fields: yaer"
+    assert results[4]["error"] == "Unknown fields: colour" and results[4]["id"] == existing
+    assert results[5]["error"] == "Not found" and results[5]["id"] == 999999
+    assert "error" in results[2]
+
+
+def test_atomic_rejects_whole_batch_with_per_item_results(client, auth):
+    existing = _create(client, auth, "原题名")
+    r = client.post("/references/batch", headers=auth, json={"ops": _ops(existing)})
+    assert r.status_code == 422
+    _check_results(r.json()["detail"]["results"], existing)
+    assert _titles(client, auth) == ["原题名"]
+
+
+def test_best_effort_applies_valid_items(client, auth):
+    existing = _create(client, auth, "原题名")
+    r = client.post("/references/batch", headers=auth, json={"ops": _ops(existing), "mode": "best_effort"})
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["ok"], body["applied"], body["failed"]) == (False, 2, 4)
+    _check_results(body["results"], existing)
+    assert isinstance(body["results"][0]["id"], int)
+    assert _titles(client, auth) == ["改过", "新建"]
+
+
+def test_batch_cannot_touch_other_users_rows(client, auth):
+    from uuid import uuid4
+
+    email = f"other-{uuid4().hex}@test.local"
+    client.post("/auth/register", json={"email": email, "password": "secret123"})
+    token = client.post("/auth/login", json={"email": email, "password": "secret123"}).json()["access_token"]
+    theirs = _create(client, {"Authorization": f"Bearer {token}"}, "别人的")
+    r = client.post("/references/batch", headers=auth, json={"ops": [{"op": "delete", "id": theirs}], "mode": "best_effort"})
+    assert r.json()["results"] == [{"index": 0, "op": "delete", "ok": False, "id": theirs, "error": "Not found"}]
@@ -0,0 +1,99 @@
+def _create(client, auth, title):
+    return client.post("/references", headers=auth, json={"ref_type": "other", "title": title, "authors": "张三"}).json()["id"]
+
+
+def test_full_then_delta_with_tombstones(client, auth):
+    a, b, c = (_create(client, auth, t) for t in ("甲", "乙", "丙"))
+    full = client.get("/references/changes", headers=auth).json()
+    assert full["full"] is True and full["deleted"] == []
+    assert sorted(i["id"] for i in full["items"]) == sorted([a, b, c])
+    cursor = full["cursor"]
+
+    client.patch(f"/references/{a}", headers=auth, json={"ref_type": "other", "title": "甲改", "authors": "张三"})
+    client.delete(f"/references/{b}", headers=auth)
+    d = _create(client, auth, "丁")
+    delta = client.get(f"/references/changes?since={cursor}", headers=auth).json()
+    assert delta["full"] is False and delta["cursor"] > cursor
+    assert {i["id"]: i["title"] for i in delta["items"]} == {a: "甲改", d: "丁"}
+    assert delta["deleted"] == [b]
+
+    # 批量删除同样留墓碑；之后再拉一次没有变化
+    r = client.post("/references/batch", headers=auth, json={"ops": [{"op": "delete", "id": c}]})
+    assert r.json()["ok"]
+    delta2 = client.get(f"/references/changes?since={delta['cursor']}", headers=auth).json()
+    assert delta2["items"] == [] and delta2["deleted"] == [c]
+    empty = client.get(f"/references/changes?since={delta2['cursor']}", headers=auth)
+    assert empty.json() == {"cursor": delta2["cursor"], "full": False, "items": [], "deleted": [], "next": None}
+    assert empty.headers["X-Library-Rev"] == str(delta2["cursor"])
+
+
+def test_changes_are_per_user(client, auth):
+    from uuid import uuid4
+
+    _create(client, auth, "自己的")
+    cursor = client.get("/references/changes", headers=auth).json()["cursor"]
+    assert cursor > 0
+    email = f"other-{uuid4().hex}@test.local"
+    client.post("/auth/register", json={"email": email, "password": "secret123"})
+    token = client.post("/auth/login", json={"email": email, "password": "secret123"}).json()["access_token"]
+    other = {"Authorization": f"Bearer {token}"}
+    ref = _create(client, other, "别人的")
+    client.delete(f"/references/{ref}", headers=other)
+    delta = client.get(f"/references/changes?since={cursor}", headers=auth).json()
+    assert delta["items"] == [] and delta["deleted"] == []
+
+
+def test_list_conditional_get(client, auth):
+    _create(client, auth, "甲")
+    r = client.get("/references", headers=auth)
+    etag = r.headers["etag"]
+    not_modified = client.get("/references", headers={**auth, "If-None-Match": etag})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    # 查询参数不同 ETag 也不同
+    assert client.get("/references?limit=1", headers={**auth, "If-None-Match": etag}).status_code == 200
+
+    _create(client, auth, "乙")
+    changed = client.get("/references", headers={**auth, "If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert len(changed.json()) == 2
+
+
+def test_reused_id_keeps_other_users_tombstone(client, auth):
+    from uuid import uuid4
+
+    email = f"other-{uuid4().hex}@test.local"
+    client.post("/auth/register", json={"email": email, "password": "secret123"})
+    token = client.post("/auth/login", json={"email": email, "password": "secret123"}).json()["access_token"]
+    other = {"Authorization": f"Bearer {token}"}
+
+    _create(client, auth, "先有一条")
+    cursor = client.get("/references/changes", headers=auth).json()["cursor"]
+    mine = _create(client, auth, "最新的一条")
+    client.delete(f"/references/{mine}", headers=auth)
+    # SQLite 没有 AUTOINCREMENT：删掉最大的 id 后，下一条新文献（别的用户的）拿到同一个 id
+    theirs = _create(client, other, "别人的")
+    assert theirs == mine
+    client.delete(f"/references/{theirs}", headers=other)
+
+    delta = client.get(f"/references/changes?since={cursor}", headers=auth).json()
+    assert delta["deleted"] == [mine]
+
+
+def test_paged_full_load_then_delta(client, auth):
+    ids = [_create(client, auth, f"第{i}条") for i in range(5)]
+    first = client.get("/references/changes?limit=2", headers=auth).json()
+    cursor, seen, page = first["cursor"], [i["id"] for i in first["items"]], first
+    # 翻页期间的写入：不在这次全量里也没关系，下次增量会带上
+    late = _create(client, auth, "翻页时新增")
+    client.delete(f"/references/{ids[0]}", headers=auth)
+    while page["next"]:
+        page = client.get(f"/references/changes?limit=2&after={page['next']}", headers=auth).json()
+        assert len(page["items"]) <= 2
+        seen += [i["id"] for i in page["items"]]
+    assert seen == sorted(set(seen), reverse=True)
+    assert set(ids[1:]) <= set(seen)
+
+    delta = client.get(f"/references/changes?since={cursor}", headers=auth).json()
+    assert [i["id"] for i in delta["items"]] == [late] and delta["deleted"] == [ids[0]]
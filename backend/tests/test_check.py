@@ -0,0 +1,43 @@
+import json
+
+
+def test_unresolved_doi_is_not_reported_as_not_found(client, auth):
+    text = "[1] 张三. 一篇库里没有的文章[J]. 计算机学报, 2020, 1(2): 3-4. DOI:10.1234/abc.5\n[2] 李四. 没有 DOI 的文章[M]. 北京: 出版社, 2019."
+    r = client.post("/check?resolve=false", headers=auth, data={"text": text})
+    assert r.status_code == 200
+    lines = [json.loads(x) for x in r.text.splitlines()]
+    statuses = {v["index"]: v["status"] for v in lines if "index" in v}
+    assert statuses == {0: "unresolved", 1: "unmatched"}
+    assert lines[-1]["unresolved"] == 1 and "not_found" not in lines[-1]
+
+
+def test_closing_check_stream_waits_for_cancelled_lookups(monkeypatch):
+    import asyncio
+    from app.services import enrichment
+    from app.services.manuscript import LibraryIndex, check_entries
+
+    finished = []
+
+    async def slow_lookup(doi):
+        try:
+            if doi.endswith(".1"):
+                return None, None
+            await asyncio.sleep(30)
+        finally:
+            # 模拟取消后还要收尾（关连接之类），需要再让出一次
+            await asyncio.sleep(0)
+            finished.append(doi)
+
+    monkeypatch.setattr(enrichment, "lookup_metadata", slow_lookup)
+    entries = [f"[{i}] 张三. 文章{i}[J]. 期刊, 2020. DOI:10.1234/x.{i}" for i in (1, 2, 3)]
+
+    async def run():
+        gen = check_entries(entries, LibraryIndex([]), concurrency=3)
+        first = await gen.__anext__()
+        await gen.aclose()
+        # aclose 返回时被取消的查询都已收尾，没有悬空任务
+        return first, sorted(finished)
+
+    first, done = asyncio.run(run())
+    assert first["status"] == "not_found"
+    assert done == ["10.1234/x.1", "10.1234/x.2", "10.1234/x.3"]
@@ -0,0 +1,19 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import create_engine
+
+from app.db import _engine_kwargs
+
+
+@pytest.mark.parametrize("url", ["sqlite://", "sqlite:///:memory:", "sqlite:///file:mem?mode=memory&uri=true"])
+def test_memory_sqlite_engine_without_pool_sizing(url):
+    eng = create_engine(url, **_engine_kwargs(url))
+    with eng.connect() as conn:
+        assert conn.execute(text("select 1")).scalar() == 1
+    create_async_engine(url.replace("sqlite", "sqlite+aiosqlite", 1), **_engine_kwargs(url))
+
+
+def test_file_sqlite_keeps_pool_sizing(tmp_path):
+    kwargs = _engine_kwargs(f"sqlite:///{tmp_path / 'x.db'}")
+    assert {"pool_size", "max_overflow", "pool_timeout"} <= kwargs.keys()
@@ -0,0 +1,66 @@
+import random
+from types import SimpleNamespace
+
+from app.services.dedupe import TITLE_THRESHOLD, _jaccard, find_duplicates, normalize_title, shingles
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def _ref(rid, title, authors="Smith J", year=2010, doi=None):
+    return SimpleNamespace(id=rid, title=title, authors=authors, year=year, doi=doi)
+
+
+def _typo_library(seed, n_noise=3000, n_pairs=300):
+    rnd = random.Random(seed)
+    words = ["".join(rnd.choice(LETTERS) for _ in range(rnd.randint(3, 10))) for _ in range(2000)]
+
+    def title():
+        return " ".join(rnd.choice(words) for _ in range(rnd.randint(5, 12)))
+
+    rows, pairs = [], []
+    for i in range(n_noise):
+        rows.append(_ref(len(rows) + 1, title(), authors=f"Noise{i}", year=1990 + i % 30))
+    for _ in range(n_pairs):
+        t = title()
+        i = rnd.randrange(len(t))
+        t2 = t[:i] + rnd.choice(LETTERS) + t[i + 1:]
+        a, b = _ref(len(rows) + 1, t), _ref(len(rows) + 2, t2)
+        rows += [a, b]
+        j = _jaccard(shingles(normalize_title(t)), shingles(normalize_title(t2)))
+        if t != t2 and j >= TITLE_THRESHOLD:
+            pairs.append((a.id, b.id))
+    return rows, pairs
+
+
+def test_single_typo_recall():
+    # 只差一个字母、3-gram Jaccard ≥ 0.75 的标题对：LSH 至少要找回 95%（8 个 band 理论值约 99%）
+    for seed in (1, 2):
+        rows, pairs = _typo_library(seed)
+        group_of = {}
+        for g in find_duplicates(rows):
+            for rid in g["ids"]:
+                group_of[rid] = g["ids"][0]
+        found = sum(1 for a, b in pairs if a in group_of and group_of.get(a) == group_of.get(b))
+        assert found / len(pairs) >= 0.95, (seed, found, len(pairs))
+
+
+def test_doi_groups_and_conflicting_dois():
+    rows = [
+        _ref(1, "Attention is all you need", doi="10.1/ABC"),
+        _ref(2, "Attention Is All You Need.", doi="https://doi.org/10.1/abc"),
+        _ref(3, "Attention is all you need", doi="10.1/other"),  # 同名但 DOI 不同：勘误之类，不合并
+        _ref(4, "Completely unrelated work on graphs"),
+    ]
+    groups = find_duplicates(rows)
+    assert groups == [{"reason": "doi", "doi": "10.1/abc", "ids": [1, 2]}]
+
+
+def test_fuzzy_requires_close_year_and_shared_author():
+    title = "Large scale citation matching with minhash signatures"
+    rows = [
+        _ref(1, title, authors="Zhang San", year=2020),
+        _ref(2, title + "!", authors="Zhang San; Li Si", year=2021),
+        _ref(3, title, authors="Zhang San", year=2015),  # 年份差太多
+        _ref(4, title, authors="Wang Wu", year=2020),  # 第一作者不同
+    ]
+    assert find_duplicates(rows) == [{"reason": "fuzzy", "doi": None, "ids": [1, 2]}]
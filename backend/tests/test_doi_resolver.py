@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import doi_resolver
+
+
+def _response(status, body=None):
+    return SimpleNamespace(
+        status_code=status, headers={"content-type": "application/json"}, json=lambda: body, text="",
+    )
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    out = []
+    monkeypatch.setattr(doi_resolver.source_stats, "record", lambda prefix, source, outcome, secs: out.append(outcome))
+    return out
+
+
+@pytest.mark.parametrize("status", [400, 403, 301])
+def test_unexpected_status_is_error_not_miss(monkeypatch, recorded, status):
+    async def fetch(source, url, headers=None, client=None):
+        return _response(status)
+
+    monkeypatch.setattr(doi_resolver, "fetch", fetch)
+    hit, answered = asyncio.run(doi_resolver._run_source("crossref", None, "10.1/x", 0))
+    assert (hit, answered, recorded) == (None, False, ["error"])
+
+
+def test_404_is_a_conclusive_miss(monkeypatch, recorded):
+    async def fetch(source, url, headers=None, client=None):
+        return _response(404, {"message": "not found"})
+
+    monkeypatch.setattr(doi_resolver, "fetch", fetch)
+    hit, answered = asyncio.run(doi_resolver._run_source("crossref", None, "10.1/x", 0))
+    assert (hit, answered, recorded) == (None, True, ["miss"])
+
+
+def test_coalescing_only_joins_identical_lookups(monkeypatch):
+    calls = []
+
+    async def lookup(doi, mode, deadline, use_cache):
+        calls.append((mode, deadline, use_cache))
+        await asyncio.sleep(0.05)
+        return {"ok": False, "doi": doi}
+
+    monkeypatch.setattr(doi_resolver, "_lookup", lookup)
+
+    async def run():
+        await asyncio.gather(
+            doi_resolver.resolve_doi_multi("10.1/Same", use_cache=False),
+            doi_resolver.resolve_doi_multi("10.1/same", mode=doi_resolver.config.RESOLVE_MODE, use_cache=False),
+            doi_resolver.resolve_doi_multi("10.1/same", mode="sequential", use_cache=False),
+            doi_resolver.resolve_doi_multi("10.1/same", deadline=30.0, use_cache=False),
+        )
+
+    asyncio.run(run())
+    # 前两个参数相同（mode 缺省即配置值）合并成一次，其余各查一次
+    assert len(calls) == 3
+
+
+def _fake_sources(monkeypatch, behaviour):
+    # behaviour: 来源名 → (耗时秒, 是否命中)
+    called = []
+
+    def make(name, secs, hit):
+        async def fetch(client, doi):
+            called.append(name)
+            await asyncio.sleep(secs)
+            return {"doi": doi, "title": "T", "source": name} if hit else None
+        return fetch
+
+    for name, (secs, hit) in behaviour.items():
+        monkeypatch.setitem(doi_resolver.SOURCES, name, make(name, secs, hit))
+    return called
+
+
+def test_stagger_skips_fallbacks_when_first_source_is_fast(monkeypatch, recorded):
+    called = _fake_sources(monkeypatch, {"crossref": (0.01, True), "datacite": (0.01, True)})
+    hit, _ = asyncio.run(doi_resolver._resolve_parallel(None, "10.1/x", ["crossref", "datacite"], 5, 0.25))
+    assert hit["source"] == "crossref" and called == ["crossref"]
+
+
+def test_next_source_starts_early_after_a_miss(monkeypatch, recorded):
+    called = _fake_sources(monkeypatch, {"crossref": (0.01, False), "datacite": (0.01, True)})
+
+    async def run():
+        t0 = asyncio.get_running_loop().time()
+        hit, _ = await doi_resolver._resolve_parallel(None, "10.1/x", ["crossref", "datacite"], 5, 2.0)
+        return hit, asyncio.get_running_loop().time() - t0
+
+    hit, elapsed = asyncio.run(run())
+    # 不用等满 2 秒的错峰间隔
+    assert hit["source"] == "datacite" and called == ["crossref", "datacite"] and elapsed < 1.0
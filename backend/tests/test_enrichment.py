@@ -0,0 +1,62 @@
+import asyncio
+
+from app.services import enrichment
+
+
+def test_dispatcher_survives_db_errors(monkeypatch):
+    calls = {"requeue": 0, "claim": 0}
+
+    def requeue():
+        calls["requeue"] += 1
+        if calls["requeue"] == 1:
+            raise RuntimeError("database is locked")
+
+    def claim(limit):
+        calls["claim"] += 1
+        if calls["claim"] == 1:
+            raise RuntimeError("connection reset")
+        if calls["claim"] == 2:
+            return [(7, 1, 1, "10.1/x", 1)], None
+        return [], None
+
+    monkeypatch.setattr(enrichment, "_requeue_running", requeue)
+    monkeypatch.setattr(enrichment, "_claim", claim)
+    monkeypatch.setattr(enrichment, "_backoff", lambda n: 0)
+
+    async def run():
+        w = enrichment.EnrichmentWorker()
+        w._wake, w._queue = asyncio.Event(), asyncio.Queue(maxsize=1)
+        task = asyncio.create_task(w._dispatch())
+        job = await asyncio.wait_for(w._queue.get(), timeout=5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return job, w.counters["errors"]
+
+    job, errors = asyncio.run(run())
+    assert job[0] == 7 and errors == 2 and calls["requeue"] == 2
+
+
+def test_worker_survives_failed_finish(monkeypatch):
+    async def boom(job):
+        raise ValueError("bad metadata")
+
+    def finish(*a, **kw):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(enrichment, "_finish", finish)
+
+    async def run():
+        w = enrichment.EnrichmentWorker()
+        w._queue = asyncio.Queue()
+        w._run = boom
+        task = asyncio.create_task(w._work())
+        for i in range(2):
+            w._queue.put_nowait((i, 1, 1, "10.1/x", 1))
+        await asyncio.wait_for(w._queue.join(), timeout=5)
+        alive = not task.done()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return alive, w.counters
+
+    alive, counters = asyncio.run(run())
+    assert alive and counters["failed"] == 2 and counters["errors"] == 2
@@ -0,0 +1,62 @@
+from sqlmodel import Session
+
+from app.db import engine
+from app.models import Reference
+from app.services import formatter
+
+
+def _stale_ref(title):
+    with Session(engine) as s:
+        r = Reference(user_id=1, ref_type="other", title=title, authors="张三", year=2020,
+                      gbt7714_cache="old", missing_cache="", format_version=0)
+        s.add(r)
+        s.commit()
+        return r.id
+
+
+def test_rerender_skips_rows_edited_concurrently(client, monkeypatch):
+    keep_id, edited_id = _stale_ref("未改动"), _stale_ref("旧题名")
+    real = formatter.format_gbt7714
+    edits = []
+
+    def render_then_edit(r):
+        # 模拟读完旧行之后、写回之前，有请求改了题名并按当前版本重新渲染
+        if r.id == edited_id and not edits:
+            edits.append(r.id)
+            with Session(engine) as s:
+                ref = s.get(Reference, edited_id)
+                ref.title = "新题名"
+                s.add(formatter.apply_render(ref))
+                s.commit()
+        return real(r)
+
+    monkeypatch.setattr(formatter, "format_gbt7714", render_then_edit)
+    formatter.rerender_stale()
+    with Session(engine) as s:
+        keep, edited = s.get(Reference, keep_id), s.get(Reference, edited_id)
+        assert keep.format_version == formatter.FORMATTER_VERSION and "未改动" in keep.gbt7714_cache
+        assert "新题名" in edited.gbt7714_cache
+
+
+def test_rerender_stops_when_flag_set(client):
+    import threading
+
+    _stale_ref("待渲染")
+    stop = threading.Event()
+    stop.set()
+    assert formatter.rerender_stale(stop=stop) == 0
+
+
+def test_rerender_reaches_delta_sync_clients(client, auth):
+    ref_id = client.post("/references", headers=auth, json={"ref_type": "other", "title": "标题", "authors": "张三"}).json()["id"]
+    with Session(engine) as s:
+        # 模拟升级前渲染的行：缓存是旧格式
+        ref = s.get(Reference, ref_id)
+        ref.gbt7714_cache, ref.format_version = "旧格式", 0
+        s.add(ref)
+        s.commit()
+    cursor = client.get("/references/changes", headers=auth).json()["cursor"]
+    formatter.rerender_stale()
+    delta = client.get(f"/references/changes?since={cursor}", headers=auth).json()
+    assert [i["id"] for i in delta["items"]] == [ref_id]
+    assert delta["items"][0]["gbt7714"] != "旧格式" and delta["cursor"] > cursor
@@ -0,0 +1,55 @@
+RIS = "TY  - JOUR\nAU  - 张三\nTI  - 中文文献导入测试\nT2  - 计算机学报\nPY  - 2020\nER  - \n"
+
+
+def _import(client, auth, data, name="refs.ris"):
+    r = client.post("/references/import", headers=auth, files={"file": (name, data, "application/octet-stream")})
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_utf8_and_gbk_files_import_the_same_text(client, auth):
+    for data, encoding in ((RIS.encode("utf-8-sig"), "utf-8-sig"), (RIS.encode("gbk"), "gb18030")):
+        body = _import(client, auth, data)
+        assert body["encoding"] == encoding
+        assert body["imported"] == 1 and body["entries"][0]["title"] == "中文文献导入测试"
+
+
+def test_undecodable_entry_is_reported_not_stored(client, auth):
+    # \x80 单独出现在 GB18030 里也不合法：这一条失败，其余照常导入
+    bad = RIS.encode("gbk").replace("中文".encode("gbk"), b"\x80\x80", 1)
+    body = _import(client, auth, bad + RIS.encode("gbk"))
+    assert body["encoding"] == "gb18030"
+    assert [e["ok"] for e in body["entries"]] == [False, True]
+    assert "Undecodable" in body["entries"][0]["error"]
+    titles = [r["title"] for r in client.get("/references", headers=auth).json()]
+    assert all("�" not in t for t in titles)
+
+
+def _titles(body):
+    return [e.get("title") or e.get("error") for e in body["entries"]]
+
+
+def test_bibtex_escaped_braces_do_not_end_or_swallow_entries(client, auth):
+    bib = (
+        "@article{a1,\n  title = {Sets {\\{}x{\\}} and an \\{ unbalanced one},\n  author = {Zhang, San},\n  year = 2020\n}\n"
+        "@article{a2,\n  title = {Second entry},\n  author = {Li, Si},\n  year = 2021\n}\n"
+    )
+    body = _import(client, auth, bib.encode(), name="refs.bib")
+    assert body["imported"] == 2
+    assert _titles(body) == ["Sets {x} and an { unbalanced one", "Second entry"]
+
+
+def test_bibtex_paren_delimited_entry_closes(client, auth):
+    bib = (
+        # 全是引号值：没有大括号也要在 ) 处结束，不能并进下一条
+        '@book(b1,\n  title = "A (parenthesised) title",\n  author = "Li Si",\n  publisher = "P", year = 2019\n)\n'
+        # 有大括号的值：不能在第一个配平的 } 处提前结束，丢掉后面的字段
+        "@book(b2,\n  title = {Braced paren book},\n  author = {Zhao Liu},\n  publisher = {Q}, year = {2018}\n)\n"
+        "@article{a3, title = {After the paren entries}, author = {Wang Wu}, year = 2022}\n"
+    )
+    body = _import(client, auth, bib.encode(), name="refs.bib")
+    assert body["imported"] == 3
+    assert _titles(body) == ["A (parenthesised) title", "Braced paren book", "After the paren entries"]
+    rows = {r["title"]: r for r in client.get("/references", headers=auth).json()}
+    assert (rows["A (parenthesised) title"]["publisher"], rows["A (parenthesised) title"]["year"]) == ("P", 2019)
+    assert (rows["Braced paren book"]["publisher"], rows["Braced paren book"]["year"]) == ("Q", 2018)
@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import rate_limit
+
+
+class Clock:
+    # 假时钟：sleep 只推进时间并记下等了多久
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, secs):
+        self.slept.append(round(secs, 6))
+        self.now += secs
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=c.monotonic))
+    monkeypatch.setattr(rate_limit, "asyncio", SimpleNamespace(Lock=asyncio.Lock, sleep=c.sleep))
+    return c
+
+
+def test_burst_then_waits_one_interval_per_token(clock):
+    bucket = rate_limit.TokenBucket(rate=4, burst=2)
+
+    async def run():
+        for _ in range(5):
+            await bucket.acquire()
+
+    asyncio.run(run())
+    # 前两个用满突发额度不等，之后每个令牌等 1/rate 秒
+    assert clock.slept == [0.25, 0.25, 0.25]
+    assert clock.now == pytest.approx(0.75)
+
+
+def test_idle_time_refills_up_to_capacity(clock):
+    bucket = rate_limit.TokenBucket(rate=2)
+    assert bucket.capacity == 2
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    asyncio.run(take(2))
+    assert clock.slept == [] and bucket.tokens == 0
+    clock.now += 0.25
+    asyncio.run(take(1))
+    # 已攒了半个令牌，只需再等 0.25 秒
+    assert clock.slept == [0.25]
+    clock.now += 100
+    asyncio.run(take(2))
+    # 空闲再久也只攒到 capacity 个
+    assert clock.slept == [0.25]
+    assert bucket.tokens == 0
+
+
+def test_slow_rate_has_burst_of_one(clock):
+    bucket = rate_limit.TokenBucket(rate=0.5)
+
+    async def run():
+        await bucket.acquire()
+        await bucket.acquire()
+
+    asyncio.run(run())
+    assert bucket.capacity == 1.0
+    assert clock.slept == [2.0]
+
+
+def test_bucket_for_unlimited_host(monkeypatch):
+    monkeypatch.setattr(rate_limit.config, "HOST_RATE_LIMITS", {"limited.test": 3})
+    monkeypatch.setattr(rate_limit, "_buckets", {})
+    assert rate_limit.bucket_for("http://open.test/x") is None
+    b = rate_limit.bucket_for("https://limited.test/a")
+    assert b.rate == 3 and rate_limit.bucket_for("https://limited.test/b") is b
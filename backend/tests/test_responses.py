@@ -0,0 +1,159 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from app.services import responses
+from app.services.responses import CompressionMiddleware, JSONBody
+
+BIG = {"items": [{"id": i, "title": f"文献标题 {i}"} for i in range(200)]}
+
+
+async def _big(request):
+    return JSONBody(BIG, headers={"ETag": '"v1"'})
+
+
+async def _small(request):
+    return JSONBody({"ok": True})
+
+
+async def _not_modified(request):
+    return Response(status_code=304, headers={"ETag": '"v1"'})
+
+
+async def _encoded(request):
+    return Response(gzip.compress(json.dumps(BIG).encode()), media_type="application/json", headers={"Content-Encoding": "gzip"})
+
+
+async def _binary(request):
+    return Response(b"\0" * 4096, media_type="image/png")
+
+
+async def _stream(request):
+    async def lines():
+        for i in range(3):
+            yield json.dumps({"index": i}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+_app = CompressionMiddleware(Starlette(routes=[
+    Route("/big", _big), Route("/small", _small), Route("/304", _not_modified),
+    Route("/encoded", _encoded), Route("/binary", _binary), Route("/stream", _stream),
+]))
+
+
+def _call(path, accept_encoding="gzip"):
+    # 直接跑 ASGI，拿到中间件发出的原始消息（TestClient 会自动解压，看不到压缩后的分块）
+    messages = []
+    requested = []
+
+    async def receive():
+        if requested:
+            # 流式响应会一直等断开消息，这里不断开
+            await asyncio.Event().wait()
+        requested.append(True)
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"accept-encoding", accept_encoding.encode())] if accept_encoding is not None else [],
+        "client": ("test", 1), "server": ("test", 80),
+    }
+    asyncio.run(_app(scope, receive, send))
+    start = messages[0]
+    headers = {k.decode().lower(): v.decode() for k, v in start["headers"]}
+    chunks = [m["body"] for m in messages[1:] if m.get("body")]
+    return start["status"], headers, chunks
+
+
+def test_gzip_large_json_with_weak_etag():
+    status, headers, chunks = _call("/big", "br;q=0, gzip")
+    body = b"".join(chunks)
+    assert status == 200 and headers["content-encoding"] == "gzip"
+    assert headers["content-length"] == str(len(body))
+    assert headers["vary"] == "Accept-Encoding"
+    # 压缩后字节不同，强 ETag 降成弱的
+    assert headers["etag"] == 'W/"v1"'
+    assert json.loads(gzip.decompress(body)) == BIG
+
+
+@pytest.mark.parametrize("accept", [None, "", "identity", "gzip;q=0", "br"])
+def test_no_acceptable_encoding_sends_identity(accept, monkeypatch):
+    monkeypatch.setattr(responses, "_brotli_mod", None)
+    status, headers, chunks = _call("/big", accept)
+    assert "content-encoding" not in headers and headers["etag"] == '"v1"'
+    assert json.loads(b"".join(chunks)) == BIG
+
+
+def test_br_preferred_only_when_brotli_installed(monkeypatch):
+    monkeypatch.setattr(responses, "_brotli_mod", None)
+    assert responses.negotiate("br, gzip") == "gzip"
+    monkeypatch.setattr(responses, "_brotli_mod", object())
+    assert responses.negotiate("gzip, br") == "br"
+    assert responses.negotiate("gzip, br;q=0") == "gzip"
+
+
+def test_br_round_trip():
+    brotli = pytest.importorskip("brotli")
+    status, headers, chunks = _call("/big", "gzip, br")
+    assert headers["content-encoding"] == "br"
+    assert json.loads(brotli.decompress(b"".join(chunks))) == BIG
+
+
+@pytest.mark.parametrize("path", ["/small", "/304", "/binary"])
+def test_small_304_and_binary_pass_through(path):
+    status, headers, chunks = _call(path)
+    assert "content-encoding" not in headers
+    if path == "/304":
+        assert status == 304 and headers["etag"] == '"v1"' and not chunks
+
+
+def test_already_encoded_response_is_not_compressed_again():
+    status, headers, chunks = _call("/encoded")
+    assert headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(b"".join(chunks))) == BIG
+
+
+def test_ndjson_stream_is_flushed_per_chunk():
+    status, headers, chunks = _call("/stream")
+    assert headers["content-encoding"] == "gzip" and "content-length" not in headers
+    # 每块单独就能解出完整的一行：边算边发，没有被压缩器攒住
+    d = zlib.decompressobj(31)
+    lines = [d.decompress(c) for c in chunks]
+    assert lines[:3] == [json.dumps({"index": i}).encode() + b"\n" for i in range(3)]
+    assert b"".join(lines) + d.flush() == b"".join(json.dumps({"index": i}).encode() + b"\n" for i in range(3))
+    assert d.eof
+
+
+def test_reference_list_compressed_and_revalidated(client, auth):
+    for i in range(20):
+        client.post("/references", headers=auth, json={"ref_type": "journal", "title": f"压缩测试文献 {i}", "authors": "张三;李四", "year": 2020})
+    r = client.get("/references", headers={**auth, "Accept-Encoding": "gzip"})
+    assert r.status_code == 200 and r.headers["content-encoding"] == "gzip"
+    assert len(r.json()) == 20
+    etag = r.headers["etag"]
+    assert etag.startswith('W/"')
+    # 客户端回传弱 ETag 也能命中 304，304 不压缩
+    r = client.get("/references", headers={**auth, "Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert r.status_code == 304 and "content-encoding" not in r.headers
+    # 列表 ETag 本来就是弱的，压缩与否都一样，不会变成 W/W/
+    r = client.get("/references", headers={**auth, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers and r.headers["etag"] == etag
+
+
+def test_check_stream_is_compressed(client, auth):
+    text = "\n".join(f"[{i}] 张三. 文章{i}[J]. 期刊, 2020. DOI:10.1234/c.{i}" for i in range(5))
+    r = client.post("/check?resolve=false", headers={**auth, "Accept-Encoding": "gzip"}, data={"text": text})
+    assert r.status_code == 200 and r.headers["content-encoding"] == "gzip"
+    lines = [json.loads(x) for x in r.text.splitlines()]
+    assert [v["status"] for v in lines if "index" in v] == ["unresolved"] * 5
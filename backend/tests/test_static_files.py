@@ -0,0 +1,86 @@
+import gzip
+
+import pytest
+
+from app import main
+from app.services.static_files import StaticManifest
+
+JS = "console.log('plain');\n" * 100
+JS_GZ = "console.log('from .gz sibling');\n" * 100
+
+
+@pytest.fixture
+def dist(tmp_path, monkeypatch, client):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_text("<!doctype html><div id=root></div>")
+    (tmp_path / "favicon.svg").write_text("<svg/>")
+    js = tmp_path / "assets" / "index-Bx3kD9aQ.js"
+    js.write_text(JS)
+    # 内容故意和原文件不同，能看出发的是哪个版本
+    (tmp_path / "assets" / "index-Bx3kD9aQ.js.gz").write_bytes(gzip.compress(JS_GZ.encode()))
+    (tmp_path / "assets" / "index-Bx3kD9aQ.js.br").write_bytes(b"fake-br-bytes")
+    manifest = StaticManifest(tmp_path).load()
+    monkeypatch.setattr(main, "static", manifest)
+    return manifest
+
+
+def test_manifest_only_lists_real_files(dist):
+    assert sorted(dist.files) == ["assets/index-Bx3kD9aQ.js", "favicon.svg", "index.html"]
+    assert sorted(dist.files["assets/index-Bx3kD9aQ.js"].variants) == ["br", "gzip"]
+    assert dist.lookup("/index.html") is dist.index
+    assert dist.lookup("../index.html") is None
+
+
+def test_cache_control_hashed_vs_unhashed(client, dist):
+    r = client.get("/assets/index-Bx3kD9aQ.js", headers={"Accept-Encoding": "identity"})
+    assert r.status_code == 200 and r.text == JS
+    assert r.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert "Accept-Encoding" in r.headers["vary"]
+    for path in ("/", "/favicon.svg"):
+        r = client.get(path)
+        assert r.status_code == 200 and r.headers["cache-control"] == "no-cache"
+
+
+def test_if_none_match_returns_304(client, dist):
+    r = client.get("/", headers={"Accept-Encoding": "identity"})
+    etag = r.headers["etag"]
+    assert etag.startswith('"')
+    for inm in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        r = client.get("/", headers={"Accept-Encoding": "identity", "If-None-Match": inm})
+        assert r.status_code == 304 and r.headers["etag"] == etag and r.content == b""
+        assert "content-encoding" not in r.headers
+    assert client.get("/", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_precompressed_siblings_served_by_accept_encoding(client, dist):
+    plain = client.get("/assets/index-Bx3kD9aQ.js", headers={"Accept-Encoding": "identity"}).headers["etag"]
+
+    r = client.get("/assets/index-Bx3kD9aQ.js", headers={"Accept-Encoding": "gzip"})
+    # 发的是 .gz 文件本身，压缩中间件不会再压一遍（TestClient 自动解压，解出来是 .gz 的内容）
+    assert r.headers["content-encoding"] == "gzip" and r.text == JS_GZ
+    assert r.headers["etag"] == plain[:-1] + '-gz"'
+    assert r.headers["content-type"].startswith("text/javascript")
+
+    r = client.get("/assets/index-Bx3kD9aQ.js", headers={"Accept-Encoding": "gzip, br"})
+    assert r.headers["content-encoding"] == "br" and r.headers["etag"] == plain[:-1] + '-br"'
+    assert int(r.headers["content-length"]) == len(b"fake-br-bytes")
+
+    r = client.get("/assets/index-Bx3kD9aQ.js", headers={"Accept-Encoding": "gzip, br;q=0"})
+    assert r.headers["content-encoding"] == "gzip"
+    # 各编码的 ETag 互不命中
+    r = client.get("/assets/index-Bx3kD9aQ.js", headers={"Accept-Encoding": "gzip", "If-None-Match": plain})
+    assert r.status_code == 200
+
+
+def test_spa_routes_and_missing_assets(client, dist):
+    r = client.get("/login")
+    assert r.status_code == 200 and "id=root" in r.text
+    assert client.get("/assets/missing-Zz9Yy8Xx.js").status_code == 404
+    r = client.get("/..%2f..%2fetc/passwd")
+    assert r.status_code == 200 and "id=root" in r.text
+
+
+def test_frontend_not_built(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "static", StaticManifest(tmp_path / "nope").load())
+    assert client.get("/").status_code == 404
+    assert client.get("/login").status_code == 404
@@ -0,0 +1,134 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.services import upstream
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(upstream, "time", SimpleNamespace(monotonic=c.monotonic, perf_counter=c.perf_counter))
+    monkeypatch.setattr(upstream.config, "BREAKER_FAILURES", 3)
+    monkeypatch.setattr(upstream.config, "BREAKER_RESET", 10.0)
+    monkeypatch.setattr(upstream.config, "BREAKER_MAX_OPEN", 300.0)
+    monkeypatch.setattr(upstream.config, "BREAKER_SLOW_CALL", 0.0)
+    return c
+
+
+@pytest.fixture
+def source(request):
+    # 每个测试一个独立的来源名，熔断器不串
+    name = f"test-{request.node.name}"
+    yield name
+    upstream._breakers.pop(name, None)
+
+
+def _run(source, replies):
+    # replies：依次返回的 (status, headers)；返回每次 fetch 的结果（状态码或异常原因）和实际打到上游的次数
+    seen = []
+
+    def handler(request):
+        status, headers = replies[len(seen)]
+        seen.append(request.url.path)
+        return httpx.Response(status, headers=headers, json={})
+
+    async def go(n):
+        out = []
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            for _ in range(n):
+                try:
+                    out.append((await upstream.fetch(source, "http://upstream.test/x", client=client)).status_code)
+                except upstream.UpstreamUnavailable as e:
+                    out.append(e.reason)
+        return out
+
+    return go, seen
+
+
+def test_5xx_opens_after_consecutive_failures(clock, source):
+    go, seen = _run(source, [(503, {}), (500, {}), (502, {})])
+    assert asyncio.run(go(4)) == ["HTTP 503", "HTTP 500", "HTTP 502", "circuit open"]
+    # 第 4 次被熔断直接拒绝，没打到上游
+    assert len(seen) == 3
+    b = upstream.breaker_for(source)
+    assert b.snapshot() == {"state": "open", "opened": 1, "rejected": 1, "retry_in": 10.0}
+
+
+def test_429_opens_immediately_for_retry_after(clock, source):
+    go, seen = _run(source, [(429, {"Retry-After": "42"}), (200, {})])
+    assert asyncio.run(go(2)) == ["HTTP 429", "circuit open"]
+    b = upstream.breaker_for(source)
+    assert b.open_until == clock.now + 42
+    clock.now += 41.9
+    assert b.current_state == "open"
+    clock.now += 0.1
+    assert b.current_state == "half_open"
+    assert asyncio.run(go(1)) == [200]
+    assert b.state == "closed" and len(seen) == 2
+
+
+def test_429_without_retry_after_uses_reset(clock, source):
+    go, _ = _run(source, [(429, {})])
+    assert asyncio.run(go(1)) == ["HTTP 429"]
+    assert upstream.breaker_for(source).open_until == clock.now + 10.0
+
+
+def test_half_open_probe_success_closes(clock, source):
+    go, _ = _run(source, [(500, {})] * 3 + [(200, {}), (404, {})])
+    asyncio.run(go(3))
+    clock.now += 10
+    b = upstream.breaker_for(source)
+    # 探测期间只放一个请求
+    assert b.allow() is True and b.allow() is False
+    b.release()
+    assert asyncio.run(go(2)) == [200, 404]
+    assert (b.state, b.trips, b.failures) == ("closed", 0, 0)
+
+
+def test_half_open_probe_failure_reopens_with_backoff(clock, source):
+    go, seen = _run(source, [(500, {})] * 3 + [(503, {}), (500, {})])
+    asyncio.run(go(3))
+    b = upstream.breaker_for(source)
+    clock.now += 10
+    # 探测失败一次就重新打开，打开时长翻倍
+    assert asyncio.run(go(2)) == ["HTTP 503", "circuit open"]
+    assert b.state == "open" and b.open_until == clock.now + 20
+    clock.now += 20
+    assert asyncio.run(go(1)) == ["HTTP 500"]
+    assert b.open_until == clock.now + 40
+    assert len(seen) == 5
+    assert b.counters["opened"] == 3
+
+
+def test_transport_error_counts_as_failure(clock, source):
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with pytest.raises(httpx.ConnectError):
+                await upstream.fetch(source, "http://upstream.test/x", client=client)
+
+    asyncio.run(go())
+    assert upstream.breaker_for(source).failures == 1
+
+
+def test_parse_retry_after():
+    assert upstream.parse_retry_after("120") == 120.0
+    assert upstream.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert upstream.parse_retry_after("soon") is None
+    assert upstream.parse_retry_after(None) is None
@@ -1,8 +1,11 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { api } from "../api";
 import toast from "react-hot-toast";
 type Ref = any;
 
+// /references/changes 每页条数：大文献库首屏不用等整个库序列化完
+const PAGE_SIZE = 500;
+
 export default function Dashboard() {
   const [refs, setRefs] = useState<Ref[]>([]);
   const [title, setTitle] = useState("");
@@ -76,9 +79,35 @@ export default function Dashboard() {
 
 
 
+  // 增量同步：只拉上次 cursor 之后变化的条目，先删 deleted，再按 id 覆盖 items。
+  // 首次全量分页拉取：第一页先显示，后面的页追加；cursor 用第一页的，翻页期间的改动下次增量会带上
+  const cursor = useRef(0);
   async function reload() {
-    const r = await api("/references");
-    setRefs(r);
+    const r = await api(`/references/changes?since=${cursor.current}&limit=${PAGE_SIZE}`);
+    if (r.full) {
+      setRefs(r.items);
+      let next = r.next;
+      while (next) {
+        const page = await api(`/references/changes?since=0&limit=${PAGE_SIZE}&after=${next}`);
+        setRefs((prev) => [...prev, ...page.items]);
+        next = page.next;
+      }
+      cursor.current = r.cursor;
+      return;
+    }
+    let items = r.items;
+    let next = r.next;
+    while (next) {
+      const page = await api(`/references/changes?since=${cursor.current}&limit=${PAGE_SIZE}&after=${next}`);
+      items = items.concat(page.items);
+      next = page.next;
+    }
+    cursor.current = r.cursor;
+    if (!items.length && !r.deleted.length) return;
+    setRefs((prev) => {
+      const gone = new Set<number>([...r.deleted, ...items.map((x: Ref) => x.id)]);
+      return [...items, ...prev.filter((x) => !gone.has(x.id))].sort((a, b) => b.id - a.id);
+    });
   }
 
   useEffect(() => {